@@ -7,6 +7,13 @@ License: BSD, see LICENSE for details
 Source and development at https://github.com/piwik/piwik-python-api
 """
 
+import copy
+import sys
+import threading
+try:
+    import json
+except ImportError:
+    import simplejson as json
 try:
     from urllib.request import Request, urlopen
     from urllib.parse import urlencode
@@ -14,7 +21,29 @@ except ImportError:
     from urllib2 import Request, urlopen
     from urllib import urlencode
 
+from .cache import get_request_key
+from .columns import to_array
+from .columns import to_columns
+from .exceptions import APIError
 from .exceptions import ConfigurationError
+from .streaming import JSONStream
+
+
+def decode_json(body):
+    """
+    Decode a JSON response body
+
+    :param body: Response body
+    :type body: str or bytes
+    :raises: APIError if Piwik returned an error
+    :rtype: list or dict
+    """
+    if sys.version_info[0] >= 3 and type(body) == bytes:
+        body = body.decode('utf-8')
+    data = json.loads(body)
+    if isinstance(data, dict) and data.get('result') == 'error':
+        raise APIError(data.get('message'))
+    return data
 
 
 class PiwikAnalytics(object):
@@ -30,6 +59,9 @@ class PiwikAnalytics(object):
         self.p = {}
         self.set_parameter('module', 'API')
         self.api_url = None
+        self.cache = None
+        self.rollup = None
+        self.single_flight = None
 
     def set_parameter(self, key, value):
         """
@@ -122,6 +154,41 @@ class PiwikAnalytics(object):
         """
         self.api_url = api_url
 
+    def set_cache(self, cache):
+        """
+        Cache the responses of send_request()
+
+        :param cache: Response cache, or None to disable caching
+        :type cache: piwikapi.cache.ResponseCache or None
+        :rtype: None
+        """
+        self.cache = cache
+
+    def set_rollup(self, rollup):
+        """
+        Build week, month and year reports from cached day reports when
+        possible
+
+        :param rollup: Rollup engine, or None to always ask Piwik
+        :type rollup: piwikapi.rollup.RollupEngine or None
+        :rtype: None
+        """
+        self.rollup = rollup
+
+    def set_single_flight(self, single_flight):
+        """
+        Make concurrent identical requests only once, the other threads wait
+        for the response
+
+        With a cache that keeps stale responses, these are returned while
+        one background request refreshes them.
+
+        :param single_flight: Shared SingleFlight, or None
+        :type single_flight: piwikapi.singleflight.SingleFlight or None
+        :rtype: None
+        """
+        self.single_flight = single_flight
+
     def set_segment(self, segment):
         """
         :param segment: Which segment to request, see
@@ -131,6 +198,17 @@ class PiwikAnalytics(object):
         """
         self.set_parameter('segment', segment)
 
+    def get_query(self, exclude=()):
+        """
+        Return the encoded parameters
+
+        :param exclude: Parameters to leave out
+        :type exclude: iterable of str
+        :rtype: str
+        """
+        return urlencode(dict((key, value) for key, value in self.p.items()
+                              if key not in exclude))
+
     def get_query_string(self):
         """
         Return the query string
@@ -143,7 +221,7 @@ class PiwikAnalytics(object):
         if len(self.p):
             qs = self.api_url
             qs += '?'
-            qs += urlencode(self.p)
+            qs += self.get_query()
         else:
             pass
         return qs
@@ -152,9 +230,355 @@ class PiwikAnalytics(object):
         """
         Make the analytics API request, returns the request body
 
+        If a cache was set a cached response is returned if possible. If a
+        rollup engine was set, reports of longer periods may be built from
+        cached day reports. If a single flight was set, concurrent identical
+        requests are made once.
+
+        :rtype: str
+        """
+        if self.cache is not None:
+            if self.single_flight is None:
+                body = self.cache.get(self.api_url, self.p)
+                if body is not None:
+                    return body
+            else:
+                body, fresh = self.cache.get_entry(self.api_url, self.p)
+                if fresh:
+                    return body
+                if body is not None:
+                    self._revalidate()
+                    return body
+        if self.rollup is not None:
+            body = self.rollup.get(self.api_url, self.p)
+            if body is not None:
+                return body
+        if self.single_flight is not None:
+            return self.single_flight.do(
+                get_request_key(self.api_url, self.p), self._fetch)
+        return self._fetch()
+
+    def _fetch(self):
+        """
+        Request the response from Piwik and cache it
+
         :rtype: str
         """
         request = Request(self.get_query_string())
         response = urlopen(request)
         body = response.read()
+        if self.cache is not None:
+            self.cache.set(self.api_url, self.p, body)
         return body
+
+    def _revalidate(self):
+        """
+        Refresh a stale cached response in the background, once per request
+
+        :rtype: None
+        """
+        call = copy.copy(self)
+        call.p = dict(self.p)
+        self.single_flight.start(get_request_key(self.api_url, self.p),
+                                 call._fetch)
+
+    def get_page(self, offset, limit):
+        """
+        Request one page of a report in JSON format and return its rows
+
+        The parameters of this object are not changed.
+
+        :param offset: Index of the first row
+        :type offset: int
+        :param limit: Maximum number of rows
+        :type limit: int
+        :raises: APIError if Piwik returned an error
+        :rtype: list
+        """
+        page = copy.copy(self)
+        page.p = dict(self.p, format='json', filter_offset=offset,
+                      filter_limit=limit)
+        rows = decode_json(page.send_request())
+        if not isinstance(rows, list):
+            raise ValueError("The response is not a list of rows")
+        return rows
+
+    def get_columns(self, columns=None):
+        """
+        Request a report in JSON format and return its rows as columns, see
+        piwikapi.columns.to_columns()
+
+        :param columns: Columns to return, defaults to all
+        :type columns: list of str or None
+        :raises: APIError if Piwik returned an error
+        :rtype: dict
+        """
+        return to_columns(self._get_rows(), columns)
+
+    def get_array(self, columns):
+        """
+        Request a report in JSON format and return numeric columns as a two
+        dimensional array, see piwikapi.columns.to_array()
+
+        :param columns: Numeric columns
+        :type columns: list of str
+        :raises: APIError if Piwik returned an error
+        :rtype: numpy.ndarray or array.array
+        """
+        return to_array(self._get_rows(), columns)
+
+    def _get_rows(self):
+        """
+        Request the report in JSON format and return its rows
+
+        :rtype: list
+        """
+        call = copy.copy(self)
+        call.p = dict(self.p, format='json')
+        rows = decode_json(call.send_request())
+        if not isinstance(rows, list):
+            raise ValueError("The response is not a list of rows")
+        return rows
+
+    def iter_pages(self, page_size=100, prefetch=False):
+        """
+        Walk a report page by page, yield the rows of every page
+
+        The report ends with the first page that has less than page_size
+        rows. With prefetch the next page is requested in a background
+        thread while the current one is processed.
+
+        :param page_size: Rows per request
+        :type page_size: int
+        :param prefetch: Request the next page in the background
+        :type prefetch: bool
+        :raises: APIError if Piwik returned an error
+        :rtype: generator
+        """
+        offset = 0
+        if not prefetch:
+            while True:
+                rows = self.get_page(offset, page_size)
+                yield rows
+                if len(rows) < page_size:
+                    return
+                offset += page_size
+        fetch = self._fetch_page(offset, page_size)
+        while True:
+            rows = fetch()
+            if len(rows) < page_size:
+                yield rows
+                return
+            offset += page_size
+            fetch = self._fetch_page(offset, page_size)
+            yield rows
+
+    def _fetch_page(self, offset, limit):
+        """
+        Start requesting a page in a thread, return a function that waits for
+        the rows
+
+        :rtype: callable
+        """
+        result = {}
+
+        def run():
+            try:
+                result['rows'] = self.get_page(offset, limit)
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+        def wait():
+            thread.join()
+            if 'error' in result:
+                raise result['error']
+            return result['rows']
+        return wait
+
+    def iter_rows(self, chunk_size=65536):
+        """
+        Make the analytics API request in JSON format, yield the rows of the
+        response as they are received
+
+        The memory use doesn't grow with the size of the report, which is
+        useful for Live.getLastVisitsDetails or reports with a filter_limit
+        of -1. Reports that return an object, e.g. for several dates, yield
+        (key, value) tuples. The cache is not used.
+
+        :param chunk_size: Bytes read from the socket at once
+        :type chunk_size: int
+        :raises: ConfigurationError if the API URL was not set
+        :raises: APIError if Piwik returned an error
+        :rtype: generator
+        """
+        if self.api_url is None:
+            raise ConfigurationError("API URL not set")
+        url = '%s?%s&format=json' % (self.api_url,
+                                     self.get_query(exclude=('format', )))
+        response = urlopen(Request(url))
+        try:
+            stream = JSONStream(response, chunk_size)
+            error = False
+            for item in stream:
+                if error:
+                    raise APIError(item[1])
+                if stream.is_object and item == ('result', 'error'):
+                    error = True
+                    continue
+                yield item
+            if error:
+                raise APIError("Unknown error")
+        finally:
+            response.close()
+
+
+class PiwikBulkAnalytics(object):
+    """
+    Runs many analytics API calls in few requests using API.getBulkRequest
+
+    The calls are sent in chunks of at most max_urls calls and max_size
+    bytes, the results are returned in the order the calls were added::
+
+        bulk = PiwikBulkAnalytics('http://yoursite.example.com/piwik/',
+                                  token_auth='YOUR_AUTH_TOKEN')
+        for id_site in (1, 2, 3):
+            pa = PiwikAnalytics()
+            pa.set_method('VisitsSummary.get')
+            pa.set_id_site(id_site)
+            pa.set_period('day')
+            pa.set_date('yesterday')
+            bulk.add(pa)
+        results = bulk.send_request()
+    """
+    #: Parameters that only apply to the bulk request itself
+    BULK_PARAMETERS = ('format', 'token_auth')
+
+    def __init__(self, api_url=None, token_auth=None, max_urls=100,
+                 max_size=65536, timeout=None):
+        """
+        :param api_url: Piwik analytics API URL, the root of your Piwik
+            install
+        :type api_url: str or None
+        :param token_auth: Auth token for all calls
+        :type token_auth: str or None
+        :param max_urls: Maximum number of calls per request
+        :type max_urls: int
+        :param max_size: Maximum size of the encoded calls per request in
+            bytes, as they appear in the request body
+        :type max_size: int
+        :param timeout: Socket timeout in seconds
+        :type timeout: float or None
+        :rtype: None
+        """
+        self.api_url = api_url
+        self.token_auth = token_auth
+        self.max_urls = max_urls
+        self.max_size = max_size
+        self.timeout = timeout
+        self.queries = []
+
+    def set_api_url(self, api_url):
+        """
+        :param api_url: Piwik analytics API URL, the root of your Piwik install
+        :type api_url: str
+        :rtype: None
+        """
+        self.api_url = api_url
+
+    def add(self, call):
+        """
+        Add a call, return its index in the results
+
+        :param call: A configured PiwikAnalytics, or its parameters
+        :type call: PiwikAnalytics or dict
+        :rtype: int
+        """
+        if isinstance(call, dict):
+            analytics = PiwikAnalytics()
+            for key, value in call.items():
+                analytics.set_parameter(key, value)
+            call = analytics
+        self.queries.append(call.get_query(exclude=self.BULK_PARAMETERS))
+        return len(self.queries) - 1
+
+    def get_chunks(self):
+        """
+        Split the calls into chunks that fit into one request
+
+        :rtype: list of lists of str
+        """
+        chunks = []
+        chunk = []
+        size = 0
+        for query in self.queries:
+            if chunk and (len(chunk) >= self.max_urls or
+                          size + self._get_size(len(chunk), query) >
+                          self.max_size):
+                chunks.append(chunk)
+                chunk = []
+                size = 0
+            chunk.append(query)
+            size += self._get_size(len(chunk) - 1, query)
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _get_size(self, index, query):
+        """
+        Return the size of a call in the request body, as sent
+
+        :rtype: int
+        """
+        return len(urlencode([('urls[%d]' % index, query)])) + 1
+
+    def get_request_body(self, queries):
+        """
+        Return the POST body of a bulk request
+
+        :param queries: Encoded calls
+        :type queries: list of str
+        :rtype: str
+        """
+        params = [
+            ('module', 'API'),
+            ('method', 'API.getBulkRequest'),
+            ('format', 'json'),
+        ]
+        if self.token_auth:
+            params.append(('token_auth', self.token_auth))
+        for i, query in enumerate(queries):
+            params.append(('urls[%d]' % i, query))
+        return urlencode(params)
+
+    def send_request(self):
+        """
+        Make the bulk requests, return the decoded JSON result of every call
+        in the order they were added, then forget the calls
+
+        :raises: ConfigurationError if the API URL was not set
+        :raises: ValueError if Piwik didn't return one result per call
+        :rtype: list
+        """
+        if self.api_url is None:
+            raise ConfigurationError("API URL not set")
+        results = []
+        for chunk in self.get_chunks():
+            request = Request(self.api_url,
+                              self.get_request_body(chunk).encode('utf-8'))
+            if self.timeout is None:
+                response = urlopen(request)
+            else:
+                response = urlopen(request, timeout=self.timeout)
+            body = response.read()
+            if sys.version_info[0] >= 3 and type(body) == bytes:
+                body = body.decode('utf-8')
+            data = json.loads(body)
+            if not isinstance(data, list) or len(data) != len(chunk):
+                raise ValueError("Unexpected bulk response: %s" % body[:200])
+            results.extend(data)
+        self.queries = []
+        return results
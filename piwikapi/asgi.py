@@ -0,0 +1,224 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+
+This module requires Python 3.5 or later.
+"""
+
+import asyncio
+import logging
+from http.cookies import SimpleCookie
+
+from .senders import BaseSender
+from .tracking import PiwikTracker
+from .wsgi import PiwikMiddleware
+
+
+def get_scope_meta(scope):
+    """
+    Return the request data PiwikTracker reads, in Django's request.META
+    format, from an ASGI HTTP scope
+
+    :param scope: ASGI scope
+    :type scope: dict
+    :rtype: dict
+    """
+    meta = {
+        'PATH_INFO': scope.get('root_path', '') + scope.get('path', ''),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+    }
+    for name, value in scope.get('headers', ()):
+        if name == b'user-agent':
+            meta['HTTP_USER_AGENT'] = value.decode('latin-1')
+        elif name == b'referer':
+            meta['HTTP_REFERER'] = value.decode('latin-1')
+        elif name == b'accept-language':
+            meta['HTTP_ACCEPT_LANGUAGE'] = value.decode('latin-1')
+        elif name == b'host':
+            meta['SERVER_NAME'] = value.decode('latin-1').split(':')[0]
+        elif name == b'cookie':
+            meta['HTTP_COOKIE'] = value.decode('latin-1')
+    if 'SERVER_NAME' not in meta and scope.get('server'):
+        meta['SERVER_NAME'] = scope['server'][0]
+    if scope.get('client'):
+        meta['REMOTE_ADDR'] = scope['client'][0]
+    return meta
+
+
+class AsyncSender(BaseSender):
+    """
+    Sends tracking hits in bulk requests from an asyncio task
+
+    submit() never blocks or awaits, the hits are put on a queue that a
+    sender task drains in batches. The blocking HTTP request runs in the
+    loop's default executor. The task is started on the first submit() from
+    within a running event loop.
+    """
+    def __init__(self, api_url, token_auth=False, batch_size=50,
+                 flush_interval=1.0, max_queue_size=10000, timeout=10):
+        """
+        :param max_queue_size: Maximum number of queued hits, see BaseSender
+            for the other parameters
+        :type max_queue_size: int
+        :rtype: None
+        """
+        super(AsyncSender, self).__init__(api_url, token_auth, batch_size,
+                                          flush_interval, timeout)
+        self.max_queue_size = max_queue_size
+        self.queue = None
+        self.task = None
+
+    def submit(self, hit):
+        """
+        Queue a hit, return False if it had to be dropped
+
+        Must be called from the event loop's thread.
+
+        :param hit: The hit
+        :type hit: piwikapi.bulk.TrackingHit
+        :rtype: bool
+        """
+        if self.task is None or self.task.done():
+            self.queue = asyncio.Queue(self.max_queue_size)
+            self.task = asyncio.ensure_future(self._run())
+        try:
+            self.queue.put_nowait(hit)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def flush(self):
+        """
+        Wait until all queued hits have been sent
+
+        :rtype: None
+        """
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def close(self):
+        """
+        Send the remaining hits and stop the sender task
+
+        :rtype: None
+        """
+        await self.flush()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def get_queue_size(self):
+        """
+        :rtype: int
+        """
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def _run(self):
+        q = self.queue
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await q.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(q.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await loop.run_in_executor(None, self._send_batch, batch)
+            except Exception:
+                logging.exception("Sending %d tracking hits failed" %
+                                  len(batch))
+                self.failed += len(batch)
+            finally:
+                for hit in batch:
+                    q.task_done()
+
+
+class PiwikASGIMiddleware(PiwikMiddleware):
+    """
+    ASGI middleware that tracks a page view for every HTTP request
+
+    Works like the WSGI PiwikMiddleware, the hit is queued once the last
+    body chunk was sent and an AsyncSender sends it later::
+
+        from piwikapi.asgi import PiwikASGIMiddleware
+
+        app = PiwikASGIMiddleware(app, 1, 'http://example.com/piwik.php',
+                                  token_auth='YOUR_AUTH_TOKEN')
+
+    Await close() on shutdown, e.g. in a lifespan handler, to send the
+    queued hits.
+    """
+    sender_class = AsyncSender
+
+    # AsyncSender.close() must be awaited on the event loop
+    close_at_exit = False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or \
+                not self.should_track(scope.get('path', '')):
+            await self.app(scope, receive, send)
+            return
+        title_header = self.title_header.encode('latin-1')
+        response = {}
+
+        async def _send(message):
+            if message['type'] == 'http.response.start':
+                headers = []
+                response['title'] = None
+                for name, value in message.get('headers', ()):
+                    if name.lower() == title_header:
+                        response['title'] = value.decode('utf-8')
+                    else:
+                        headers.append((name, value))
+                message = dict(message, headers=headers)
+                response['status'] = message['status']
+                response['headers'] = headers
+            await send(message)
+            if message['type'] == 'http.response.body' and \
+                    not message.get('more_body', False) and \
+                    'status' in response:
+                try:
+                    self.track(scope, response['status'],
+                               response['headers'], response['title'])
+                except Exception:
+                    logging.exception("Piwik tracking failed")
+
+        await self.app(scope, receive, _send)
+
+    async def close(self):
+        """
+        Send the queued hits and stop the sender task
+
+        :rtype: None
+        """
+        await self.sender.close()
+
+    def get_tracker(self, scope):
+        """
+        Return a PiwikTracker for the request
+
+        :param scope: ASGI scope
+        :type scope: dict
+        :rtype: PiwikTracker
+        """
+        meta = get_scope_meta(scope)
+        cookies = None
+        if 'HTTP_COOKIE' in meta:
+            cookie = SimpleCookie()
+            cookie.load(meta['HTTP_COOKIE'])
+            cookies = dict((k, v.value) for k, v in cookie.items())
+        tracker = PiwikTracker(self.id_site, meta=meta,
+                               secure=scope.get('scheme') == 'https',
+                               cookies=cookies)
+        self.configure_tracker(tracker, meta.get('REMOTE_ADDR'))
+        return tracker
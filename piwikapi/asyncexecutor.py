@@ -0,0 +1,113 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+
+This module requires Python 3.5 or later.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from .executor import get_host
+
+
+class AsyncAnalyticsExecutor(object):
+    """
+    Runs many analytics calls concurrently from asyncio code
+
+    Works like AnalyticsExecutor, the blocking calls run in a thread pool of
+    max_workers threads::
+
+        async with AsyncAnalyticsExecutor(max_workers=20,
+                                          max_per_host=4) as executor:
+            bodies = await executor.map(calls)
+
+    Must be used from a single event loop. Call close() when it's not used
+    as a context manager.
+    """
+    def __init__(self, max_workers=10, max_per_host=4):
+        """
+        :param max_workers: Maximum number of concurrent calls
+        :type max_workers: int
+        :param max_per_host: Maximum number of concurrent calls per host
+        :type max_per_host: int
+        :rtype: None
+        """
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.pool = ThreadPoolExecutor(max_workers)
+        self.host_slots = {}
+
+    def _get_host_slots(self, host):
+        if host not in self.host_slots:
+            self.host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return self.host_slots[host]
+
+    async def _run_call(self, index, call):
+        async with self._get_host_slots(get_host(call)):
+            loop = asyncio.get_event_loop()
+            body = await loop.run_in_executor(self.pool, call.send_request)
+        return index, body
+
+    def as_completed(self, calls):
+        """
+        Start the calls, return an iterator of awaitables for their
+        (index, body) tuples in the order they complete
+
+        :param calls: Configured PiwikAnalytics instances or compatible
+        :type calls: iterable
+        :rtype: iterator
+        """
+        tasks = [asyncio.ensure_future(self._run_call(index, call))
+                 for index, call in enumerate(calls)]
+        return asyncio.as_completed(tasks)
+
+    async def map(self, calls, fail_fast=True):
+        """
+        Make the calls, return the bodies in the order of the calls
+
+        With fail_fast the calls that didn't start yet are cancelled at the
+        first error and the error is raised, otherwise the exception of a
+        failed call is returned in place of its body.
+
+        :param calls: Configured PiwikAnalytics instances or compatible
+        :type calls: iterable
+        :param fail_fast: Stop at the first error
+        :type fail_fast: bool
+        :rtype: list
+        """
+        tasks = [asyncio.ensure_future(self._run_call(index, call))
+                 for index, call in enumerate(calls)]
+        if not tasks:
+            return []
+        if not fail_fast:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            return [r if isinstance(r, Exception) else r[1] for r in results]
+        done, pending = await asyncio.wait(
+            tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception():
+                raise task.exception()
+        return [task.result()[1] for task in tasks]
+
+    def close(self):
+        """
+        Shut down the thread pool after the running calls completed
+
+        :rtype: None
+        """
+        self.pool.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.close)
+        return False
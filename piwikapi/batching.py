@@ -0,0 +1,188 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import threading
+
+
+class _EndpointState(object):
+    """
+    Measurements and decisions for one tracking endpoint
+    """
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.latency = None
+        self.error_rate = None
+        self.batches = 0
+
+
+class AdaptiveBatchController(object):
+    """
+    Tunes the batch size and flush interval of a sender from the observed
+    send latency, error rate and queue depth
+
+    The decisions are made per endpoint:
+
+    - Errors or a latency above ``target_latency`` halve the batch size
+    - A backlog of at least one full batch grows the batch size by
+      ``step`` and halves the flush interval, so more hits go out in fewer
+      requests
+    - Batches that are less than half full shorten the flush interval, at
+      low traffic hits shouldn't wait for more hits that don't come
+    - Other batches lengthen the flush interval, so they fill up
+
+    The sender's batch size is the sum over the endpoints, as every batch is
+    split by endpoint, up to ``max_batch_size``, and its flush interval the
+    shortest one.
+
+    >>> controller = AdaptiveBatchController(min_batch_size=10,
+    ...                                      max_batch_size=500)
+    >>> sender.set_controller(controller)
+    """
+    def __init__(self, min_batch_size=10, max_batch_size=500, step=10,
+                 min_flush_interval=0.1, max_flush_interval=5.0,
+                 target_latency=0.5, max_error_rate=0.1, smoothing=0.3):
+        """
+        :param min_batch_size: Lower bound of the batch size
+        :type min_batch_size: int
+        :param max_batch_size: Upper bound of the batch size
+        :type max_batch_size: int
+        :param step: Batch size increase per backlogged batch
+        :type step: int
+        :param min_flush_interval: Lower bound of the flush interval
+        :type min_flush_interval: float
+        :param max_flush_interval: Upper bound of the flush interval
+        :type max_flush_interval: float
+        :param target_latency: Seconds a bulk request may take
+        :type target_latency: float
+        :param max_error_rate: Tolerated share of failed batches
+        :type max_error_rate: float
+        :param smoothing: Weight of the newest measurement in the moving
+            averages, between 0 and 1
+        :type smoothing: float
+        :rtype: None
+        """
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.step = step
+        self.min_flush_interval = min_flush_interval
+        self.max_flush_interval = max_flush_interval
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.smoothing = smoothing
+        self.initial = (min_batch_size, max_flush_interval)
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def set_initial(self, batch_size, flush_interval):
+        """
+        Set the values for endpoints without measurements, clamped to the
+        bounds
+
+        :param batch_size: Batch size
+        :type batch_size: int
+        :param flush_interval: Flush interval in seconds
+        :type flush_interval: float
+        :rtype: None
+        """
+        self.initial = (
+            self._clamp(batch_size, self.min_batch_size, self.max_batch_size),
+            self._clamp(flush_interval, self.min_flush_interval,
+                        self.max_flush_interval),
+        )
+
+    def _clamp(self, value, low, high):
+        return max(low, min(high, value))
+
+    def _average(self, average, value):
+        if average is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * average
+
+    def record(self, api_url, size, latency, ok, queue_size=0):
+        """
+        Record a sent batch and adjust the endpoint's decisions
+
+        :param api_url: Endpoint the batch was sent to
+        :type api_url: str
+        :param size: Number of hits in the batch
+        :type size: int
+        :param latency: Seconds the bulk request took
+        :type latency: float
+        :param ok: If the request succeeded
+        :type ok: bool
+        :param queue_size: Hits still waiting in the sender
+        :type queue_size: int
+        :rtype: None
+        """
+        with self.lock:
+            state = self.endpoints.get(api_url)
+            if state is None:
+                state = _EndpointState(*self.initial)
+                self.endpoints[api_url] = state
+            state.batches += 1
+            state.error_rate = self._average(state.error_rate,
+                                             0.0 if ok else 1.0)
+            if ok:
+                state.latency = self._average(state.latency, latency)
+            batch_size = state.batch_size
+            flush_interval = state.flush_interval
+            if state.error_rate > self.max_error_rate or \
+                    (state.latency or 0) > self.target_latency:
+                batch_size //= 2
+            elif queue_size >= batch_size:
+                batch_size += self.step
+                flush_interval /= 2
+            elif size * 2 < batch_size:
+                flush_interval *= 0.75
+            else:
+                flush_interval *= 1.25
+            state.batch_size = self._clamp(batch_size, self.min_batch_size,
+                                           self.max_batch_size)
+            state.flush_interval = self._clamp(flush_interval,
+                                               self.min_flush_interval,
+                                               self.max_flush_interval)
+
+    def get_batch_size(self):
+        """
+        Return the batch size for the sender
+
+        :rtype: int
+        """
+        states = list(self.endpoints.values())
+        if not states:
+            return self.initial[0]
+        return min(sum(state.batch_size for state in states),
+                   self.max_batch_size)
+
+    def get_flush_interval(self):
+        """
+        Return the flush interval for the sender
+
+        :rtype: float
+        """
+        states = list(self.endpoints.values())
+        if not states:
+            return self.initial[1]
+        return min(state.flush_interval for state in states)
+
+    def get_metrics(self):
+        """
+        Return the current decisions and measurements per endpoint
+
+        :rtype: dict
+        """
+        with self.lock:
+            return dict((api_url, {
+                'batch_size': state.batch_size,
+                'flush_interval': state.flush_interval,
+                'latency': state.latency,
+                'error_rate': state.error_rate,
+                'batches': state.batches,
+            }) for api_url, state in self.endpoints.items())
@@ -0,0 +1,126 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import re
+import threading
+
+
+class BotFilter(object):
+    """
+    Matches the user agents of bots and crawlers
+
+    All patterns are compiled into a single case-insensitive regex, so a
+    check is one search no matter how many patterns there are.
+
+    >>> bots = BotFilter()
+    >>> bots.add_patterns([r'MyMonitor/'])
+    >>> tracker.set_bot_filter(bots)
+    """
+    #: Patterns found in the user agents of common bots, as regexes. They
+    #: match names like Googlebot/2.1 but not phones like the Cubot X19.
+    DEFAULT_PATTERNS = (
+        r'bot[/-]',
+        r'^[\w-]*bot\b',
+        r'compatible;\s*[\w-]*bot',
+        r'\+https?://',
+        r'\brobot',
+        r'crawl',
+        r'spider',
+        r'slurp',
+        r'archiver',
+        r'facebookexternalhit',
+        r'mediapartners-google',
+        r'feedfetcher',
+        r'bingpreview',
+        r'headlesschrome',
+        r'phantomjs',
+        r'python-requests',
+        r'python-urllib',
+        r'curl/',
+        r'wget/',
+        r'go-http-client',
+        r'java/',
+        r'libwww-perl',
+        r'httpclient',
+        r'pingdom',
+        r'uptimerobot',
+    )
+
+    def __init__(self, patterns=DEFAULT_PATTERNS, block_empty=False):
+        """
+        :param patterns: Regexes matched against the user agent
+        :type patterns: iterable of str
+        :param block_empty: Treat a missing user agent as a bot, server
+            side hits often have none
+        :type block_empty: bool
+        :rtype: None
+        """
+        self.block_empty = block_empty
+        self.lock = threading.Lock()
+        self.passed = 0
+        self.dropped = 0
+        self.set_patterns(patterns)
+
+    def set_patterns(self, patterns):
+        """
+        Replace the patterns
+
+        :param patterns: Regexes matched against the user agent
+        :type patterns: iterable of str
+        :rtype: None
+        """
+        patterns = tuple(patterns)
+        if patterns:
+            regex = re.compile('|'.join('(?:%s)' % p for p in patterns),
+                               re.IGNORECASE)
+        else:
+            regex = None
+        # Swap both at once for concurrent is_bot() calls
+        self.patterns, self.regex = patterns, regex
+
+    def add_patterns(self, patterns):
+        """
+        Add patterns to the current ones
+
+        :param patterns: Regexes matched against the user agent
+        :type patterns: iterable of str
+        :rtype: None
+        """
+        self.set_patterns(self.patterns + tuple(patterns))
+
+    def is_bot(self, user_agent):
+        """
+        Check a user agent and count the result
+
+        :param user_agent: User agent
+        :type user_agent: str
+        :rtype: bool
+        """
+        if not user_agent:
+            bot = self.block_empty
+        else:
+            regex = self.regex
+            bot = regex is not None and regex.search(user_agent) is not None
+        with self.lock:
+            if bot:
+                self.dropped += 1
+            else:
+                self.passed += 1
+        return bot
+
+    def get_stats(self):
+        """
+        Return the number of passed and dropped hits
+
+        :rtype: dict
+        """
+        return {
+            'passed': self.passed,
+            'dropped': self.dropped,
+        }
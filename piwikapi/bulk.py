@@ -0,0 +1,101 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import sys
+try:
+    import json
+except ImportError:
+    import simplejson as json
+try:
+    from urllib.request import Request, urlopen
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib2 import Request, urlopen
+    from urllib import urlencode
+
+from .exceptions import ConfigurationError
+
+
+class TrackingHit(object):
+    """
+    A built tracking request that has not been sent yet
+    """
+    __slots__ = ('query', 'headers', 'timestamp', 'visitor_id')
+
+    def __init__(self, query, headers=None, timestamp=None, visitor_id=None):
+        """
+        :param query: The query string for piwik.php
+        :type query: str
+        :param headers: HTTP headers of the request
+        :type headers: dict
+        :param timestamp: Unix timestamp of the hit
+        :type timestamp: float or None
+        :param visitor_id: Visitor ID of the hit
+        :type visitor_id: str or None
+        :rtype: None
+        """
+        self.query = query
+        self.headers = headers or {}
+        self.timestamp = timestamp
+        self.visitor_id = visitor_id
+
+    def get_bulk_query(self):
+        """
+        Return the query as used in a bulk request
+
+        Bulk requests share one set of HTTP headers, so the user agent and
+        language are moved into the query.
+
+        :rtype: str
+        """
+        query = self.query
+        extra = {}
+        if 'User-Agent' in self.headers:
+            extra['ua'] = self.headers['User-Agent']
+        if 'Accept-Language' in self.headers:
+            extra['lang'] = self.headers['Accept-Language']
+        if extra:
+            query += '&%s' % urlencode(extra)
+        return '?' + query
+
+
+def send_bulk_request(api_url, hits, token_auth=False, timeout=None):
+    """
+    Send many tracking hits to piwik.php in one POST request, return the
+    response body
+
+    :param api_url: Piwik tracking API URL
+    :type api_url: str
+    :param hits: The hits to send
+    :type hits: iterable of TrackingHit
+    :param token_auth: Auth token, required for hits that override the IP
+        or the date
+    :type token_auth: str or False
+    :param timeout: Socket timeout in seconds
+    :type timeout: float or None
+    :raises: ConfigurationError if the API URL was not set
+    :rtype: str
+    """
+    if not api_url:
+        raise ConfigurationError('API URL not set')
+    data = {
+        'requests': [hit.get_bulk_query() for hit in hits],
+    }
+    if token_auth:
+        data['token_auth'] = token_auth
+    request = Request(api_url, json.dumps(data).encode('utf-8'))
+    request.add_header('Content-Type', 'application/json')
+    if timeout is None:
+        response = urlopen(request)
+    else:
+        response = urlopen(request, timeout=timeout)
+    body = response.read()
+    if sys.version_info[0] >= 3 and type(body) == bytes:
+        body = str(body)
+    return body
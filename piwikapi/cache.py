@@ -0,0 +1,576 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import datetime
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from hashlib import md5
+try:
+    import json
+except ImportError:
+    import simplejson as json
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+from .periods import get_period_end
+from .periods import is_absolute_date
+
+
+def get_request_key(api_url, parameters):
+    """
+    Return a hash of a request, the same for equal parameters in any order
+
+    :param api_url: Analytics API URL
+    :type api_url: str
+    :param parameters: Request parameters
+    :type parameters: dict
+    :rtype: str
+    """
+    key = '%s?%s' % (api_url, urlencode(sorted(parameters.items())))
+    return md5(key.encode('utf-8')).hexdigest()
+
+
+def is_error_response(body):
+    """
+    Return True if a response body is a Piwik error message, in JSON, XML
+    or one of the text formats
+
+    :param body: Response body
+    :type body: str or bytes
+    :rtype: bool
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    body = body.lstrip()
+    if body.startswith('{'):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return False
+        return isinstance(data, dict) and data.get('result') == 'error'
+    head = body[:512]
+    return '<error message=' in head or head.startswith('Error:')
+
+
+class LRUCache(object):
+    """
+    A thread-safe in-memory cache bounded by size and age
+
+    Cache backends implement get(), set(), delete() and clear(), so any
+    object with these methods can be used where an LRUCache is accepted,
+    e.g. one backed by a store shared between processes.
+    """
+    def __init__(self, max_size=10000, ttl=None):
+        """
+        :param max_size: Maximum number of entries, the least recently used
+            entries are evicted first
+        :type max_size: int
+        :param ttl: Default time to live in seconds, None for no expiry
+        :type ttl: float or None
+        :rtype: None
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the value for key, or default if it is missing or expired
+
+        :param key: Key
+        :type key: str
+        :param default: Returned for missing keys
+        :rtype: the stored value
+        """
+        with self.lock:
+            try:
+                value, expires = self.data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.time():
+                del self.data[key]
+                return default
+            # Mark as recently used
+            del self.data[key]
+            self.data[key] = (value, expires)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value
+
+        :param key: Key
+        :type key: str
+        :param value: Value
+        :param ttl: Time to live in seconds, defaults to the cache's ttl
+        :type ttl: float or None
+        :rtype: None
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expires = time.time() + ttl if ttl is not None else None
+        with self.lock:
+            if key in self.data:
+                del self.data[key]
+            self.data[key] = (value, expires)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Remove a key
+
+        :param key: Key
+        :type key: str
+        :rtype: None
+        """
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all entries
+
+        :rtype: None
+        """
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class VisitorIdCache(object):
+    """
+    Maps session keys to stable visitor IDs for clients without Piwik cookies
+
+    The session key can be anything that identifies a client, e.g. an API
+    key, a device ID or a session cookie. Only a hash of it is stored.
+
+    >>> cache = VisitorIdCache(max_size=100000, ttl=1800)
+    >>> tracker.set_session_key(request.META['HTTP_X_API_KEY'], cache)
+    """
+    def __init__(self, backend=None, max_size=10000, ttl=1800):
+        """
+        :param backend: Cache backend, defaults to an LRUCache
+        :type backend: LRUCache or compatible
+        :param max_size: Maximum number of sessions of the default backend
+        :type max_size: int
+        :param ttl: Seconds of inactivity after which a session gets a new
+            visitor ID
+        :type ttl: float or None
+        :rtype: None
+        """
+        if backend is None:
+            backend = LRUCache(max_size, ttl)
+        self.backend = backend
+        self.ttl = ttl
+
+    def get_key(self, session_key):
+        """
+        :param session_key: Session key
+        :type session_key: str
+        :rtype: str
+        """
+        if not isinstance(session_key, bytes):
+            session_key = session_key.encode('utf-8')
+        return 'vid:' + md5(session_key).hexdigest()
+
+    def get_visitor_id(self, session_key, visitor_id):
+        """
+        Return the visitor ID of the session, the given visitor_id is stored
+        and returned for new sessions
+
+        :param session_key: Session key
+        :type session_key: str
+        :param visitor_id: Visitor ID to use for a new session
+        :type visitor_id: str
+        :rtype: str
+        """
+        key = self.get_key(session_key)
+        cached = self.backend.get(key)
+        if cached is not None:
+            visitor_id = cached
+        # Also refreshes the TTL of known sessions
+        self.backend.set(key, visitor_id, self.ttl)
+        return visitor_id
+
+
+class DiskCache(object):
+    """
+    A cache backend that stores every entry in a file below a directory
+
+    It has the same methods as LRUCache, so the entries survive restarts and
+    can be shared between processes on the same host. When there are more
+    than max_size entries the least recently used ones are removed.
+    """
+    def __init__(self, path, max_size=10000, ttl=None, compress=False):
+        """
+        :param path: Cache directory, created if it doesn't exist
+        :type path: str
+        :param max_size: Maximum number of entries
+        :type max_size: int
+        :param ttl: Default time to live in seconds, None for no expiry
+        :type ttl: float or None
+        :param compress: Compress the entries with zlib, JSON and XML
+            responses shrink to a fraction of their size
+        :type compress: bool
+        :rtype: None
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.compress = compress
+        self.lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.size = len(self._get_files())
+
+    def _get_file(self, key):
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        return os.path.join(self.path, md5(key).hexdigest() + '.cache')
+
+    def _get_files(self):
+        return [os.path.join(self.path, name)
+                for name in os.listdir(self.path) if name.endswith('.cache')]
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+            return True
+        except OSError:
+            return False
+
+    def get(self, key, default=None):
+        """
+        Return the value for key, or default if it is missing or expired
+
+        :param key: Key
+        :type key: str
+        :param default: Returned for missing keys
+        :rtype: the stored value
+        """
+        filename = self._get_file(key)
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+            if self.compress:
+                data = zlib.decompress(data)
+            value, expires = pickle.loads(data)
+        except Exception:
+            return default
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+            return default
+        try:
+            # The modification time tracks the last use
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value
+
+        :param key: Key
+        :type key: str
+        :param value: Value, must be picklable
+        :param ttl: Time to live in seconds, defaults to the cache's ttl
+        :type ttl: float or None
+        :rtype: None
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expires = time.time() + ttl if ttl is not None else None
+        filename = self._get_file(key)
+        tmp = '%s.%d.%d.tmp' % (filename, os.getpid(), id(value))
+        data = pickle.dumps((value, expires), pickle.HIGHEST_PROTOCOL)
+        if self.compress:
+            data = zlib.compress(data)
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        with self.lock:
+            if not os.path.exists(filename):
+                self.size += 1
+            else:
+                self._remove(filename)
+            os.rename(tmp, filename)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """
+        Remove the least recently used tenth of the entries
+
+        :rtype: None
+        """
+        files = self._get_files()
+        files.sort(key=lambda name: os.path.getmtime(name))
+        for filename in files[:len(files) - self.max_size * 9 // 10]:
+            self._remove(filename)
+        self.size = len(self._get_files())
+
+    def delete(self, key):
+        """
+        Remove a key
+
+        :param key: Key
+        :type key: str
+        :rtype: None
+        """
+        with self.lock:
+            if self._remove(self._get_file(key)):
+                self.size -= 1
+
+    def clear(self):
+        """
+        Remove all entries
+
+        :rtype: None
+        """
+        with self.lock:
+            for filename in self._get_files():
+                self._remove(filename)
+            self.size = 0
+
+    def __len__(self):
+        return self.size
+
+
+class ResponseCache(object):
+    """
+    Caches analytics API responses by their request parameters
+
+    The key is built from the API URL and the sorted parameters, so the
+    order in which they were set doesn't matter. Only a hash of the key is
+    stored, the auth token doesn't end up in the backend.
+
+    Reports of periods that lie fully in the past don't change anymore.
+    They are kept without expiry in the archive backend, if one was given,
+    as long as the date is absolute: yesterday or previous7 mean other days
+    tomorrow. Periods that include today are cached for today_ttl seconds.
+    Pass today to compare the days in the timezone of the sites.
+
+    With stale_ttl, expired responses are kept that much longer. A
+    PiwikAnalytics with a SingleFlight serves them while it refreshes them
+    in the background.
+
+    >>> cache = ResponseCache(ttl=300, method_ttls={'Live.getCounters': 10},
+    ...                       archive=DiskCache('/var/cache/piwik',
+    ...                                         compress=True))
+    >>> analytics.set_cache(cache)
+    """
+    def __init__(self, backend=None, max_size=1000, ttl=300,
+                 method_ttls=None, archive=None, today_ttl=None,
+                 stale_ttl=None, today=None):
+        """
+        :param backend: Cache backend, defaults to an LRUCache
+        :type backend: LRUCache, DiskCache or compatible
+        :param max_size: Maximum number of responses of the default backend
+        :type max_size: int
+        :param ttl: Seconds a response is cached, None for no expiry
+        :type ttl: float or None
+        :param method_ttls: TTLs for single API methods, a TTL of 0 disables
+            caching of a method
+        :type method_ttls: dict or None
+        :param archive: Backend for the reports of closed periods, e.g. a
+            DiskCache without ttl
+        :type archive: DiskCache, LRUCache or compatible
+        :param today_ttl: Seconds the reports of periods that include today
+            are cached, defaults to ttl
+        :type today_ttl: float or None
+        :param stale_ttl: Seconds expired responses are kept for
+            get_entry(), None to drop them
+        :type stale_ttl: float or None
+        :param today: Returns the current date in the timezone of the sites,
+            defaults to the local date
+        :type today: callable or None
+        :rtype: None
+        """
+        if backend is None:
+            backend = LRUCache(max_size, ttl)
+        self.backend = backend
+        self.ttl = ttl
+        self.method_ttls = method_ttls or {}
+        self.archive = archive
+        self.today_ttl = ttl if today_ttl is None else today_ttl
+        self.stale_ttl = stale_ttl
+        self.today = today or datetime.date.today
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.lock = threading.Lock()
+
+    def get_key(self, api_url, parameters):
+        """
+        Return the cache key of a request
+
+        :param api_url: Analytics API URL
+        :type api_url: str
+        :param parameters: Request parameters
+        :type parameters: dict
+        :rtype: str
+        """
+        return 'resp:' + get_request_key(api_url, parameters)
+
+    def get_backend(self, parameters):
+        """
+        Return the backend and TTL for a request
+
+        :param parameters: Request parameters
+        :type parameters: dict
+        :rtype: tuple
+        """
+        method = parameters.get('method')
+        if method in self.method_ttls:
+            return self.backend, self.method_ttls[method]
+        if 'period' in parameters and 'date' in parameters:
+            today = self.today()
+            end = get_period_end(parameters['period'], parameters['date'],
+                                 today)
+            if end is not None and end >= today:
+                return self.backend, self.today_ttl
+            if end is not None and self.archive is not None and \
+                    is_absolute_date(parameters['date']):
+                return self.archive, None
+        return self.backend, self.ttl
+
+    def get_ttl(self, parameters):
+        """
+        Return the TTL for a request
+
+        :param parameters: Request parameters
+        :type parameters: dict
+        :rtype: float or None
+        """
+        return self.get_backend(parameters)[1]
+
+    def _lookup(self, api_url, parameters):
+        """
+        Return the cached body of a request and whether it's fresh
+
+        :rtype: tuple
+        """
+        backend, ttl = self.get_backend(parameters)
+        if ttl == 0:
+            return None, False
+        value = backend.get(self.get_key(api_url, parameters))
+        if isinstance(value, tuple):
+            fresh_until, body = value
+            return body, time.time() < fresh_until
+        return value, value is not None
+
+    def get_entry(self, api_url, parameters):
+        """
+        Return the cached response body of a request and whether it's still
+        fresh, the body is None on a miss
+
+        :param api_url: Analytics API URL
+        :type api_url: str
+        :param parameters: Request parameters
+        :type parameters: dict
+        :rtype: tuple
+        """
+        if self.get_ttl(parameters) == 0:
+            return None, False
+        body, fresh = self._lookup(api_url, parameters)
+        with self.lock:
+            if body is None:
+                self.misses += 1
+            elif fresh:
+                self.hits += 1
+            else:
+                self.stale += 1
+        return body, fresh
+
+    def get(self, api_url, parameters):
+        """
+        Return the cached response body of a request, or None
+
+        Stale responses are a miss.
+
+        :param api_url: Analytics API URL
+        :type api_url: str
+        :param parameters: Request parameters
+        :type parameters: dict
+        :rtype: str or None
+        """
+        if self.get_ttl(parameters) == 0:
+            return None
+        body, fresh = self._lookup(api_url, parameters)
+        with self.lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return body if fresh else None
+
+    def peek(self, api_url, parameters):
+        """
+        Return the cached response body of a request, or None, without
+        counting a hit or miss
+
+        :param api_url: Analytics API URL
+        :type api_url: str
+        :param parameters: Request parameters
+        :type parameters: dict
+        :rtype: str or None
+        """
+        body, fresh = self._lookup(api_url, parameters)
+        return body if fresh else None
+
+    def set(self, api_url, parameters, body):
+        """
+        Store the response body of a request, error messages aren't cached
+
+        :param api_url: Analytics API URL
+        :type api_url: str
+        :param parameters: Request parameters
+        :type parameters: dict
+        :param body: Response body
+        :type body: str
+        :rtype: None
+        """
+        backend, ttl = self.get_backend(parameters)
+        if ttl == 0:
+            return
+        # One failed call must not answer all identical requests
+        if is_error_response(body):
+            return
+        key = self.get_key(api_url, parameters)
+        if ttl is not None and self.stale_ttl:
+            backend.set(key, (time.time() + ttl, body), ttl + self.stale_ttl)
+        else:
+            backend.set(key, body, ttl)
+
+    def get_stats(self):
+        """
+        Return the number of cache hits, misses and stale responses returned
+        by get_entry()
+
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+            }
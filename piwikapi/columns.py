@@ -0,0 +1,123 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+from array import array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 'q' is missing before Python 3.3, 'l' is only 32 bit on Windows
+try:
+    INT_TYPECODE = array('q').typecode
+except ValueError:
+    INT_TYPECODE = 'l' if array('l').itemsize >= 8 else 'd'
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def get_column_names(rows):
+    """
+    Return the names of all columns in the order they first appear
+
+    :param rows: Report rows
+    :type rows: list of dicts
+    :rtype: list of str
+    """
+    names = []
+    seen = set()
+    for row in rows:
+        for name in row:
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+    return names
+
+
+def _to_column(values, pool):
+    """
+    Return a numeric array for numbers, otherwise a list of interned values
+
+    :rtype: numpy.ndarray, array.array or list
+    """
+    if values and all(_is_number(v) or v is None for v in values):
+        if all(isinstance(v, int) for v in values):
+            if numpy is not None:
+                return numpy.array(values, dtype=numpy.int64)
+            return array(INT_TYPECODE, values)
+        values = [float('nan') if v is None else v for v in values]
+        if numpy is not None:
+            return numpy.array(values, dtype=numpy.float64)
+        return array('d', values)
+    # Labels repeat a lot across sites and dates, store every string once
+    return [pool.setdefault(v, v) if v is not None else None
+            for v in values]
+
+
+def to_columns(rows, columns=None, pool=None):
+    """
+    Convert report rows to a dict of columns
+
+    Numeric columns become NumPy arrays if NumPy is installed, otherwise
+    arrays from the array module. Integer columns are int64 or 64 bit 'q'
+    arrays, columns with floats or missing values float64 or 'd' arrays
+    with NaN for missing values. Other columns, like the labels, are lists in which
+    equal strings are the same object.
+
+    :param rows: Report rows, e.g. the decoded JSON of a report
+    :type rows: list of dicts
+    :param columns: Columns to convert, defaults to all
+    :type columns: list of str or None
+    :param pool: Dict of already interned strings, pass the same dict when
+        converting many reports
+    :type pool: dict or None
+    :rtype: dict
+    """
+    if columns is None:
+        columns = get_column_names(rows)
+    if pool is None:
+        pool = {}
+    result = {}
+    for name in columns:
+        result[name] = _to_column([row.get(name) for row in rows], pool)
+    return result
+
+
+def to_array(rows, columns):
+    """
+    Convert numeric columns of report rows to a two dimensional array of
+    floats, one row per report row, missing values are NaN
+
+    Returns a NumPy array if NumPy is installed, otherwise a flat 'd' array
+    in row-major order.
+
+    :param rows: Report rows
+    :type rows: list of dicts
+    :param columns: Numeric columns
+    :type columns: list of str
+    :raises: ValueError if a value is not a number
+    :rtype: numpy.ndarray or array.array
+    """
+    flat = array('d')
+    nan = float('nan')
+    for row in rows:
+        for name in columns:
+            value = row.get(name)
+            if value is None:
+                flat.append(nan)
+            elif _is_number(value):
+                flat.append(value)
+            else:
+                raise ValueError("%s is not a number: %r" % (name, value))
+    if numpy is None:
+        return flat
+    return numpy.frombuffer(flat, dtype=numpy.float64).reshape(
+        len(rows), len(columns))
@@ -0,0 +1,181 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import threading
+from hashlib import md5
+
+from .cache import LRUCache
+
+
+def get_digest(*parts):
+    """
+    Return a compact hash of the parts
+
+    :rtype: bytes
+    """
+    h = md5()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = ('%s' % part).encode('utf-8')
+        h.update(part)
+        h.update(b'\0')
+    return h.digest()[:8]
+
+
+class CartDeduplicator(object):
+    """
+    Remembers the last cart sent for each visitor, so that unchanged carts
+    are not sent again
+
+    Only an 8 byte hash of the items and the grand total is stored per
+    visitor.
+
+    >>> dedup = CartDeduplicator(max_size=100000, ttl=3600)
+    >>> tracker.set_cart_deduplicator(dedup)
+    """
+    def __init__(self, max_size=10000, ttl=None, backend=None):
+        """
+        :param max_size: Maximum number of visitors of the default backend
+        :type max_size: int
+        :param ttl: Seconds after which a cart is sent again even if it
+            didn't change
+        :type ttl: float or None
+        :param backend: Cache backend, defaults to an LRUCache
+        :type backend: LRUCache or compatible
+        :rtype: None
+        """
+        if backend is None:
+            backend = LRUCache(max_size, ttl)
+        self.backend = backend
+        self.ttl = ttl
+        self.sent = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def is_duplicate(self, key, digest):
+        """
+        Return True if the cart with digest was the last one sent for key,
+        otherwise remember it
+
+        :param key: Identifies the visitor
+        :type key: str
+        :param digest: Hash of the cart, see get_digest()
+        :type digest: bytes
+        :rtype: bool
+        """
+        with self.lock:
+            if self.backend.get(key) == digest:
+                self.skipped += 1
+                return True
+            self.backend.set(key, digest, self.ttl)
+            self.sent += 1
+            return False
+
+    def forget(self, key, digest):
+        """
+        Forget the cart with digest if it is still the last one of key, call
+        this when sending it failed so that a retry is not skipped
+
+        :param key: Identifies the visitor
+        :type key: str
+        :param digest: Hash of the cart, see get_digest()
+        :type digest: bytes
+        :rtype: None
+        """
+        with self.lock:
+            if self.backend.get(key) == digest:
+                self.backend.delete(key)
+                self.sent -= 1
+
+    def get_stats(self):
+        """
+        Return the number of sent and skipped carts
+
+        :rtype: dict
+        """
+        return {
+            'sent': self.sent,
+            'skipped': self.skipped,
+        }
+
+
+class PageViewDeduplicator(object):
+    """
+    Drops repeated page views of a visitor within a short time window
+
+    Browser reloads and retrying clients send the same page view again
+    within seconds. A page view with the same visitor ID, URL and title as
+    one sent less than window seconds earlier is skipped. Only an 8 byte
+    hash per recent page view is stored, the oldest ones are evicted first.
+
+    >>> dedup = PageViewDeduplicator(window=10)
+    >>> tracker.set_page_view_deduplicator(dedup)
+    """
+    def __init__(self, window=10, max_size=100000, backend=None):
+        """
+        :param window: Seconds in which identical page views are dropped
+        :type window: float
+        :param max_size: Maximum number of page views of the default backend
+        :type max_size: int
+        :param backend: Cache backend, defaults to an LRUCache
+        :type backend: LRUCache or compatible
+        :rtype: None
+        """
+        if backend is None:
+            backend = LRUCache(max_size, window)
+        self.backend = backend
+        self.window = window
+        self.sent = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def is_duplicate(self, digest):
+        """
+        Return True if the page view with digest was seen within the window,
+        otherwise remember it
+
+        The window starts with the first page view, repeated ones don't
+        extend it.
+
+        :param digest: Hash of the page view, see get_digest()
+        :type digest: bytes
+        :rtype: bool
+        """
+        with self.lock:
+            if self.backend.get(digest) is not None:
+                self.skipped += 1
+                return True
+            self.backend.set(digest, True, self.window)
+            self.sent += 1
+            return False
+
+    def forget(self, digest):
+        """
+        Forget the page view with digest, call this when sending it failed
+        so that a retry is not skipped
+
+        :param digest: Hash of the page view, see get_digest()
+        :type digest: bytes
+        :rtype: None
+        """
+        with self.lock:
+            if self.backend.get(digest) is not None:
+                self.backend.delete(digest)
+                self.sent -= 1
+
+    def get_stats(self):
+        """
+        Return the number of sent and skipped page views
+
+        :rtype: dict
+        """
+        return {
+            'sent': self.sent,
+            'skipped': self.skipped,
+        }
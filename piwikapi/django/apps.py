@@ -0,0 +1,30 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+from __future__ import absolute_import
+
+import atexit
+
+from django.apps import AppConfig
+from django.core.signals import request_finished
+
+from .middleware import flush_hits
+
+
+class PiwikConfig(AppConfig):
+    """
+    Flushes the tracking hits of the worker process once responses are done
+    """
+    name = 'piwikapi.django'
+    label = 'piwikapi'
+    verbose_name = 'Piwik tracking'
+
+    def ready(self):
+        request_finished.connect(flush_hits,
+                                 dispatch_uid='piwikapi.flush_hits')
+        atexit.register(flush_hits, force=True)
@@ -0,0 +1,113 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+from __future__ import absolute_import
+
+import logging
+import re
+import threading
+
+from django.conf import settings
+
+from ..senders import BufferedSender
+from ..tracking import PiwikTrackerEcommerce
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender():
+    """
+    Return the sender of the worker process, configured from the settings
+    PIWIK_TRACKING_API_URL, PIWIK_TOKEN_AUTH, PIWIK_BATCH_SIZE and
+    PIWIK_FLUSH_INTERVAL
+
+    :rtype: piwikapi.senders.BufferedSender
+    """
+    global _sender
+    if _sender is None:
+        with _sender_lock:
+            if _sender is None:
+                _sender = BufferedSender(
+                    settings.PIWIK_TRACKING_API_URL,
+                    getattr(settings, 'PIWIK_TOKEN_AUTH', False),
+                    getattr(settings, 'PIWIK_BATCH_SIZE', 50),
+                    getattr(settings, 'PIWIK_FLUSH_INTERVAL', 5.0),
+                )
+    return _sender
+
+
+def flush_hits(sender=None, force=False, **kwargs):
+    """
+    Send the buffered hits if a batch is due, connected to request_finished
+
+    :param force: Send everything that is buffered
+    :type force: bool
+    :rtype: None
+    """
+    if _sender is None:
+        return
+    try:
+        if force:
+            _sender.flush()
+        else:
+            _sender.flush_if_due()
+    except Exception:
+        logging.exception("Flushing Piwik tracking hits failed")
+
+
+class PiwikMiddleware(object):
+    """
+    Tracks a page view for every request and sets ``request.piwik``
+
+    ``request.piwik`` is a PiwikTrackerEcommerce, views can use it for
+    ecommerce and goal tracking. No request is made inline, all hits of the
+    worker are buffered and sent in batches once responses are finished.
+
+    Views can set ``request.piwik_title`` to set the page title, or set it
+    to None to skip the page view. Paths matching one of the regexes in
+    PIWIK_EXCLUDE_PATHS are not tracked, ``request.piwik`` is None for them.
+    """
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+        self.id_site = settings.PIWIK_SITE_ID
+        self.token_auth = getattr(settings, 'PIWIK_TOKEN_AUTH', False)
+        exclude = getattr(settings, 'PIWIK_EXCLUDE_PATHS', ())
+        if exclude:
+            self.exclude = re.compile('|'.join('(?:%s)' % p for p in exclude))
+        else:
+            self.exclude = None
+
+    def __call__(self, request):
+        self.process_request(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_request(self, request):
+        if self.exclude is not None and self.exclude.search(request.path):
+            request.piwik = None
+            return None
+        tracker = PiwikTrackerEcommerce(self.id_site, request)
+        tracker.set_sender(get_sender())
+        if self.token_auth:
+            tracker.set_token_auth(self.token_auth)
+            if request.META.get('REMOTE_ADDR'):
+                tracker.set_ip(request.META['REMOTE_ADDR'])
+        request.piwik = tracker
+        request.piwik_title = ''
+        return None
+
+    def process_response(self, request, response):
+        tracker = getattr(request, 'piwik', None)
+        title = getattr(request, 'piwik_title', None)
+        if tracker is not None and title is not None:
+            try:
+                tracker.do_track_page_view(title)
+            except Exception:
+                logging.exception("Piwik tracking failed")
+        return response
@@ -4,3 +4,7 @@ class InvalidParameter(Exception):
 
 class ConfigurationError(Exception):
     pass
+
+
+class APIError(Exception):
+    pass
@@ -0,0 +1,149 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+
+def get_host(call):
+    """
+    Return the host a call goes to
+
+    :param call: A configured PiwikAnalytics or compatible
+    :rtype: str
+    """
+    return urlparse(call.api_url or '').netloc
+
+
+class AnalyticsExecutor(object):
+    """
+    Runs many analytics calls concurrently on a pool of threads
+
+    At most max_workers calls run at once, no matter how many run() calls
+    share the executor, and at most max_per_host calls go to the same
+    host::
+
+        executor = AnalyticsExecutor(max_workers=20, max_per_host=4)
+        calls = []
+        for id_site in range(1, 301):
+            pa = PiwikAnalytics()
+            ...
+            calls.append(pa)
+        for index, body in executor.run(calls):
+            ...
+
+    Every call is made with its send_request() method, so calls with a
+    response cache use it.
+    """
+    def __init__(self, max_workers=10, max_per_host=4):
+        """
+        :param max_workers: Maximum number of concurrent calls
+        :type max_workers: int
+        :param max_per_host: Maximum number of concurrent calls per host
+        :type max_per_host: int
+        :rtype: None
+        """
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.slots = threading.BoundedSemaphore(max_workers)
+        self.host_slots = {}
+        self.lock = threading.Lock()
+
+    def _get_host_slots(self, host):
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(
+                    self.max_per_host)
+            return self.host_slots[host]
+
+    def run(self, calls, ordered=True, fail_fast=False):
+        """
+        Make the calls, yield (index, body) tuples
+
+        If a call fails its exception is yielded instead of the body, unless
+        fail_fast is set: then the calls that didn't start yet are cancelled
+        and the exception is raised. Leaving the loop early cancels the
+        remaining calls as well.
+
+        :param calls: Configured PiwikAnalytics instances or compatible
+        :type calls: iterable
+        :param ordered: Yield the results in the order of the calls,
+            otherwise as they complete
+        :type ordered: bool
+        :param fail_fast: Stop at the first error
+        :type fail_fast: bool
+        :rtype: generator
+        """
+        calls = list(calls)
+        jobs = queue.Queue()
+        for job in enumerate(calls):
+            jobs.put(job)
+        results = queue.Queue()
+        stop = threading.Event()
+
+        def work():
+            while not stop.is_set():
+                try:
+                    index, call = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    with self._get_host_slots(get_host(call)):
+                        with self.slots:
+                            if stop.is_set():
+                                return
+                            body = call.send_request()
+                except Exception as e:
+                    # Every call must put a result, or run() waits forever
+                    results.put((index, None, e))
+                else:
+                    results.put((index, body, None))
+
+        for i in range(min(self.max_workers, len(calls))):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+        pending = {}
+        next_index = 0
+        try:
+            for i in range(len(calls)):
+                index, body, error = results.get()
+                if error is not None:
+                    if fail_fast:
+                        raise error
+                    body = error
+                if not ordered:
+                    yield index, body
+                    continue
+                pending[index] = body
+                while next_index in pending:
+                    yield next_index, pending.pop(next_index)
+                    next_index += 1
+        finally:
+            stop.set()
+
+    def map(self, calls, fail_fast=True):
+        """
+        Make the calls, return the bodies in the order of the calls
+
+        :param calls: Configured PiwikAnalytics instances or compatible
+        :type calls: iterable
+        :param fail_fast: Raise the first error instead of returning it in
+            place of the body
+        :type fail_fast: bool
+        :rtype: list
+        """
+        return [body for index, body in self.run(calls, True, fail_fast)]
@@ -0,0 +1,219 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import re
+
+#: Metrics that can't be derived from the metrics of shorter periods. They
+#: are None in merged reports instead of being summed, as are all other
+#: metrics that count unique visitors.
+NON_ADDITIVE_METRICS = frozenset((
+    'nb_uniq_visitors',
+    'nb_users',
+))
+
+#: Metrics that are summed, besides the ones matching ADDITIVE_RE
+ADDITIVE_METRICS = frozenset((
+    'revenue',
+    'bounce_count',
+    'entry_bounce_count',
+    'nb_conversions',
+    'nb_visits_converted',
+    'items',
+))
+
+#: Matches the names of metrics that are summed
+ADDITIVE_RE = re.compile(r'^(nb_|sum_|entry_nb_|exit_nb_|entry_sum_|'
+                         r'goal_\d+_nb_|goal_\d+_revenue$)')
+
+#: Metrics that take the largest value of the merged periods
+MAX_METRICS = frozenset((
+    'max_actions',
+))
+
+#: Ratios recomputed from the merged metrics, as (numerator, denominator,
+#: format) where format is 'percent', 'int' or 'float'
+RATIO_METRICS = {
+    'bounce_rate': ('bounce_count', 'nb_visits', 'percent'),
+    'conversion_rate': ('nb_visits_converted', 'nb_visits', 'percent'),
+    'nb_actions_per_visit': ('nb_actions', 'nb_visits', 'float'),
+    'avg_time_on_site': ('sum_visit_length', 'nb_visits', 'int'),
+    'avg_time_on_page': ('sum_time_spent', 'nb_hits', 'int'),
+    'exit_rate': ('exit_nb_visits', 'nb_visits', 'percent'),
+    'entry_bounce_rate': ('entry_bounce_count', 'entry_nb_visits',
+                          'percent'),
+}
+
+#: Rows Piwik returns when a request has no filter_limit
+DEFAULT_LIMIT = 100
+
+#: Row attributes that only apply to one period and are left out
+PERIOD_ATTRIBUTES = frozenset((
+    'idsubdatatable',
+))
+
+
+def is_non_additive(name):
+    """
+    Return True for metrics that must never be summed, like the number of
+    unique visitors
+
+    :param name: Metric name
+    :type name: str
+    :rtype: bool
+    """
+    return name in NON_ADDITIVE_METRICS or \
+        ('uniq_visitors' in name and not name.startswith('sum_daily_'))
+
+
+def get_metric_kind(name):
+    """
+    Return how a metric is merged: 'ratio', 'max', 'sum' or 'none'
+
+    Unknown metrics are never summed.
+
+    :param name: Metric name
+    :type name: str
+    :rtype: str
+    """
+    if name in RATIO_METRICS:
+        return 'ratio'
+    if is_non_additive(name):
+        return 'none'
+    if name in MAX_METRICS:
+        return 'max'
+    if name in ADDITIVE_METRICS or ADDITIVE_RE.match(name):
+        return 'sum'
+    return 'none'
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _to_number(value):
+    if _is_number(value):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _format_ratio(numerator, denominator, format):
+    if not denominator:
+        return 0 if format != 'percent' else '0%'
+    ratio = float(numerator) / denominator
+    if format == 'percent':
+        return '%d%%' % round(ratio * 100)
+    if format == 'int':
+        return int(round(ratio))
+    return round(ratio, 2)
+
+
+def merge_metrics(rows):
+    """
+    Merge the metrics of one row, or a whole report, of several periods
+
+    Additive metrics are summed and ratios recomputed from them. Metrics
+    that can't be merged are None. Other attributes, e.g. the label, are
+    taken from the first row.
+
+    :param rows: Metrics of the periods
+    :type rows: list of dicts
+    :rtype: dict
+    """
+    merged = {}
+    for row in rows:
+        for name, value in row.items():
+            if name in PERIOD_ATTRIBUTES or name in RATIO_METRICS:
+                continue
+            kind = get_metric_kind(name)
+            if kind == 'none':
+                if name not in merged:
+                    # Attributes like the label are kept, metrics dropped
+                    merged[name] = None if _is_number(value) or \
+                        is_non_additive(name) else value
+                continue
+            number = _to_number(value)
+            if number is None or merged.get(name, 0) is None:
+                merged[name] = None
+            elif name not in merged:
+                merged[name] = number
+            elif kind == 'sum':
+                merged[name] += number
+            else:
+                merged[name] = max(merged[name], number)
+    for name, (numerator, denominator, format) in RATIO_METRICS.items():
+        if any(name in row for row in rows):
+            if merged.get(numerator) is not None and \
+                    merged.get(denominator) is not None:
+                merged[name] = _format_ratio(merged[numerator],
+                                             merged[denominator], format)
+            else:
+                merged[name] = None
+    return merged
+
+
+def merge_reports(reports):
+    """
+    Merge the reports of several periods into one
+
+    A report is either a dict of metrics, e.g. from VisitsSummary.get, or a
+    list of rows that are merged by their label. Merged rows are sorted by
+    nb_visits, or nb_hits, like Piwik does.
+
+    :param reports: Decoded JSON reports of the same request for different
+        periods
+    :type reports: list
+    :rtype: dict or list
+    """
+    reports = [report for report in reports if report != []]
+    if not reports:
+        return []
+    if isinstance(reports[0], dict):
+        return merge_metrics(reports)
+    rows = {}
+    for report in reports:
+        for row in report:
+            rows.setdefault(row.get('label'), []).append(row)
+    merged = [merge_metrics(label_rows) for label_rows in rows.values()]
+    for key in ('nb_visits', 'nb_hits'):
+        if merged and all(_is_number(row.get(key)) for row in merged):
+            merged.sort(key=lambda row: row[key], reverse=True)
+            break
+    return merged
+
+
+def apply_limit(report, parameters):
+    """
+    Apply the filter_offset and filter_limit of a request to a merged list
+    of rows, like Piwik does
+
+    Reports of shorter periods must be merged in full, i.e. requested with
+    filter_limit=-1, as the rows beyond the limit of a single period can
+    rank high in the merged report.
+
+    :param report: Merged report
+    :type report: list or dict
+    :param parameters: Request parameters
+    :type parameters: dict
+    :rtype: list or dict
+    """
+    if not isinstance(report, list):
+        return report
+    offset = int(parameters.get('filter_offset') or 0)
+    limit = int(parameters.get('filter_limit', DEFAULT_LIMIT))
+    report = report[offset:]
+    if limit >= 0:
+        report = report[:limit]
+    return report
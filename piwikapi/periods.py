@@ -0,0 +1,116 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import datetime
+import re
+
+_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def get_period_end(period, date, today=None):
+    """
+    Return the last day covered by an analytics request's period and date
+    parameters, or None if they can't be parsed
+
+    Understands the day, week, month, year and range periods and the date
+    values today, now, yesterday, lastN, previousN, YYYY-MM-DD and ranges
+    of these separated by a comma.
+
+    :param period: Period parameter
+    :type period: str
+    :param date: Date parameter
+    :type date: str
+    :param today: The current date in the site's timezone, defaults to the
+        local date
+    :type today: datetime.date or None
+    :rtype: datetime.date or None
+    """
+    if today is None:
+        today = datetime.date.today()
+    date = ('%s' % date).split(',')[-1].strip()
+    if date in ('today', 'now') or date.startswith('last'):
+        day = today
+    elif date.startswith('yesterday'):
+        day = today - datetime.timedelta(days=1)
+    elif date.startswith('previous'):
+        start = get_period_start(period, today)
+        if start is None:
+            return None
+        day = start - datetime.timedelta(days=1)
+    else:
+        try:
+            day = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+        except ValueError:
+            return None
+    if period in ('day', 'range'):
+        return day
+    if period == 'week':
+        return day + datetime.timedelta(days=6 - day.weekday())
+    if period == 'month':
+        next_month = (day.replace(day=28) + datetime.timedelta(days=4))
+        return next_month - datetime.timedelta(days=next_month.day)
+    if period == 'year':
+        return day.replace(month=12, day=31)
+    return None
+
+
+def is_absolute_date(date):
+    """
+    Return True if a date parameter is made of YYYY-MM-DD dates only, i.e.
+    it means the same days tomorrow
+
+    :param date: Date parameter
+    :type date: str
+    :rtype: bool
+    """
+    return all(_DATE_RE.match(part.strip())
+               for part in ('%s' % date).split(','))
+
+
+def get_period_start(period, day):
+    """
+    Return the first day of the period that contains day
+
+    :param period: day, week, month or year
+    :type period: str
+    :param day: A day of the period
+    :type day: datetime.date
+    :rtype: datetime.date or None
+    """
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    if period == 'year':
+        return day.replace(month=1, day=1)
+    return None
+
+
+def is_closed_period(period, date, today=None):
+    """
+    Return True if the period lies fully in the past, i.e. its reports
+    don't change anymore once archived
+
+    :param period: Period parameter
+    :type period: str
+    :param date: Date parameter
+    :type date: str
+    :param today: The current date in the site's timezone, defaults to the
+        local date
+    :type today: datetime.date or None
+    :rtype: bool
+    """
+    end = get_period_end(period, date, today)
+    if end is None:
+        return False
+    if today is None:
+        today = datetime.date.today()
+    return end < today
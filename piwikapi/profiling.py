@@ -0,0 +1,200 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import threading
+import time
+
+
+class _NullTimer(object):
+    """
+    A timer that does nothing, used while profiling is disabled
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class _StageTimer(object):
+    """
+    Context manager that measures one stage and reports it to the profiler
+    """
+    __slots__ = ('profiler', 'stage', 'start')
+
+    def __init__(self, profiler, stage):
+        self.profiler = profiler
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add(self.stage, time.time() - self.start)
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class PiwikProfiler(object):
+    """
+    Aggregates the time spent in the stages of a tracking request
+
+    The tracker reports the stages ``init`` (tracker construction),
+    ``build`` (collecting the query variables), ``encode`` (JSON and URL
+    encoding), ``send`` (opening the connection) and ``read`` (reading the
+    response body). Profiling is disabled by default and costs next to
+    nothing in that state.
+
+    >>> from piwikapi.profiling import profiler
+    >>> with profiler.enabled():
+    ...     tracker.do_track_page_view('Title')
+    >>> profiler.get_stats()['send']['total']
+    """
+    #: The stages reported by the tracker, in order
+    STAGES = ('init', 'build', 'encode', 'send', 'read')
+
+    def __init__(self):
+        """
+        :rtype: None
+        """
+        self.active = False
+        self.hooks = []
+        self.lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        """
+        Start collecting timings
+
+        :rtype: None
+        """
+        self.active = True
+
+    def disable(self):
+        """
+        Stop collecting timings, the collected data is kept
+
+        :rtype: None
+        """
+        self.active = False
+
+    def enabled(self):
+        """
+        Return a context manager that enables profiling for its block
+
+        :rtype: context manager
+        """
+        return _ProfilingBlock(self)
+
+    def add_hook(self, hook):
+        """
+        Register a callable that gets called as ``hook(stage, seconds)`` for
+        every measured stage
+
+        :param hook: Callable
+        :type hook: callable
+        :rtype: None
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Unregister a hook
+
+        :param hook: Callable
+        :type hook: callable
+        :rtype: None
+        """
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def stage(self, name):
+        """
+        Return a context manager timing the stage ``name``
+
+        :param name: Stage name, see STAGES
+        :type name: str
+        :rtype: context manager
+        """
+        if not self.active:
+            return _NULL_TIMER
+        return _StageTimer(self, name)
+
+    def add(self, stage, seconds):
+        """
+        Record a measurement for a stage
+
+        :param stage: Stage name
+        :type stage: str
+        :param seconds: Elapsed time
+        :type seconds: float
+        :rtype: None
+        """
+        with self.lock:
+            stats = self.stats.get(stage)
+            if stats is None:
+                stats = self.stats[stage] = [0, 0.0, seconds]
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+        for hook in self.hooks:
+            hook(stage, seconds)
+
+    def get_stats(self):
+        """
+        Return the aggregated timings per stage
+
+        :rtype: dict of {str: {'count': int, 'total': float, 'mean': float,
+            'max': float}}
+        """
+        r = {}
+        with self.lock:
+            for stage, (count, total, maximum) in self.stats.items():
+                r[stage] = {
+                    'count': count,
+                    'total': total,
+                    'mean': total / count,
+                    'max': maximum,
+                }
+        return r
+
+    def reset(self):
+        """
+        Clear all collected timings
+
+        :rtype: None
+        """
+        with self.lock:
+            self.stats = {}
+
+
+class _ProfilingBlock(object):
+    """
+    Enables a profiler while the block runs
+    """
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.was_active = profiler.active
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self.profiler
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.active = self.was_active
+        return False
+
+
+#: The per-process profiler used by all trackers
+profiler = PiwikProfiler()
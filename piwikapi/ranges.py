@@ -0,0 +1,132 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import copy
+import datetime
+
+from .analytics import decode_json
+from .executor import AnalyticsExecutor
+from .metrics import apply_limit
+from .metrics import merge_reports
+from .periods import get_period_end
+
+
+def _parse_date(date):
+    if isinstance(date, datetime.date):
+        return date
+    return datetime.datetime.strptime(date, '%Y-%m-%d').date()
+
+
+class RangePlanner(object):
+    """
+    Fetches the report of a long date range as reports of months or days
+    and merges them locally
+
+    Piwik archives a range on demand, which is slow for long ranges. The
+    reports of whole months and days are archived anyway, so they are
+    fetched concurrently instead, and get cached for good by a
+    ResponseCache with an archive backend. Ratios are recomputed from the
+    merged metrics, metrics like unique visitors are None, see
+    piwikapi.metrics::
+
+        planner = RangePlanner(AnalyticsExecutor(max_workers=8))
+        pa.set_method('VisitsSummary.get')
+        report = planner.fetch(pa, '2012-01-01', '2012-12-31')
+    """
+    def __init__(self, executor=None, unit='month'):
+        """
+        :param executor: Executor for the sub-requests
+        :type executor: piwikapi.executor.AnalyticsExecutor or None
+        :param unit: Split into 'month' or 'day' reports
+        :type unit: str
+        :rtype: None
+        """
+        if unit not in ('month', 'day'):
+            raise ValueError("Unknown unit %s" % unit)
+        self.executor = executor or AnalyticsExecutor()
+        self.unit = unit
+
+    def plan(self, start, end):
+        """
+        Return the period and date parameters of the sub-requests
+
+        With the month unit incomplete months at the ends become ranges of
+        days.
+
+        :param start: First day
+        :type start: datetime.date or str
+        :param end: Last day
+        :type end: datetime.date or str
+        :rtype: list of tuples
+        """
+        start = _parse_date(start)
+        end = _parse_date(end)
+        one_day = datetime.timedelta(days=1)
+        periods = []
+        day = start
+        while day <= end:
+            if self.unit == 'day':
+                last = day
+            else:
+                last = min(get_period_end('month', day.isoformat()), end)
+            if last == day:
+                periods.append(('day', day.isoformat()))
+            elif day.day == 1 and last == get_period_end('month',
+                                                         day.isoformat()):
+                periods.append(('month', day.isoformat()))
+            else:
+                periods.append(('range', '%s,%s' % (day, last)))
+            day = last + one_day
+        return periods
+
+    def get_calls(self, analytics, start, end):
+        """
+        Return a copy of analytics for every sub-request
+
+        :param analytics: Configured request
+        :type analytics: PiwikAnalytics
+        :param start: First day
+        :type start: datetime.date or str
+        :param end: Last day
+        :type end: datetime.date or str
+        :rtype: list of PiwikAnalytics
+        """
+        calls = []
+        for period, date in self.plan(start, end):
+            call = copy.copy(analytics)
+            # Rows beyond the limit of one period can rank high in the
+            # merged report, fetch() applies the limit and offset
+            call.p = dict(analytics.p, period=period, date=date,
+                          format='json', filter_limit='-1')
+            call.p.pop('filter_offset', None)
+            calls.append(call)
+        return calls
+
+    def fetch(self, analytics, start=None, end=None):
+        """
+        Fetch the sub-requests and return the merged report
+
+        The sub-requests fetch all rows, the filter_offset and filter_limit
+        of analytics are applied to the merged rows.
+
+        :param analytics: Configured request, the period and date are
+            ignored
+        :type analytics: PiwikAnalytics
+        :param start: First day, defaults to the start of analytics' range
+        :type start: datetime.date, str or None
+        :param end: Last day, defaults to the end of analytics' range
+        :type end: datetime.date, str or None
+        :raises: APIError if Piwik returned an error
+        :rtype: dict or list
+        """
+        if start is None or end is None:
+            start, end = analytics.get_parameter('date').split(',')
+        bodies = self.executor.map(self.get_calls(analytics, start, end))
+        report = merge_reports([decode_json(body) for body in bodies])
+        return apply_limit(report, analytics.p)
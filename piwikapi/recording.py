@@ -0,0 +1,238 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import logging
+import sys
+import threading
+import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .bulk import TrackingHit
+from .bulk import send_bulk_request
+
+#: Query parameters that are never written to a recording
+SECRET_PARAMETERS = ('token_auth', )
+
+
+def strip_query(query, names=SECRET_PARAMETERS):
+    """
+    Remove parameters from a query string
+
+    :param query: Query string, with or without leading '?'
+    :type query: str
+    :param names: Names of the parameters to remove
+    :type names: tuple of str
+    :rtype: str
+    """
+    prefix = '?' if query.startswith('?') else ''
+    parts = [part for part in query.lstrip('?').split('&')
+             if part.split('=', 1)[0] not in names]
+    return prefix + '&'.join(parts)
+
+
+class RequestRecorder(object):
+    """
+    Appends tracking requests to a JSONL file, one JSON object per line
+
+    Each line contains the query string, the HTTP headers and the timestamp
+    of a hit. Lines are buffered and written in chunks. The auth token is
+    left out of the query, pass it to replay() instead.
+    """
+    def __init__(self, path, buffer_size=100):
+        """
+        :param path: Path of the JSONL file, it is appended to
+        :type path: str
+        :param buffer_size: Number of lines to buffer before writing
+        :type buffer_size: int
+        :rtype: None
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.lock = threading.Lock()
+
+    def record(self, hit):
+        """
+        Record a tracking hit
+
+        :param hit: The hit
+        :type hit: TrackingHit
+        :rtype: None
+        """
+        line = json.dumps({
+            'query': strip_query(hit.query),
+            'headers': hit.headers,
+            'timestamp': hit.timestamp,
+        })
+        with self.lock:
+            self.buffer.append(line)
+            if len(self.buffer) >= self.buffer_size:
+                self._write()
+
+    def flush(self):
+        """
+        Write all buffered lines to the file
+
+        :rtype: None
+        """
+        with self.lock:
+            self._write()
+
+    def close(self):
+        """
+        Flush the buffer, the recorder can still be used afterwards
+
+        :rtype: None
+        """
+        self.flush()
+
+    def _write(self):
+        if not self.buffer:
+            return
+        with open(self.path, 'a') as f:
+            f.write('\n'.join(self.buffer))
+            f.write('\n')
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def iter_recorded_hits(path):
+    """
+    Stream the hits stored in a JSONL file
+
+    :param path: Path of the JSONL file
+    :type path: str
+    :rtype: generator of TrackingHit
+    """
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            yield TrackingHit(data['query'], data.get('headers'),
+                              data.get('timestamp'))
+
+
+def replay(path, api_url, token_auth=False, parallelism=4, batch_size=100,
+           speed=None, timeout=None):
+    """
+    Send recorded hits to a Piwik install using bulk requests
+
+    The file is streamed, so only ``parallelism * 2`` batches are held in
+    memory at once.
+
+    :param path: Path of the JSONL file
+    :type path: str
+    :param api_url: Piwik tracking API URL, the piwik.php of the target
+    :type api_url: str
+    :param token_auth: Auth token for the bulk requests
+    :type token_auth: str or False
+    :param parallelism: Number of concurrent bulk requests
+    :type parallelism: int
+    :param batch_size: Number of hits per bulk request
+    :type batch_size: int
+    :param speed: Speed multiplier relative to the recorded timestamps,
+        e.g. 2 replays twice as fast as recorded. None replays as fast
+        as possible.
+    :type speed: float or None
+    :param timeout: Socket timeout in seconds
+    :type timeout: float or None
+    :rtype: dict with the number of sent and failed hits
+    """
+    batches = queue.Queue(parallelism * 2)
+    stats = {'sent': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            try:
+                send_bulk_request(api_url, batch, token_auth, timeout)
+                key = 'sent'
+            except Exception:
+                logging.exception("Replaying %d hits failed" % len(batch))
+                key = 'failed'
+            with lock:
+                stats[key] += len(batch)
+
+    workers = []
+    for i in range(parallelism):
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+        workers.append(t)
+
+    started = time.time()
+    first_timestamp = None
+    batch = []
+    for hit in iter_recorded_hits(path):
+        if speed and hit.timestamp is not None:
+            if first_timestamp is None:
+                first_timestamp = hit.timestamp
+            due = started + (hit.timestamp - first_timestamp) / speed
+            delay = due - time.time()
+            if delay > 0:
+                if batch:
+                    batches.put(batch)
+                    batch = []
+                time.sleep(delay)
+        batch.append(hit)
+        if len(batch) >= batch_size:
+            batches.put(batch)
+            batch = []
+    if batch:
+        batches.put(batch)
+    for t in workers:
+        batches.put(None)
+    for t in workers:
+        t.join()
+    return stats
+
+
+def main(argv=None):
+    """
+    Command line interface for replay()
+
+    ``python -m piwikapi.recording requests.jsonl http://example.com/piwik.php``
+    """
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Replay recorded Piwik tracking requests")
+    parser.add_argument('path', help="JSONL file with the recorded requests")
+    parser.add_argument('api_url', help="Piwik tracking API URL")
+    parser.add_argument('--token-auth', default=False)
+    parser.add_argument('--parallelism', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--speed', type=float, default=None,
+                        help="Speed multiplier, default is no pacing")
+    args = parser.parse_args(argv)
+    stats = replay(args.path, args.api_url, args.token_auth, args.parallelism,
+                   args.batch_size, args.speed)
+    print("Sent %(sent)d hits, %(failed)d failed" % stats)
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import datetime
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from .analytics import decode_json
+from .metrics import apply_limit
+from .metrics import merge_reports
+from .periods import get_period_end, get_period_start
+
+
+class RollupEngine(object):
+    """
+    Builds week, month and year reports from cached day reports
+
+    If the JSON reports of all days of a period are in the response cache,
+    the report of the period is merged from them instead of asking Piwik to
+    archive it. Only additive metrics are summed, metrics like
+    nb_uniq_visitors are None in rolled up reports, see piwikapi.metrics.
+
+    Piwik cuts reports of rows to filter_limit rows, so only day reports
+    requested with filter_limit=-1 are merged, or reports that are a dict
+    of metrics. The filter_offset and filter_limit of the request are
+    applied to the merged rows::
+
+        cache = ResponseCache(archive=DiskCache('/var/cache/piwik'))
+        rollup = RollupEngine(cache)
+        pa.set_cache(cache)
+        pa.set_rollup(rollup)
+    """
+    #: Periods that can be rolled up
+    PERIODS = ('week', 'month', 'year')
+
+    def __init__(self, cache):
+        """
+        :param cache: The cache with the day reports
+        :type cache: piwikapi.cache.ResponseCache
+        :rtype: None
+        """
+        self.cache = cache
+        self.rollups = 0
+        self.misses = 0
+
+    def get_days(self, period, date):
+        """
+        Return the days of a period, or None if it can't be rolled up
+
+        Dates like last7 or previous3 request several periods, Piwik returns
+        a report per period for them, so they aren't rolled up.
+
+        :param period: Period parameter
+        :type period: str
+        :param date: Date parameter
+        :type date: str
+        :rtype: list of datetime.date or None
+        """
+        date = '%s' % date
+        if period not in self.PERIODS or ',' in date or \
+                date.startswith(('last', 'previous')):
+            return None
+        end = get_period_end(period, date, self.cache.today())
+        if end is None:
+            return None
+        day = get_period_start(period, end)
+        days = []
+        while day <= end:
+            days.append(day)
+            day += datetime.timedelta(days=1)
+        return days
+
+    def get(self, api_url, parameters):
+        """
+        Return the rolled up JSON response body of a request, or None if a
+        day report is missing
+
+        :param api_url: Analytics API URL
+        :type api_url: str
+        :param parameters: Request parameters
+        :type parameters: dict
+        :rtype: bytes or None
+        """
+        if parameters.get('format') != 'json':
+            return None
+        days = self.get_days(parameters.get('period'),
+                             parameters.get('date'))
+        if days is None:
+            return None
+        parameters = dict(parameters)
+        offset = parameters.pop('filter_offset', None)
+        reports = []
+        for day in days:
+            report = self._get_day(api_url, dict(parameters, period='day',
+                                                 date=day.isoformat()))
+            if report is None:
+                self.misses += 1
+                return None
+            reports.append(report)
+        self.rollups += 1
+        if offset is not None:
+            parameters['filter_offset'] = offset
+        report = apply_limit(merge_reports(reports), parameters)
+        return json.dumps(report).encode('utf-8')
+
+    def _get_day(self, api_url, parameters):
+        """
+        Return the decoded, complete report of a day or None
+
+        :rtype: list, dict or None
+        """
+        body = self.cache.peek(api_url, dict(parameters, filter_limit='-1'))
+        if body is not None:
+            return decode_json(body)
+        body = self.cache.peek(api_url, parameters)
+        if body is None:
+            return None
+        report = decode_json(body)
+        # A dict of metrics isn't cut by filter_limit
+        return report if isinstance(report, dict) else None
+
+    def get_stats(self):
+        """
+        Return the number of rolled up reports and of reports with missing
+        days
+
+        :rtype: dict
+        """
+        return {
+            'rollups': self.rollups,
+            'misses': self.misses,
+        }
@@ -0,0 +1,384 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import logging
+import os
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .bulk import send_bulk_request
+from .sharding import get_ring
+from .sharding import is_connection_error
+
+
+class BaseSender(object):
+    """
+    Common code for senders that deliver tracking hits in bulk requests
+
+    Used as is it sends every hit right away in its own bulk request,
+    subclasses queue hits and send them in batches.
+
+    If several API URLs are given every batch is split by endpoint, see
+    piwikapi.sharding.HashRing. A batch that fails is retried once on the
+    endpoint that takes over.
+    """
+    def __init__(self, api_url, token_auth=False, batch_size=50,
+                 flush_interval=1.0, timeout=10):
+        """
+        :param api_url: Piwik tracking API URL, or several of them
+        :type api_url: str, list, dict or piwikapi.sharding.HashRing
+        :param token_auth: Auth token for the bulk requests
+        :type token_auth: str or False
+        :param batch_size: Maximum number of hits per bulk request
+        :type batch_size: int
+        :param flush_interval: Maximum seconds a hit waits before it is sent
+        :type flush_interval: float
+        :param timeout: Socket timeout in seconds
+        :type timeout: float
+        :rtype: None
+        """
+        self.api_url = api_url
+        self.ring = get_ring(api_url)
+        self.token_auth = token_auth
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.controller = None
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def set_controller(self, controller):
+        """
+        Let a controller tune the batch size and flush interval
+
+        :param controller: Controller, or None to keep the current values
+        :type controller: piwikapi.batching.AdaptiveBatchController or None
+        :rtype: None
+        """
+        if controller is not None:
+            controller.set_initial(self.batch_size, self.flush_interval)
+            self.batch_size = controller.get_batch_size()
+            self.flush_interval = controller.get_flush_interval()
+        self.controller = controller
+
+    def submit(self, hit):
+        """
+        Send a hit, return False if it had to be dropped
+
+        :param hit: The hit
+        :type hit: piwikapi.bulk.TrackingHit
+        :rtype: bool
+        """
+        self._send_batch([hit])
+        return True
+
+    def flush(self):
+        """
+        Send all queued hits, nothing is queued by this class
+
+        :rtype: None
+        """
+
+    def close(self):
+        """
+        Send the remaining hits
+
+        :rtype: None
+        """
+        self.flush()
+
+    def get_stats(self):
+        """
+        Return the number of sent, failed, dropped and queued hits
+
+        :rtype: dict
+        """
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'queued': self.get_queue_size(),
+        }
+
+    def get_queue_size(self):
+        """
+        :rtype: int
+        """
+        return 0
+
+    def _send_batch(self, batch):
+        """
+        Send a batch of hits, failures are logged and counted
+
+        :param batch: Hits
+        :type batch: list of TrackingHit
+        :rtype: None
+        """
+        if self.ring is None:
+            self._send_hits(self.api_url, batch)
+            return
+        for api_url, hits in self._split_batch(batch).items():
+            if self._send_hits(api_url, hits, failover=True):
+                continue
+            self.ring.mark_down(api_url)
+            for api_url, hits in self._split_batch(hits).items():
+                self._send_hits(api_url, hits)
+
+    def _record(self, api_url, hits, start, ok):
+        """
+        Report a sent batch to the controller and apply its decisions
+
+        :rtype: None
+        """
+        if self.controller is None:
+            return
+        self.controller.record(api_url, len(hits), time.time() - start, ok,
+                               self.get_queue_size())
+        self.batch_size = self.controller.get_batch_size()
+        self.flush_interval = self.controller.get_flush_interval()
+
+    def _split_batch(self, batch):
+        """
+        Group the hits of a batch by endpoint
+
+        :param batch: Hits
+        :type batch: list of TrackingHit
+        :rtype: dict
+        """
+        batches = {}
+        for hit in batch:
+            api_url = self.ring.get_node(hit.visitor_id)
+            batches.setdefault(api_url, []).append(hit)
+        return batches
+
+    def _send_hits(self, api_url, hits, failover=False):
+        """
+        Send hits to one endpoint, return False if they should be retried on
+        another endpoint
+
+        :param api_url: Piwik tracking API URL
+        :type api_url: str
+        :param hits: Hits
+        :type hits: list of TrackingHit
+        :param failover: Don't count or log a failure to reach the endpoint,
+            the hits are retried. HTTP errors are counted as failures.
+        :type failover: bool
+        :rtype: bool
+        """
+        start = time.time()
+        try:
+            send_bulk_request(api_url, hits, self.token_auth, self.timeout)
+            self.sent += len(hits)
+            self._record(api_url, hits, start, True)
+            return True
+        except Exception as e:
+            self._record(api_url, hits, start, False)
+            if failover and is_connection_error(e):
+                logging.warning("Sending %d tracking hits to %s failed, "
+                                "failing over" % (len(hits), api_url))
+                return False
+            logging.exception("Sending %d tracking hits failed" % len(hits))
+            self.failed += len(hits)
+            return True
+
+
+class BackgroundSender(BaseSender):
+    """
+    Sends tracking hits from a background thread using bulk requests
+
+    Hits are collected until ``batch_size`` hits are queued or
+    ``flush_interval`` seconds have passed since the first queued hit. When
+    the queue is full new hits are dropped instead of blocking the caller.
+
+    The thread is started on the first submit() and restarted after a fork,
+    so a sender can be created at import time of a preforking server.
+    """
+    def __init__(self, api_url, token_auth=False, batch_size=50,
+                 flush_interval=1.0, max_queue_size=10000, timeout=10):
+        """
+        :param max_queue_size: Maximum number of queued hits, see BaseSender
+            for the other parameters
+        :type max_queue_size: int
+        :rtype: None
+        """
+        super(BackgroundSender, self).__init__(api_url, token_auth,
+                                               batch_size, flush_interval,
+                                               timeout)
+        self.max_queue_size = max_queue_size
+        self.pid = None
+        self.queue = None
+        self.thread = None
+
+    def _ensure_thread(self):
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            if self.pid != os.getpid():
+                self.queue = queue.Queue(self.max_queue_size)
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def submit(self, hit):
+        """
+        Queue a hit without blocking, return False if it had to be dropped
+
+        :param hit: The hit
+        :type hit: piwikapi.bulk.TrackingHit
+        :rtype: bool
+        """
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait(hit)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """
+        Block until all queued hits have been sent
+
+        :rtype: None
+        """
+        if self.queue is not None and self.pid == os.getpid():
+            self.queue.join()
+
+    def get_queue_size(self):
+        """
+        :rtype: int
+        """
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def _run(self):
+        q = self.queue
+        while True:
+            batch = [q.get()]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._send_batch(batch)
+            except Exception:
+                logging.exception("Sending %d tracking hits failed" %
+                                  len(batch))
+                self.failed += len(batch)
+            finally:
+                for hit in batch:
+                    q.task_done()
+
+
+class BufferedSender(BaseSender):
+    """
+    Collects tracking hits in memory and sends them in bulk when asked to
+
+    Unlike BackgroundSender no thread is used, the owner calls
+    flush_if_due() at a convenient time, e.g. after a response was
+    returned. Hits buffered before a fork are discarded in the child.
+    """
+    def __init__(self, api_url, token_auth=False, batch_size=50,
+                 flush_interval=5.0, max_buffer_size=10000, timeout=10):
+        """
+        :param max_buffer_size: Maximum number of buffered hits, see
+            BaseSender for the other parameters
+        :type max_buffer_size: int
+        :rtype: None
+        """
+        super(BufferedSender, self).__init__(api_url, token_auth, batch_size,
+                                             flush_interval, timeout)
+        self.max_buffer_size = max_buffer_size
+        self.buffer = []
+        self.flushing = 0
+        self.first_hit = None
+
+    def _check_pid(self):
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.buffer = []
+            self.first_hit = None
+
+    def submit(self, hit):
+        """
+        Buffer a hit, return False if it had to be dropped
+
+        :param hit: The hit
+        :type hit: piwikapi.bulk.TrackingHit
+        :rtype: bool
+        """
+        with self.lock:
+            self._check_pid()
+            if len(self.buffer) >= self.max_buffer_size:
+                self.dropped += 1
+                return False
+            if not self.buffer:
+                self.first_hit = time.time()
+            self.buffer.append(hit)
+        return True
+
+    def is_due(self):
+        """
+        Return True if a full batch is buffered or the oldest hit waited
+        longer than flush_interval
+
+        :rtype: bool
+        """
+        if not self.buffer:
+            return False
+        return len(self.buffer) >= self.batch_size or \
+            time.time() - self.first_hit >= self.flush_interval
+
+    def flush_if_due(self):
+        """
+        Send the buffered hits if is_due()
+
+        :rtype: None
+        """
+        if self.is_due():
+            self.flush()
+
+    def flush(self):
+        """
+        Send all buffered hits in batches of batch_size
+
+        :rtype: None
+        """
+        with self.lock:
+            self._check_pid()
+            buffer = self.buffer
+            self.buffer = []
+            self.first_hit = None
+        while buffer:
+            # The controller may change the batch size after every batch
+            batch_size = self.batch_size
+            batch, buffer = buffer[:batch_size], buffer[batch_size:]
+            self.flushing = len(buffer)
+            self._send_batch(batch)
+        self.flushing = 0
+
+    def get_queue_size(self):
+        """
+        :rtype: int
+        """
+        return len(self.buffer) + self.flushing
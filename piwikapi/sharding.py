@@ -0,0 +1,190 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import bisect
+import numbers
+import socket
+import threading
+import time
+from hashlib import md5
+try:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    from urllib2 import urlopen, HTTPError, URLError
+
+
+def is_connection_error(error):
+    """
+    Return True if an endpoint couldn't be reached, as opposed to an HTTP
+    error response of a reachable endpoint
+
+    :param error: Exception of a request
+    :type error: Exception
+    :rtype: bool
+    """
+    if isinstance(error, HTTPError):
+        return False
+    return isinstance(error, (URLError, socket.error, socket.timeout))
+
+
+class HashRing(object):
+    """
+    Routes tracking hits to one of several Piwik tracking endpoints by
+    consistent hashing of the visitor ID
+
+    All hits of a visitor go to the same endpoint as long as it is healthy.
+    An endpoint that failed is skipped for ``retry_after`` seconds, only the
+    visitors of that endpoint move to the next one on the ring meanwhile.
+
+    >>> ring = HashRing({'http://a.example.com/piwik.php': 2,
+    ...                  'http://b.example.com/piwik.php': 1})
+    >>> tracker.set_api_url(ring)
+    """
+    def __init__(self, nodes, replicas=100, retry_after=30):
+        """
+        :param nodes: Endpoint URLs, or a dict of URLs and positive integer
+            weights
+        :type nodes: list of str or dict
+        :raises: ValueError if there are no endpoints or a weight is invalid
+        :param replicas: Points on the ring per unit of weight
+        :type replicas: int
+        :param retry_after: Seconds an endpoint is skipped after a failure
+        :type retry_after: float
+        :rtype: None
+        """
+        if not isinstance(nodes, dict):
+            nodes = dict((node, 1) for node in nodes)
+        if not nodes:
+            raise ValueError("HashRing needs at least one endpoint")
+        for node, weight in nodes.items():
+            if not isinstance(weight, numbers.Integral) or \
+                    isinstance(weight, bool) or weight < 1:
+                raise ValueError("Invalid weight %r of %s, weights must be "
+                                 "positive integers" % (weight, node))
+        self.weights = nodes
+        self.replicas = replicas
+        self.retry_after = retry_after
+        self.down = {}
+        self.lock = threading.Lock()
+        points = []
+        for node, weight in nodes.items():
+            for i in range(replicas * weight):
+                points.append((self._hash('%s#%d' % (node, i)), node))
+        points.sort()
+        self.points = [point for point, node in points]
+        self.point_nodes = [node for point, node in points]
+
+    def _hash(self, key):
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        return int(md5(key).hexdigest()[:16], 16)
+
+    def get_nodes(self):
+        """
+        Return all endpoints
+
+        :rtype: list of str
+        """
+        return sorted(self.weights)
+
+    def get_node(self, key):
+        """
+        Return the endpoint for a key, e.g. a visitor ID
+
+        If all endpoints are down the one the key belongs to is returned.
+
+        :param key: Key
+        :type key: str
+        :rtype: str
+        """
+        count = len(self.points)
+        start = bisect.bisect(self.points, self._hash(key or '')) % count
+        if not self.down:
+            return self.point_nodes[start]
+        for i in range(count):
+            node = self.point_nodes[(start + i) % count]
+            if self.is_healthy(node):
+                return node
+        return self.point_nodes[start]
+
+    def is_healthy(self, node):
+        """
+        :param node: Endpoint URL
+        :type node: str
+        :rtype: bool
+        """
+        until = self.down.get(node)
+        if until is None:
+            return True
+        if until <= time.time():
+            # Try again, the next failure marks it down again
+            self.mark_up(node)
+            return True
+        return False
+
+    def mark_down(self, node):
+        """
+        Skip an endpoint for retry_after seconds
+
+        :param node: Endpoint URL
+        :type node: str
+        :rtype: None
+        """
+        with self.lock:
+            self.down[node] = time.time() + self.retry_after
+
+    def mark_up(self, node):
+        """
+        Use an endpoint again
+
+        :param node: Endpoint URL
+        :type node: str
+        :rtype: None
+        """
+        with self.lock:
+            self.down.pop(node, None)
+
+    def check_health(self, timeout=5):
+        """
+        Request every endpoint and mark it up or down, return the result
+
+        piwik.php answers a request without parameters with a short notice,
+        any error marks the endpoint down.
+
+        :param timeout: Socket timeout in seconds
+        :type timeout: float
+        :rtype: dict
+        """
+        result = {}
+        for node in self.get_nodes():
+            try:
+                urlopen(node, timeout=timeout).read()
+                self.mark_up(node)
+                result[node] = True
+            except Exception:
+                self.mark_down(node)
+                result[node] = False
+        return result
+
+
+def get_ring(api_url):
+    """
+    Return a HashRing for a list or dict of API URLs, or None for a single
+    URL
+
+    :param api_url: API URL(s)
+    :type api_url: str, list, dict or HashRing
+    :rtype: HashRing or None
+    """
+    if isinstance(api_url, HashRing):
+        return api_url
+    if isinstance(api_url, (list, tuple, dict)):
+        return HashRing(api_url)
+    return None
@@ -0,0 +1,146 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import logging
+import threading
+
+
+class _Call(object):
+    """
+    A call in flight, its result is shared with all waiting threads
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent identical calls
+
+    The first thread that calls do() with a key runs the function, the
+    threads that call do() with the same key meanwhile wait for it and get
+    the same result, or exception::
+
+        flight = SingleFlight()
+        body = flight.do(key, fetch)
+
+    Nothing is kept once a call completed, combine it with a ResponseCache
+    for that.
+    """
+    def __init__(self, timeout=None):
+        """
+        :param timeout: Seconds a waiting thread waits for the result, None
+            to wait as long as it takes
+        :type timeout: float or None
+        :rtype: None
+        """
+        self.timeout = timeout
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, function):
+        """
+        Run the function unless a call with the same key is in flight,
+        return its result
+
+        :param key: Key of the call, e.g. from piwikapi.cache.get_request_key
+        :type key: str
+        :param function: Function without arguments
+        :type function: callable
+        :raises: The exception of the function
+        :raises: RuntimeError if the timeout elapsed
+        :rtype: object
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            if not call.done.wait(self.timeout):
+                raise RuntimeError("Timed out waiting for %s" % key)
+            if call.error is not None:
+                raise call.error
+            return call.result
+        return self._run(key, call, function)
+
+    def _run(self, key, call, function):
+        """
+        Run the function of a call, pass the result to the waiting threads
+
+        :rtype: object
+        """
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def is_in_flight(self, key):
+        """
+        :param key: Key of the call
+        :type key: str
+        :rtype: bool
+        """
+        with self.lock:
+            return key in self.calls
+
+    def start(self, key, function):
+        """
+        Run the function in a background thread unless a call with the same
+        key is in flight, errors are logged
+
+        :param key: Key of the call
+        :type key: str
+        :param function: Function without arguments
+        :type function: callable
+        :returns: True if a thread was started
+        :rtype: bool
+        """
+        with self.lock:
+            if key in self.calls:
+                return False
+            call = self.calls[key] = _Call()
+            self.executed += 1
+
+        def run():
+            try:
+                self._run(key, call, function)
+            except Exception:
+                logging.exception("Background call %s failed" % key)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def get_stats(self):
+        """
+        Return the number of calls run and the number of callers that got
+        the result of another caller
+
+        :rtype: dict
+        """
+        return {
+            'executed': self.executed,
+            'shared': self.shared,
+        }
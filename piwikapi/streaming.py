@@ -0,0 +1,167 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import codecs
+import re
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+#: Complete strings, brackets, or runs of anything else
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]|[^"\[\]{}]+',
+                    re.DOTALL)
+
+#: Characters that may continue a number, '' is the end of the buffer
+_NUMBER_CHARS = ('', '.', 'e', 'E', '+', '-') + tuple('0123456789')
+
+
+class JSONStream(object):
+    """
+    Decodes the members of a JSON array or object one by one from a file
+    like object, e.g. an HTTP response
+
+    Only the current member and one chunk are held in memory, so the memory
+    use doesn't grow with the size of the document::
+
+        for row in JSONStream(urlopen(url)):
+            ...
+
+    Arrays yield their values, objects (key, value) tuples.
+    """
+    def __init__(self, fileobj, chunk_size=65536, encoding='utf-8'):
+        """
+        :param fileobj: Source of the JSON document
+        :type fileobj: file like object with a read(size) method
+        :param chunk_size: Bytes read at once
+        :type chunk_size: int
+        :param encoding: Encoding of the document
+        :type encoding: str
+        :rtype: None
+        """
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.is_object = None
+
+    def _read(self):
+        """
+        Append the next chunk to the buffer, return False at the end
+
+        :rtype: bool
+        """
+        if self.eof:
+            return False
+        data = self.fileobj.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(b'',
+                                                                       True)
+        else:
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(data)
+        self.pos = 0
+        return True
+
+    def _next_char(self):
+        """
+        Skip whitespace, return the next character without consuming it, or
+        None at the end
+
+        :rtype: str or None
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return None
+
+    def _expect(self, chars):
+        char = self._next_char()
+        if char is None or char not in chars:
+            raise ValueError("Expected %s at offset %d, got %r" %
+                             (' or '.join(chars), self.pos, char))
+        self.pos += 1
+        return char
+
+    def _decode_value(self):
+        """
+        Decode the next JSON value, reading more data while it's incomplete
+
+        :rtype: object
+        """
+        if self._next_char() in ('"', '[', '{'):
+            self._read_member()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self._read():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next one
+            if isinstance(value, (int, float)) and \
+                    self.buffer[end:end + 1] in _NUMBER_CHARS and \
+                    self._read():
+                continue
+            self.pos = end
+            return value
+
+    def _read_member(self):
+        """
+        Read until the string, array or object at the current position is
+        complete, so that it's decoded once instead of once per chunk
+
+        Strings are skipped as a whole and only brackets are counted, the
+        buffer is scanned once. Malformed documents are left to the decoder.
+
+        :rtype: None
+        """
+        offset = 0
+        depth = 0
+        while True:
+            match = _TOKEN.match(self.buffer, self.pos + offset)
+            if match is None:
+                # The end of the buffer, or a string that continues
+                if not self._read():
+                    return
+                continue
+            token = match.group()
+            if token in ('[', '{'):
+                depth += 1
+            elif token in (']', '}'):
+                depth -= 1
+            offset = match.end() - self.pos
+            if depth <= 0:
+                return
+
+    def __iter__(self):
+        start = self._expect('[{')
+        self.is_object = start == '{'
+        close = '}' if self.is_object else ']'
+        if self._next_char() == close:
+            self.pos += 1
+            return
+        while True:
+            if self.is_object:
+                key = self._decode_value()
+                self._expect(':')
+                yield key, self._decode_value()
+            else:
+                yield self._decode_value()
+            if self._expect(',' + close) == close:
+                return
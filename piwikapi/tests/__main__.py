@@ -1,16 +1,44 @@
+import sys
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
 
+from analytics import AnalyticsBulkTestCase
+from analytics import AnalyticsCacheTestCase
 from analytics import AnalyticsClassTestCase
 from analytics import AnalyticsTestCase
 from analytics import AnalyticsLiveTestCase
+from analytics import AnalyticsPagingTestCase
+from batching import AdaptiveBatchControllerTestCase
+from bots import BotFilterTestCase
+from cache import LRUCacheTestCase
+from columns import ColumnsTestCase
+from dedup import DeduplicatorThreadingTestCase
+from dedup import PageViewDeduplicatorTestCase
+from djangoapp import DjangoMiddlewareTestCase
+from ecommerce import TrackerEcommerceClassTestCase
 from ecommerce import TrackerEcommerceVerifyTestCase
+from executor import AnalyticsExecutorTestCase
 from goals import GoalsTestCase
+from ranges import RangePlannerTestCase
+from recording import RecordingTestCase
+from rollup import RollupEngineTestCase
+from senders import BackgroundSenderTestCase
+from sharding import HashRingTestCase
+from singleflight import SingleFlightTestCase
+from streaming import JSONStreamTestCase
 from tracking import TrackerClassTestCase
+from tracking import TrackerCookieTestCase
+from tracking import TrackerProfilingTestCase
+from tracking import TrackerThreadingTestCase
 from tracking import TrackerVerifyDebugTestCase
 from tracking import TrackerVerifyTestCase
+from wsgi import WSGIMiddlewareTestCase
+if sys.version_info >= (3, 5):
+    from asgi import ASGIMiddlewareTestCase
+    from asgi import AsyncSenderTestCase
+    from asyncexecutor import AsyncAnalyticsExecutorTestCase
 
 
 if __name__ == '__main__':
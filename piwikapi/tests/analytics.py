@@ -1,13 +1,30 @@
+import datetime
 import imghdr
+import shutil
+import tempfile
+import threading
 try:
     import json
 except ImportError:
     import simplejson as json
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
 
+from piwikapi.cache import DiskCache
+from piwikapi.cache import LRUCache
+from piwikapi.cache import ResponseCache
+from piwikapi.exceptions import APIError
 from piwikapi.exceptions import ConfigurationError
 from piwikapi.analytics import PiwikAnalytics
+from piwikapi.analytics import PiwikBulkAnalytics
+from piwikapi.periods import get_period_end
+from piwikapi.periods import is_absolute_date
+from piwikapi.periods import is_closed_period
 
 from base import PiwikAPITestCase
+from server import FakePiwikServer
 
 
 class AnalyticsBaseTestCase(PiwikAPITestCase):
@@ -38,6 +55,292 @@ class AnalyticsClassTestCase(PiwikAPITestCase):
         self.assertFalse(invalid_config)
 
 
+class AnalyticsCacheTestCase(PiwikAPITestCase):
+    """
+    Response cache tests, against a local fake server
+    """
+    def setUp(self):
+        super(AnalyticsCacheTestCase, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def get_analytics(self, api_url, cache, method='VisitsSummary.get'):
+        a = PiwikAnalytics()
+        a.set_api_url(api_url)
+        a.set_cache(cache)
+        a.set_method(method)
+        a.set_id_site(1)
+        a.set_period('day')
+        a.set_date('2013-01-01')
+        return a
+
+    def test_key_is_canonical(self):
+        cache = ResponseCache()
+        self.assertEqual(
+            cache.get_key('http://a/', {'idSite': 1, 'period': 'day'}),
+            cache.get_key('http://a/', {'period': 'day', 'idSite': '1'}),
+        )
+        self.assertNotEqual(
+            cache.get_key('http://a/', {'idSite': 1}),
+            cache.get_key('http://b/', {'idSite': 1}),
+        )
+        self.assertNotEqual(
+            cache.get_key('http://a/', {'segment': 'browserCode==FF&b=c'}),
+            cache.get_key('http://a/', {'segment': 'browserCode==FF',
+                                        'b': 'c'}),
+        )
+
+    def test_cached_request(self):
+        cache = ResponseCache(method_ttls={'Live.getCounters': 0})
+        with FakePiwikServer(b'{"nb_visits": 1}') as server:
+            for i in range(3):
+                a = self.get_analytics(server.url, cache)
+                self.assertEqual(b'{"nb_visits": 1}', a.send_request())
+            a.set_date('2013-01-02')
+            a.send_request()
+            for i in range(2):
+                self.get_analytics(server.url, cache,
+                                   'Live.getCounters').send_request()
+        self.assertEqual(4, len(server.requests))
+        self.assertEqual({'hits': 2, 'misses': 2, 'stale': 0},
+                         cache.get_stats())
+
+    def test_errors_not_cached(self):
+        cache = ResponseCache(ttl=300)
+        error = b'{"result":"error","message":"Archiving timed out"}'
+        with FakePiwikServer(error) as server:
+            a = self.get_analytics(server.url, cache)
+            a.set_date('today')
+            a.send_request()
+            server.response = b'[]'
+            self.assertEqual(b'[]', a.send_request())
+            self.assertEqual(b'[]', a.send_request())
+        self.assertEqual(2, len(server.requests))
+
+    def test_disk_cache(self):
+        cache = DiskCache(self.tmp, max_size=10)
+        cache.set('a', b'body')
+        cache.set('b', b'gone', ttl=-1)
+        self.assertEqual(b'body', DiskCache(self.tmp).get('a'))
+        self.assertEqual(None, cache.get('b'))
+        for i in range(20):
+            cache.set('key%d' % i, i)
+        self.assertTrue(len(cache) <= 10)
+        self.assertEqual(19, cache.get('key19'))
+        cache.clear()
+        self.assertEqual(None, cache.get('key19'))
+        self.assertEqual(0, len(cache))
+
+    def test_closed_periods(self):
+        today = datetime.date(2013, 3, 13)  # A Wednesday
+        for period, date in (('day', 'yesterday'),
+                             ('day', '2013-03-12'),
+                             ('week', 'previous1'),
+                             ('week', '2013-03-10'),
+                             ('month', '2013-02-28'),
+                             ('month', 'previous3'),
+                             ('range', '2013-01-01,2013-03-12'),
+                             ('day', 'last7,yesterday')):
+            self.assertTrue(is_closed_period(period, date, today),
+                            (period, date))
+        for period, date in (('day', 'today'),
+                             ('day', 'last7'),
+                             ('week', 'yesterday'),
+                             ('week', '2013-03-11'),
+                             ('month', '2013-03-01'),
+                             ('year', 'previous1,today'),
+                             ('range', '2013-01-01,today'),
+                             ('day', 'tomorrow'),
+                             ('decade', '2012-01-01')):
+            self.assertFalse(is_closed_period(period, date, today),
+                             (period, date))
+        self.assertEqual(datetime.date(2013, 3, 17),
+                         get_period_end('week', 'today', today))
+        self.assertEqual(datetime.date(2012, 2, 29),
+                         get_period_end('month', '2012-02-01', today))
+
+    def test_archive(self):
+        archive = DiskCache(self.tmp, compress=True)
+        cache = ResponseCache(LRUCache(ttl=300), archive=archive,
+                              today_ttl=10)
+        with FakePiwikServer(b'[]') as server:
+            for i in range(2):
+                self.get_analytics(server.url, cache).send_request()
+                a = self.get_analytics(server.url, cache)
+                a.set_date('today')
+                a.send_request()
+        self.assertEqual(2, len(server.requests))
+        self.assertEqual(1, len(archive))
+        self.assertEqual(1, len(cache.backend))
+        self.assertEqual(10, cache.get_ttl({'period': 'day',
+                                            'date': 'today'}))
+        self.assertEqual(None, cache.get_ttl({'period': 'day',
+                                              'date': '2013-01-01'}))
+
+    def test_errors_not_archived(self):
+        archive = LRUCache()
+        cache = ResponseCache(archive=archive)
+        error = b'{"result":"error","message":"Archiving timed out"}'
+        with FakePiwikServer(error) as server:
+            a = self.get_analytics(server.url, cache)
+            self.assertEqual(error, a.send_request())
+            a.set_format('xml')
+            server.response = b'<?xml version="1.0" encoding="utf-8" ?>\n' \
+                b'<result>\n\t<error message="Archiving timed out" />\n' \
+                b'</result>'
+            a.send_request()
+            server.response = b'[]'
+            self.assertEqual(b'[]', a.send_request())
+        self.assertEqual(3, len(server.requests))
+        self.assertEqual(1, len(archive))
+
+    def test_relative_dates_not_archived(self):
+        cache = ResponseCache(ttl=300, archive=LRUCache(), today_ttl=10,
+                              today=lambda: datetime.date(2013, 3, 13))
+        for date in ('yesterday', 'previous7', '2013-03-01,yesterday'):
+            self.assertEqual(300, cache.get_ttl({'period': 'day',
+                                                 'date': date}), date)
+        self.assertEqual(None, cache.get_ttl({
+            'period': 'range', 'date': '2013-03-01,2013-03-12'}))
+        # Still today in the timezone of the site
+        self.assertEqual(10, cache.get_ttl({'period': 'day',
+                                            'date': '2013-03-13'}))
+        self.assertTrue(is_absolute_date('2013-03-01, 2013-03-12'))
+        self.assertFalse(is_absolute_date('last7'))
+
+    def test_concurrent_stats(self):
+        cache = ResponseCache()
+        parameters = {'idSite': 1, 'period': 'day', 'date': '2013-01-01'}
+        cache.set('http://a/', parameters, b'[]')
+
+        def run():
+            for i in range(1000):
+                cache.get('http://a/', parameters)
+                cache.get_entry('http://a/', {'idSite': 2})
+
+        threads = [threading.Thread(target=run) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({'hits': 8000, 'misses': 8000, 'stale': 0},
+                         cache.get_stats())
+
+    def test_disk_response_cache(self):
+        with FakePiwikServer(b'[]') as server:
+            for i in range(2):
+                cache = ResponseCache(DiskCache(self.tmp))
+                self.get_analytics(server.url, cache).send_request()
+        self.assertEqual(1, len(server.requests))
+
+
+def echo_bulk_request(handler, body):
+    """
+    Fake API.getBulkRequest, returns the parameters of every call
+    """
+    params = parse_qs(body)
+    results = []
+    while 'urls[%d]' % len(results) in params:
+        query = params['urls[%d]' % len(results)][0]
+        results.append(dict((k, v[0]) for k, v in parse_qs(query).items()))
+    return json.dumps(results).encode('utf-8')
+
+
+def get_report(count):
+    """
+    Fake report with count rows that honours filter_offset and filter_limit
+    """
+    def report(handler, body):
+        params = parse_qs(handler.path.split('?', 1)[1])
+        offset = int(params['filter_offset'][0])
+        limit = int(params['filter_limit'][0])
+        rows = [{'label': i} for i in range(count)][offset:offset + limit]
+        return json.dumps(rows).encode('utf-8')
+    return report
+
+
+class AnalyticsPagingTestCase(PiwikAPITestCase):
+    """
+    Pagination tests, against a local fake server
+    """
+    def get_pages(self, count, page_size, prefetch=False):
+        with FakePiwikServer(get_report(count)) as server:
+            a = PiwikAnalytics()
+            a.set_api_url(server.url)
+            a.set_method('Actions.getPageUrls')
+            a.set_parameter('flat', 1)
+            pages = list(a.iter_pages(page_size, prefetch))
+        self.assertEqual(None, a.get_parameter('filter_offset'))
+        return server, pages
+
+    def test_pages(self):
+        for prefetch in (False, True):
+            server, pages = self.get_pages(250, 100, prefetch)
+            self.assertEqual([100, 100, 50], [len(page) for page in pages])
+            self.assertEqual(list(range(250)),
+                             [row['label'] for page in pages for row in page])
+            self.assertEqual(3, len(server.requests))
+
+    def test_last_page_full(self):
+        server, pages = self.get_pages(200, 100, True)
+        self.assertEqual([100, 100, 0], [len(page) for page in pages])
+
+    def test_error(self):
+        error = b'{"result": "error", "message": "No access"}'
+        with FakePiwikServer(error) as server:
+            a = PiwikAnalytics()
+            a.set_api_url(server.url)
+            self.assertRaises(APIError, list, a.iter_pages(prefetch=True))
+
+
+class AnalyticsBulkTestCase(PiwikAPITestCase):
+    """
+    Bulk analytics tests, against a local fake server
+    """
+    def test_bulk_request(self):
+        with FakePiwikServer(echo_bulk_request) as server:
+            bulk = PiwikBulkAnalytics(server.url, token_auth='TOKEN',
+                                      max_urls=4)
+            for i in range(10):
+                a = PiwikAnalytics()
+                a.set_method('VisitsSummary.get')
+                a.set_id_site(i)
+                a.set_format('xml')
+                self.assertEqual(i, bulk.add(a))
+            bulk.add({'method': 'API.getPiwikVersion'})
+            results = bulk.send_request()
+        self.assertEqual(3, len(server.requests))
+        self.assertEqual(11, len(results))
+        for i in range(10):
+            self.assertEqual(str(i), results[i]['idSite'])
+            self.assertFalse('format' in results[i])
+        self.assertEqual('API.getPiwikVersion', results[10]['method'])
+        body = parse_qs(server.requests[0][3])
+        self.assertEqual(['API.getBulkRequest'], body['method'])
+        self.assertEqual(['TOKEN'], body['token_auth'])
+        self.assertEqual([], bulk.queries)
+
+    def test_size_limit(self):
+        bulk = PiwikBulkAnalytics('http://a/', max_size=100)
+        for i in range(5):
+            bulk.add({'segment': 'x' * 40, 'n': i})
+        self.assertEqual([1, 1, 1, 1, 1],
+                         [len(chunk) for chunk in bulk.get_chunks()])
+
+    def test_size_limit_encoded(self):
+        bulk = PiwikBulkAnalytics('http://a/', max_size=300)
+        for i in range(10):
+            bulk.add({'segment': 'browserCode==FF;country==de', 'n': i})
+        chunks = bulk.get_chunks()
+        self.assertTrue(len(chunks) > 1)
+        for chunk in chunks:
+            body = bulk.get_request_body(chunk)
+            calls = body[body.index('urls'):]
+            self.assertTrue(len(calls) <= 300, len(calls))
+
+
 class AnalyticsTestCase(AnalyticsBaseTestCase):
     """
     Generic analytics API tests
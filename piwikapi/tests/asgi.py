@@ -0,0 +1,140 @@
+import asyncio
+
+from piwikapi.asgi import AsyncSender
+from piwikapi.asgi import PiwikASGIMiddleware
+from piwikapi.asgi import get_scope_meta
+from piwikapi.bulk import TrackingHit
+
+from base import PiwikAPITestCase
+from senders import ListSender
+
+
+async def app(scope, receive, send):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/plain'),
+                    (b'x-piwik-title', b'ASGI page')],
+    })
+    await send({'type': 'http.response.body', 'body': b'Hel',
+                'more_body': True})
+    await send({'type': 'http.response.body', 'body': b'lo'})
+
+
+def get_scope(path='/page/'):
+    return {
+        'type': 'http',
+        'scheme': 'https',
+        'path': path,
+        'root_path': '',
+        'query_string': b'a=1',
+        'headers': [
+            (b'host', b'www.example.com:8000'),
+            (b'user-agent', b'Test UA'),
+            (b'accept-language', b'de'),
+            (b'referer', b'http://referer.example.com/'),
+            (b'cookie', b'foo=bar'),
+        ],
+        'client': ('192.0.2.9', 1234),
+        'server': ('127.0.0.1', 8000),
+    }
+
+
+class ASGIMiddlewareTestCase(PiwikAPITestCase):
+    """
+    PiwikASGIMiddleware tests, without Piwik interaction
+    """
+    def run_app(self, middleware, scope):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        async def send(message):
+            messages.append((message, len(self.sender.hits)))
+
+        self.loop.run_until_complete(middleware(scope, receive, send))
+        return messages
+
+    def setUp(self):
+        super(ASGIMiddlewareTestCase, self).setUp()
+        self.sender = ListSender()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_get_scope_meta(self):
+        meta = get_scope_meta(get_scope())
+        self.assertEqual('www.example.com', meta['SERVER_NAME'])
+        self.assertEqual('/page/', meta['PATH_INFO'])
+        self.assertEqual('a=1', meta['QUERY_STRING'])
+        self.assertEqual('Test UA', meta['HTTP_USER_AGENT'])
+        self.assertEqual('192.0.2.9', meta['REMOTE_ADDR'])
+
+    def test_tracked_after_body(self):
+        mw = PiwikASGIMiddleware(app, 1, 'http://example.com/piwik.php',
+                                 token_auth='token', sender=self.sender)
+        messages = self.run_app(mw, get_scope())
+        self.assertEqual([0, 0, 0], [n for m, n in messages],
+                         "Tracked before the body was sent")
+        self.assertFalse(b'x-piwik-title' in dict(messages[0][0]['headers']))
+        self.assertEqual(1, len(self.sender.hits))
+        query = self.sender.hits[0].query
+        self.assertTrue('action_name=ASGI+page' in query, query)
+        self.assertTrue('cip=192.0.2.9' in query, query)
+        self.assertTrue('https%3A%2F%2Fwww.example.com%2Fpage%2F%3Fa%3D1'
+                        in query, query)
+
+    def test_excluded_path(self):
+        mw = PiwikASGIMiddleware(app, 1, 'http://example.com/piwik.php',
+                                 sender=self.sender, exclude=[r'^/static/'])
+        self.run_app(mw, get_scope('/static/app.css'))
+        self.assertEqual([], self.sender.hits)
+
+
+class AsyncSenderTestCase(PiwikAPITestCase):
+    """
+    AsyncSender tests, the HTTP request is replaced
+    """
+    def setUp(self):
+        super(AsyncSenderTestCase, self).setUp()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_batches(self):
+        sender = AsyncSender('http://example.com/piwik.php', batch_size=4,
+                             flush_interval=0.05)
+        batches = []
+        sender._send_batch = batches.append
+
+        async def main():
+            for i in range(10):
+                self.assertTrue(sender.submit(TrackingHit('n=%d' % i)))
+            await sender.close()
+
+        self.loop.run_until_complete(main())
+        self.assertEqual([4, 4, 2], [len(b) for b in batches])
+
+    def test_failed_batch(self):
+        sender = AsyncSender('http://example.com/piwik.php', batch_size=2,
+                             flush_interval=0.05)
+        batches = []
+
+        def send_batch(batch):
+            batches.append(batch)
+            if len(batches) == 1:
+                raise IOError("Piwik is down")
+
+        sender._send_batch = send_batch
+
+        async def main():
+            for i in range(4):
+                sender.submit(TrackingHit('n=%d' % i))
+            await asyncio.wait_for(sender.close(), 5)
+
+        self.loop.run_until_complete(main())
+        self.assertEqual([2, 2], [len(b) for b in batches])
+        self.assertEqual(2, sender.get_stats()['failed'])
@@ -0,0 +1,60 @@
+import asyncio
+
+from piwikapi.asyncexecutor import AsyncAnalyticsExecutor
+
+from base import PiwikAPITestCase
+from executor import FakeCall
+
+
+class AsyncAnalyticsExecutorTestCase(PiwikAPITestCase):
+    """
+    asyncio fan-out executor tests, without Piwik interaction
+    """
+    def setUp(self):
+        super(AsyncAnalyticsExecutorTestCase, self).setUp()
+        FakeCall.reset()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def get_calls(self, count=20):
+        return [FakeCall('host%d' % (i % 2), i) for i in range(count)]
+
+    def test_map(self):
+        executor = AsyncAnalyticsExecutor(max_workers=8, max_per_host=3)
+        results = self.loop.run_until_complete(executor.map(self.get_calls()))
+        self.assertEqual(list(range(20)), results)
+        self.assertEqual(3, FakeCall.peak['host0'])
+        self.assertTrue(FakeCall.peak[None] <= 6)
+
+    def test_as_completed(self):
+        calls = self.get_calls(5)
+        calls[0].delay = 0.2
+        executor = AsyncAnalyticsExecutor(max_workers=5, max_per_host=5)
+
+        async def collect():
+            return [await f for f in executor.as_completed(calls)]
+
+        results = self.loop.run_until_complete(collect())
+        self.assertEqual((0, 0), results[-1])
+
+    def test_fail_fast(self):
+        calls = self.get_calls(20)
+        calls[0].error = True
+        executor = AsyncAnalyticsExecutor(max_workers=2, max_per_host=1)
+        self.assertRaises(ValueError, self.loop.run_until_complete,
+                          executor.map(calls))
+        self.assertFalse(calls[-1].called, "Calls not cancelled")
+        results = self.loop.run_until_complete(
+            executor.map(self.get_calls(4) + calls[:1], fail_fast=False))
+        self.assertTrue(isinstance(results[4], ValueError))
+
+    def test_context_manager(self):
+        async def run():
+            async with AsyncAnalyticsExecutor(max_workers=2) as executor:
+                return executor, await executor.map(self.get_calls(4))
+
+        executor, results = self.loop.run_until_complete(run())
+        self.assertEqual(list(range(4)), results)
+        self.assertRaises(RuntimeError, executor.pool.submit, int)
@@ -0,0 +1,72 @@
+from piwikapi.batching import AdaptiveBatchController
+from piwikapi.bulk import TrackingHit
+from piwikapi.senders import BufferedSender
+
+from base import PiwikAPITestCase
+from server import FakePiwikServer
+
+
+class AdaptiveBatchControllerTestCase(PiwikAPITestCase):
+    """
+    Adaptive batching tests, against a local fake server
+    """
+    def get_controller(self):
+        controller = AdaptiveBatchController(min_batch_size=10,
+                                             max_batch_size=100, step=10,
+                                             min_flush_interval=0.1,
+                                             max_flush_interval=4.0,
+                                             target_latency=0.5)
+        controller.set_initial(20, 1.0)
+        return controller
+
+    def test_backlog_grows_batches(self):
+        controller = self.get_controller()
+        for i in range(20):
+            controller.record('a', 20, 0.01, True, queue_size=1000)
+        self.assertEqual(100, controller.get_batch_size())
+        self.assertEqual(0.1, controller.get_flush_interval())
+
+    def test_slow_or_failing_shrinks_batches(self):
+        controller = self.get_controller()
+        controller.record('a', 20, 2.0, True, queue_size=1000)
+        self.assertEqual(10, controller.get_batch_size())
+        controller = self.get_controller()
+        controller.record('a', 20, 0.01, False, queue_size=1000)
+        self.assertEqual(10, controller.get_batch_size())
+        self.assertEqual(1.0, controller.get_metrics()['a']['error_rate'])
+
+    def test_low_traffic_flushes_sooner(self):
+        controller = self.get_controller()
+        controller.record('a', 1, 0.01, True)
+        self.assertEqual(20, controller.get_batch_size())
+        self.assertEqual(0.75, controller.get_flush_interval())
+
+    def test_per_endpoint(self):
+        controller = self.get_controller()
+        controller.record('a', 20, 0.01, True, queue_size=1000)
+        controller.record('b', 20, 2.0, True)
+        metrics = controller.get_metrics()
+        self.assertEqual(30, metrics['a']['batch_size'])
+        self.assertEqual(10, metrics['b']['batch_size'])
+        self.assertEqual(40, controller.get_batch_size())
+
+    def test_endpoints_share_max_batch_size(self):
+        controller = self.get_controller()
+        for i in range(20):
+            controller.record('a', 20, 0.01, True, queue_size=1000)
+            controller.record('b', 20, 0.01, True, queue_size=1000)
+        self.assertEqual(100, controller.get_metrics()['b']['batch_size'])
+        self.assertEqual(100, controller.get_batch_size())
+
+    def test_sender(self):
+        controller = self.get_controller()
+        with FakePiwikServer() as server:
+            sender = BufferedSender(server.url, batch_size=20)
+            sender.set_controller(controller)
+            for i in range(200):
+                sender.submit(TrackingHit('idsite=1&n=%d' % i))
+            sender.flush()
+        self.assertEqual(200, len(server.hits))
+        self.assertTrue(len(server.requests) < 10, "Batch size not adapted")
+        self.assertEqual(sender.batch_size, controller.get_batch_size())
+        self.assertTrue(controller.get_metrics()[server.url]['batches'] > 0)
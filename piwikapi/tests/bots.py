@@ -0,0 +1,75 @@
+from piwikapi.bots import BotFilter
+from piwikapi.tracking import PiwikTracker
+
+from tracking import TrackerBaseTestCase
+
+
+class BotFilterTestCase(TrackerBaseTestCase):
+    """
+    Bot filter tests, without Piwik interaction
+    """
+    def record(self, hit):
+        self.recorded.append(hit)
+
+    def test_default_patterns(self):
+        bots = BotFilter()
+        for ua in ('Mozilla/5.0 (compatible; Googlebot/2.1; '
+                   '+http://www.google.com/bot.html)',
+                   'Mozilla/5.0 (compatible; bingbot/2.0)',
+                   'Slackbot-LinkExpanding 1.0 '
+                   '(+https://api.slack.com/robots)',
+                   'Twitterbot/1.0',
+                   'python-requests/2.31.0',
+                   'curl/8.0.1'):
+            self.assertTrue(bots.is_bot(ua), ua)
+        self.assertFalse(bots.is_bot(self.get_random_ua()))
+        self.assertEqual({'passed': 1, 'dropped': 6}, bots.get_stats())
+
+    def test_browsers_pass(self):
+        bots = BotFilter()
+        for ua in ('Mozilla/5.0 (Linux; Android 9; CUBOT X19 '
+                   'Build/PPR1.180610.011) AppleWebKit/537.36 (KHTML, like '
+                   'Gecko) Chrome/74.0.3729.157 Mobile Safari/537.36',
+                   'Mozilla/5.0 (Linux; Android 10; CUBOT_NOTE_20) '
+                   'AppleWebKit/537.36 (KHTML, like Gecko) '
+                   'Chrome/88.0.4324.181 Mobile Safari/537.36',
+                   'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) '
+                   'AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 '
+                   'Mobile/15E148 Safari/604.1',
+                   'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+                   'AppleWebKit/537.36 (KHTML, like Gecko) '
+                   'Chrome/120.0.0.0 Safari/537.36',
+                   'Mozilla/5.0 (X11; Linux x86_64; rv:120.0) '
+                   'Gecko/20100101 Firefox/120.0',
+                   'Mozilla/5.0 (Linux; Android 13; SM-S911B) '
+                   'AppleWebKit/537.36 (KHTML, like Gecko) '
+                   'SamsungBrowser/23.0 Chrome/115.0.0.0 Mobile '
+                   'Safari/537.36',
+                   ''):
+            self.assertFalse(bots.is_bot(ua), ua)
+        self.assertTrue(BotFilter(block_empty=True).is_bot(''))
+
+    def test_update_patterns(self):
+        bots = BotFilter([], block_empty=False)
+        self.assertFalse(bots.is_bot(''))
+        self.assertFalse(bots.is_bot('MyMonitor/1.0'))
+        bots.add_patterns([r'^mymonitor/'])
+        self.assertTrue(bots.is_bot('MyMonitor/1.0'))
+        bots.set_patterns([r'other'])
+        self.assertFalse(bots.is_bot('MyMonitor/1.0'))
+
+    def test_tracker(self):
+        self.recorded = []
+        bots = BotFilter()
+        pt = PiwikTracker(1, self.request)
+        pt.set_api_url('http://example.com/piwik.php')
+        pt.set_recorder(self, send=False)
+        pt.set_bot_filter(bots)
+        pt.do_track_page_view('Title')
+        crawler = pt.for_request(self.request)
+        crawler.set_user_agent('Mozilla/5.0 (compatible; Googlebot/2.1)')
+        self.assertEqual('', crawler.do_track_page_view('Title'))
+        self.assertEqual('', crawler.do_track_action('http://example.com/',
+                                                     'link'))
+        self.assertEqual(1, len(self.recorded))
+        self.assertEqual({'passed': 1, 'dropped': 2}, bots.get_stats())
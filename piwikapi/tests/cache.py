@@ -0,0 +1,47 @@
+from piwikapi.cache import LRUCache
+from piwikapi.cache import VisitorIdCache
+from piwikapi.tracking import PiwikTracker
+
+from tracking import TrackerBaseTestCase
+
+
+class LRUCacheTestCase(TrackerBaseTestCase):
+    """
+    Cache tests, without Piwik interaction
+    """
+    def test_size_bound(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(None, cache.get('b'), "LRU entry not evicted")
+        self.assertEqual(2, len(cache))
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=-1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual('gone', cache.get('b', 'gone'))
+
+    def test_visitor_id_cache(self):
+        cache = VisitorIdCache(max_size=10, ttl=60)
+        first = PiwikTracker(1, self.request)
+        first.set_session_key('api-key-1', cache)
+        second = first.for_request(self.request)
+        self.assertNotEqual(first.visitor_id, second.visitor_id)
+        second.set_session_key('api-key-1', cache)
+        self.assertEqual(first.visitor_id, second.visitor_id)
+        third = first.for_request(self.request)
+        third.set_session_key('api-key-2', cache)
+        self.assertNotEqual(first.visitor_id, third.visitor_id)
+        self.assertFalse('api-key-1' in str(cache.backend.data))
+
+    def test_cookie_takes_precedence(self):
+        cache = VisitorIdCache()
+        self.request.COOKIES = {'_pk_id.1.abcd': '0123456789abcdef.1'}
+        pt = PiwikTracker(1, self.request)
+        pt.set_session_key('api-key', cache)
+        self.assertEqual('0123456789abcdef', pt.visitor_id)
@@ -0,0 +1,68 @@
+import math
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from piwikapi import columns as columns_module
+from piwikapi.analytics import PiwikAnalytics
+from piwikapi.columns import to_array
+from piwikapi.columns import to_columns
+
+from base import PiwikAPITestCase
+from server import FakePiwikServer
+
+ROWS = [
+    {'label': 'Google', 'nb_visits': 10, 'bounce_rate': '50%',
+     'avg_time_on_site': 12.5},
+    {'label': 'Bing', 'nb_visits': 3, 'bounce_rate': '0%'},
+]
+
+
+class ColumnsTestCase(PiwikAPITestCase):
+    """
+    Columnar conversion tests, against a local fake server
+    """
+    def test_to_columns(self):
+        columns = to_columns(ROWS)
+        self.assertEqual(['Google', 'Bing'], list(columns['label']))
+        self.assertEqual([10, 3], list(columns['nb_visits']))
+        self.assertEqual(['50%', '0%'], list(columns['bounce_rate']))
+        self.assertEqual(12.5, columns['avg_time_on_site'][0])
+        self.assertTrue(math.isnan(columns['avg_time_on_site'][1]))
+        if columns_module.numpy is None:
+            self.assertEqual(8, columns['nb_visits'].itemsize)
+            self.assertEqual('d', columns['avg_time_on_site'].typecode)
+
+    def test_interned_labels(self):
+        pool = {}
+        first = to_columns(json.loads(json.dumps(ROWS)), ['label'], pool)
+        second = to_columns(json.loads(json.dumps(ROWS)), ['label'], pool)
+        self.assertTrue(first['label'][0] is second['label'][0])
+
+    def test_to_array(self):
+        values = to_array(ROWS, ['nb_visits', 'avg_time_on_site'])
+        if columns_module.numpy is not None:
+            self.assertEqual((2, 2), values.shape)
+            values = values.flatten()
+        self.assertEqual([10.0, 12.5, 3.0], list(values)[:3])
+        self.assertTrue(math.isnan(values[3]))
+        self.assertRaises(ValueError, to_array, ROWS, ['label'])
+
+    def test_get_columns(self):
+        with FakePiwikServer(json.dumps(ROWS).encode('utf-8')) as server:
+            pa = PiwikAnalytics()
+            pa.set_api_url(server.url)
+            pa.set_format('xml')
+            columns = pa.get_columns(['label', 'nb_visits'])
+        self.assertEqual(['label', 'nb_visits'], sorted(columns))
+        self.assertTrue('format=json' in server.requests[0][1])
+
+    def test_get_array(self):
+        with FakePiwikServer(json.dumps(ROWS).encode('utf-8')) as server:
+            pa = PiwikAnalytics()
+            pa.set_api_url(server.url)
+            values = pa.get_array(['nb_visits'])
+        self.assertEqual([10.0, 3.0], list(values.flatten()
+                                           if hasattr(values, 'flatten')
+                                           else values))
@@ -0,0 +1,122 @@
+import threading
+import time
+
+from piwikapi.cache import LRUCache
+from piwikapi.dedup import CartDeduplicator
+from piwikapi.dedup import PageViewDeduplicator
+from piwikapi.dedup import get_digest
+from piwikapi.tracking import PiwikTracker
+
+from base import PiwikAPITestCase
+from server import FakePiwikServer
+from tracking import TrackerBaseTestCase
+
+
+class SlowCache(LRUCache):
+    """
+    An LRUCache with slow lookups, to make races likely
+    """
+    def get(self, key):
+        value = super(SlowCache, self).get(key)
+        time.sleep(0.01)
+        return value
+
+
+def run_concurrently(function, count=10):
+    """
+    Call function from count threads at once, return the results
+    """
+    results = []
+    start = threading.Event()
+
+    def run():
+        start.wait()
+        results.append(function())
+
+    threads = [threading.Thread(target=run) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class PageViewDeduplicatorTestCase(TrackerBaseTestCase):
+    """
+    Deduplication tests, without Piwik interaction
+    """
+    def setUp(self):
+        super(PageViewDeduplicatorTestCase, self).setUp()
+        self.request.COOKIES = {'_pk_id.1.abcd': 'fedcba9876543210.1'}
+        self.recorded = []
+
+    def record(self, hit):
+        self.recorded.append(hit)
+
+    def get_tracker(self, dedup):
+        pt = PiwikTracker(1, self.request)
+        pt.set_api_url('http://example.com/piwik.php')
+        pt.set_recorder(self, send=False)
+        pt.set_page_view_deduplicator(dedup)
+        return pt
+
+    def test_reload_skipped(self):
+        dedup = PageViewDeduplicator(window=60)
+        pt = self.get_tracker(dedup)
+        pt.do_track_page_view('Title')
+        reload = pt.for_request(self.request)
+        self.assertEqual('', reload.do_track_page_view('Title'))
+        pt.do_track_page_view('Other title')
+        other = pt.for_request(self.request)
+        other.set_visitor_id('0123456789abcdef')
+        other.do_track_page_view('Title')
+        self.assertEqual(3, len(self.recorded))
+        self.assertEqual({'sent': 3, 'skipped': 1}, dedup.get_stats())
+
+    def test_failed_send(self):
+        dedup = PageViewDeduplicator(window=60)
+        pt = self.get_tracker(dedup)
+        pt.set_recorder(None)
+        with FakePiwikServer(status=500) as server:
+            pt.set_api_url(server.url)
+            self.assertRaises(Exception, pt.do_track_page_view, 'Title')
+            server.status = 200
+            pt.do_track_page_view('Title')
+        self.assertEqual(2, len(server.requests))
+        self.assertEqual({'sent': 1, 'skipped': 0}, dedup.get_stats())
+
+    def test_window(self):
+        dedup = PageViewDeduplicator(window=-1)
+        pt = self.get_tracker(dedup)
+        pt.do_track_page_view('Title')
+        pt.do_track_page_view('Title')
+        self.assertEqual(2, len(self.recorded))
+        self.assertEqual(0, dedup.get_stats()['skipped'])
+
+    def test_size_bound(self):
+        dedup = PageViewDeduplicator(window=60, max_size=2)
+        for i in range(3):
+            self.assertFalse(dedup.is_duplicate(get_digest(i)))
+        self.assertFalse(dedup.is_duplicate(get_digest(0)))
+        self.assertTrue(dedup.is_duplicate(get_digest(2)))
+        self.assertEqual(2, len(dedup.backend))
+
+
+class DeduplicatorThreadingTestCase(PiwikAPITestCase):
+    """
+    Deduplicators shared between threads
+    """
+    def test_concurrent_cart_updates(self):
+        dedup = CartDeduplicator(backend=SlowCache())
+        results = run_concurrently(
+            lambda: dedup.is_duplicate('1:visitor', get_digest('cart')))
+        self.assertEqual(1, results.count(False))
+        self.assertEqual({'sent': 1, 'skipped': 9}, dedup.get_stats())
+
+    def test_concurrent_reloads(self):
+        dedup = PageViewDeduplicator(window=60, backend=SlowCache())
+        results = run_concurrently(
+            lambda: dedup.is_duplicate(get_digest('1', 'visitor', 'url')))
+        self.assertEqual(1, results.count(False))
+        self.assertEqual({'sent': 1, 'skipped': 9}, dedup.get_stats())
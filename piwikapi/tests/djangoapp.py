@@ -0,0 +1,77 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+try:
+    import django
+except ImportError:
+    django = None
+
+from base import PiwikAPITestCase
+
+
+def setup_django():
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure(
+            ALLOWED_HOSTS=['testserver'],
+            INSTALLED_APPS=['piwikapi.django'],
+            PIWIK_SITE_ID=1,
+            PIWIK_TRACKING_API_URL='http://127.0.0.1:9/piwik.php',
+            PIWIK_TOKEN_AUTH='token',
+            PIWIK_BATCH_SIZE=2,
+            PIWIK_EXCLUDE_PATHS=[r'^/static/'],
+        )
+        django.setup()
+
+
+@unittest.skipIf(django is None, "Django is not installed")
+class DjangoMiddlewareTestCase(PiwikAPITestCase):
+    """
+    Django middleware tests, without Piwik interaction
+    """
+    def setUp(self):
+        super(DjangoMiddlewareTestCase, self).setUp()
+        setup_django()
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from piwikapi.django import middleware
+        self.middleware = middleware
+        self.sender = middleware.get_sender()
+        self.sender.buffer = []
+        self.sent = []
+        self.sender._send_batch = self.sent.append
+        self.factory = RequestFactory()
+        self.HttpResponse = HttpResponse
+
+    def view(self, request):
+        request.piwik.do_track_goal(1, 10)
+        request.piwik_title = 'Django page'
+        return self.HttpResponse('OK')
+
+    def test_hits_are_deferred(self):
+        mw = self.middleware.PiwikMiddleware(self.view)
+        request = self.factory.get('/page/', REMOTE_ADDR='192.0.2.5')
+        mw(request)
+        self.assertEqual([], self.sent, "Hits sent inline")
+        queries = [hit.query for hit in self.sender.buffer]
+        self.assertEqual(2, len(queries))
+        self.assertTrue('idgoal=1' in queries[0], queries[0])
+        self.assertTrue('action_name=Django+page' in queries[1], queries[1])
+        self.assertTrue('cip=192.0.2.5' in queries[1], queries[1])
+
+    def test_request_finished_flushes(self):
+        from django.core.signals import request_finished
+        mw = self.middleware.PiwikMiddleware(self.view)
+        mw(self.factory.get('/page/'))
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(1, len(self.sent), "Batch not flushed")
+        self.assertEqual(2, len(self.sent[0]))
+
+    def test_excluded_paths(self):
+        mw = self.middleware.PiwikMiddleware(
+            lambda request: self.HttpResponse('OK'))
+        request = self.factory.get('/static/app.css')
+        mw(request)
+        self.assertEqual(None, request.piwik)
+        self.assertEqual([], self.sender.buffer)
@@ -12,9 +12,12 @@ except ImportError:
     from urllib2 import Request, urlopen
     from urllib import urlencode, quote
 
+from piwikapi.dedup import CartDeduplicator
 from piwikapi.tracking import PiwikTrackerEcommerce
 from piwikapi.plugins.goals import PiwikGoals
 
+from server import FakePiwikServer
+from tracking import TrackerBaseTestCase
 from tracking import TrackerVerifyBaseTestCase
 
 
@@ -87,6 +90,132 @@ class TrackerEcommerceBaseTestCase(TrackerVerifyBaseTestCase):
             raise
 
 
+class TrackerEcommerceClassTestCase(TrackerBaseTestCase):
+    """
+    PiwikTrackerEcommerce tests, without Piwik interaction
+    """
+    products = TrackerEcommerceBaseTestCase.products
+
+    def setUp(self):
+        super(TrackerEcommerceClassTestCase, self).setUp()
+        self.pte = PiwikTrackerEcommerce(1, self.request)
+        self.pte.set_api_url('http://example.com/piwik.php')
+
+    def add_products(self):
+        for key, product in sorted(self.products.items()):
+            self.pte.add_ecommerce_item(
+                product['sku'],
+                product['name'],
+                product['category'],
+                product['price'],
+                product['quantity'],
+            )
+
+    def test_get_url_track_ecommerce_order(self):
+        self.add_products()
+        url = self.pte.get_url_track_ecommerce_order('order-1', 100)
+        self.assertTrue(url.startswith('http://example.com/piwik.php?'), url)
+        self.assertTrue('ec_id=order-1' in url, url)
+        self.assertTrue('ec_items=' in url, url)
+        self.assertEqual({}, self.pte.ecommerce_items, "Items not cleared")
+
+    def get_ec_items(self, url):
+        if sys.version_info[0] >= 3:
+            from urllib.parse import parse_qs
+        else:
+            from urlparse import parse_qs
+        query = parse_qs(url.split('?', 1)[1])
+        return json.loads(query['ec_items'][0])
+
+    def test_get_url_track_ecommerce_order_without_token(self):
+        self.pte.set_token_auth('ADMINTOKEN')
+        url = self.pte.get_url_track_ecommerce_order('order-5', 100)
+        self.assertFalse('token_auth' in url, url)
+        url = self.pte.get_url_track_goal(3, 10)
+        self.assertFalse('token_auth' in url, url)
+
+    def test_ec_items_encoding(self):
+        self.add_products()
+        url = self.pte.get_url_track_ecommerce_order('order-2', 100)
+        expected = [
+            [p['sku'], p['name'], list(p['category']), p['price'],
+             p['quantity']]
+            for key, p in sorted(self.products.items())
+        ]
+        self.assertEqual(expected, self.get_ec_items(url))
+
+    def test_add_ecommerce_items(self):
+        self.pte.add_ecommerce_items([
+            ('1', 'Book', 'books', 999, 3),
+            ['2', 'Car'],
+            {'sku': '3', 'name': 'Ball', 'price': 739},
+        ])
+        url = self.pte.get_url_track_ecommerce_order('order-3', 100)
+        self.assertEqual([
+            ['1', 'Book', 'books', 999, 3],
+            ['2', 'Car', False, False, 1],
+            ['3', 'Ball', False, 739, 1],
+        ], self.get_ec_items(url))
+
+    def test_large_cart(self):
+        self.pte.add_ecommerce_items(
+            ('sku%d' % i, 'Item %d' % i, 'cat', i, 1) for i in range(5000))
+        url = self.pte.get_url_track_ecommerce_order('order-4', 100)
+        items = self.get_ec_items(url)
+        self.assertEqual(5000, len(items))
+        self.assertEqual(['sku4999', 'Item 4999', 'cat', 4999, 1], items[-1])
+
+    def test_cart_deduplication(self):
+        dedup = CartDeduplicator(max_size=10)
+        self.pte.set_cart_deduplicator(dedup)
+        self.pte.set_recorder(self, send=False)
+        self.recorded = []
+        for grand_total in (100, 100, 150):
+            self.add_products()
+            self.pte.do_track_ecommerce_cart_update(grand_total)
+        self.pte.add_ecommerce_item('other')
+        self.pte.do_track_ecommerce_cart_update(150)
+        other = self.pte.for_request(self.request)
+        self.add_products()
+        other.add_ecommerce_items(self.pte.ecommerce_items.values())
+        other.do_track_ecommerce_cart_update(100)
+        self.assertEqual({'sent': 4, 'skipped': 1}, dedup.get_stats())
+        self.assertEqual(4, len(self.recorded))
+        self.assertTrue('ec_items=' in self.recorded[0].query)
+
+    def test_cart_deduplication_failed_send(self):
+        dedup = CartDeduplicator()
+        self.pte.set_cart_deduplicator(dedup)
+        with FakePiwikServer(status=500) as server:
+            self.pte.set_api_url(server.url)
+            self.add_products()
+            self.assertRaises(Exception,
+                              self.pte.do_track_ecommerce_cart_update, 100)
+            server.status = 200
+            self.add_products()
+            self.pte.do_track_ecommerce_cart_update(100)
+        self.assertEqual(2, len(server.requests))
+        self.assertEqual({'sent': 1, 'skipped': 0}, dedup.get_stats())
+
+    def test_empty_cart_deduplication(self):
+        self.pte.set_recorder(self, send=False)
+        self.recorded = []
+        self.pte.do_track_ecommerce_cart_update(0)
+        self.pte.set_cart_deduplicator(CartDeduplicator())
+        self.pte.do_track_ecommerce_cart_update(0)
+        self.assertEqual(2, len(self.recorded))
+        for hit in self.recorded:
+            self.assertFalse('ec_items' in hit.query, hit.query)
+
+    def record(self, hit):
+        self.recorded.append(hit)
+
+    def test_get_url_track_goal(self):
+        url = self.pte.get_url_track_goal(3, 10)
+        self.assertTrue('idgoal=3' in url, url)
+        self.assertTrue('revenue=10' in url, url)
+
+
 class TrackerEcommerceVerifyTestCase(TrackerEcommerceBaseTestCase):
     def test_ecommerce_view(self):
         # View a product
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from piwikapi.executor import AnalyticsExecutor
+
+from base import PiwikAPITestCase
+
+
+class FakeCall(object):
+    """
+    Stands in for a PiwikAnalytics, counts the concurrent calls per host
+    """
+    running = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def __init__(self, host, index, delay=0.02, error=False):
+        self.api_url = 'http://%s/' % host
+        self.host = host
+        self.index = index
+        self.delay = delay
+        self.error = error
+        self.called = False
+
+    @classmethod
+    def reset(cls):
+        cls.running = {}
+        cls.peak = {}
+
+    def send_request(self):
+        self.called = True
+        with self.lock:
+            for key in (self.host, None):
+                self.running[key] = self.running.get(key, 0) + 1
+                self.peak[key] = max(self.peak.get(key, 0),
+                                     self.running[key])
+        try:
+            time.sleep(self.delay)
+            if self.error:
+                raise ValueError(self.index)
+            return self.index
+        finally:
+            with self.lock:
+                for key in (self.host, None):
+                    self.running[key] -= 1
+
+
+class AnalyticsExecutorTestCase(PiwikAPITestCase):
+    """
+    Fan-out executor tests, without Piwik interaction
+    """
+    def setUp(self):
+        super(AnalyticsExecutorTestCase, self).setUp()
+        FakeCall.reset()
+
+    def get_calls(self, count=40):
+        return [FakeCall('host%d' % (i % 2), i) for i in range(count)]
+
+    def test_ordered(self):
+        executor = AnalyticsExecutor(max_workers=8, max_per_host=3)
+        results = list(executor.run(self.get_calls()))
+        self.assertEqual([(i, i) for i in range(40)], results)
+        self.assertEqual(6, FakeCall.peak[None])
+        self.assertEqual(3, FakeCall.peak['host0'])
+
+    def test_global_cap(self):
+        executor = AnalyticsExecutor(max_workers=4, max_per_host=4)
+        self.assertEqual(list(range(40)), executor.map(self.get_calls()))
+        self.assertEqual(4, FakeCall.peak[None])
+
+    def test_as_completed(self):
+        calls = self.get_calls(10)
+        calls[0].delay = 0.3
+        executor = AnalyticsExecutor(max_workers=10, max_per_host=10)
+        results = list(executor.run(calls, ordered=False))
+        self.assertEqual((0, 0), results[-1])
+        self.assertEqual(list(range(10)), sorted(i for i, body in results))
+
+    def test_errors(self):
+        calls = self.get_calls(10)
+        calls[2].error = True
+        executor = AnalyticsExecutor(max_workers=2, max_per_host=2)
+        results = executor.map(calls, fail_fast=False)
+        self.assertTrue(isinstance(results[2], ValueError))
+        self.assertEqual(9, results[9])
+
+    def test_broken_call(self):
+        calls = self.get_calls(4) + [object()]
+        executor = AnalyticsExecutor(max_workers=2, max_per_host=2)
+        results = executor.map(calls, fail_fast=False)
+        self.assertTrue(isinstance(results[4], AttributeError))
+        self.assertRaises(AttributeError, executor.map, calls)
+
+    def test_fail_fast(self):
+        calls = self.get_calls(40)
+        calls[0].error = True
+        executor = AnalyticsExecutor(max_workers=2, max_per_host=2)
+        self.assertRaises(ValueError, executor.map, calls)
+        time.sleep(0.1)
+        self.assertFalse(calls[-1].called, "Calls not cancelled")
@@ -0,0 +1,133 @@
+try:
+    import json
+except ImportError:
+    import simplejson as json
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+from piwikapi.analytics import PiwikAnalytics
+from piwikapi.executor import AnalyticsExecutor
+from piwikapi.metrics import merge_metrics
+from piwikapi.metrics import merge_reports
+from piwikapi.ranges import RangePlanner
+
+from base import PiwikAPITestCase
+from server import FakePiwikServer
+
+
+def visits_summary(handler, body):
+    """
+    Fake VisitsSummary.get with 10 visits per request
+    """
+    params = parse_qs(handler.path.split('?', 1)[1])
+    return json.dumps({
+        'nb_visits': 10,
+        'nb_uniq_visitors': 8,
+        'nb_actions': 25,
+        'bounce_count': 5,
+        'bounce_rate': '50%',
+        'max_actions': len(params['date'][0]),
+    }).encode('utf-8')
+
+
+def referrers(handler, body):
+    """
+    Fake Referrers.getWebsites, every request ranks another site first
+    """
+    params = parse_qs(handler.path.split('?', 1)[1])
+    limit = int(params['filter_limit'][0])
+    month = int(params['date'][0][5:7])
+    rows = [{'label': 'site%d' % i, 'nb_visits': 1} for i in range(12)]
+    rows[month - 1]['nb_visits'] = 5
+    rows.sort(key=lambda row: -row['nb_visits'])
+    if limit >= 0:
+        rows = rows[:limit]
+    return json.dumps(rows).encode('utf-8')
+
+
+class RangePlannerTestCase(PiwikAPITestCase):
+    """
+    Range splitting and merging tests, against a local fake server
+    """
+    def test_plan(self):
+        planner = RangePlanner()
+        self.assertEqual([
+            ('range', '2012-01-15,2012-01-31'),
+            ('month', '2012-02-01'),
+            ('range', '2012-03-01,2012-03-10'),
+        ], planner.plan('2012-01-15', '2012-03-10'))
+        self.assertEqual([('month', '2012-02-01'), ('day', '2012-03-01')],
+                         planner.plan('2012-02-01', '2012-03-01'))
+        self.assertEqual(29, len(RangePlanner(unit='day').plan(
+            '2012-02-01', '2012-02-29')))
+
+    def test_merge_metrics(self):
+        merged = merge_metrics([
+            {'nb_visits': 10, 'bounce_count': 5, 'bounce_rate': '50%',
+             'nb_uniq_visitors': 8, 'max_actions': 3, 'label': '1',
+             'sum_visit_length': 100, 'avg_time_on_site': 10,
+             'idsubdatatable': 4, 'unknown': 1},
+            {'nb_visits': 30, 'bounce_count': 6, 'bounce_rate': '20%',
+             'nb_uniq_visitors': 20, 'max_actions': 7, 'label': '1',
+             'sum_visit_length': 300, 'avg_time_on_site': 10,
+             'idsubdatatable': 5, 'unknown': 1},
+        ])
+        self.assertEqual({
+            'nb_visits': 40,
+            'bounce_count': 11,
+            'bounce_rate': '28%',
+            'nb_uniq_visitors': None,
+            'max_actions': 7,
+            'label': '1',
+            'sum_visit_length': 400,
+            'avg_time_on_site': 10,
+            'unknown': None,
+        }, merged)
+
+    def test_merge_rows(self):
+        merged = merge_reports([
+            [{'label': 'a', 'nb_visits': 1}, {'label': 'b', 'nb_visits': 3}],
+            [],
+            [{'label': 'a', 'nb_visits': 5}],
+        ])
+        self.assertEqual([{'label': 'a', 'nb_visits': 6},
+                          {'label': 'b', 'nb_visits': 3}], merged)
+        self.assertEqual([], merge_reports([[], []]))
+
+    def test_fetch(self):
+        with FakePiwikServer(visits_summary) as server:
+            pa = PiwikAnalytics()
+            pa.set_api_url(server.url)
+            pa.set_method('VisitsSummary.get')
+            pa.set_period('range')
+            pa.set_date('2012-01-15,2012-12-31')
+            planner = RangePlanner(AnalyticsExecutor(max_workers=4))
+            report = planner.fetch(pa)
+        self.assertEqual(12, len(server.requests))
+        self.assertEqual(120, report['nb_visits'])
+        self.assertEqual(300, report['nb_actions'])
+        self.assertEqual('50%', report['bounce_rate'])
+        self.assertEqual(None, report['nb_uniq_visitors'])
+        self.assertEqual(len('2012-01-15,2012-01-31'), report['max_actions'])
+        self.assertEqual('range', pa.get_parameter('period'))
+
+    def test_fetch_rows(self):
+        with FakePiwikServer(referrers) as server:
+            pa = PiwikAnalytics()
+            pa.set_api_url(server.url)
+            pa.set_method('Referrers.getWebsites')
+            pa.set_period('range')
+            pa.set_date('2012-01-01,2012-12-31')
+            pa.set_parameter('filter_limit', 2)
+            pa.set_parameter('filter_offset', 1)
+            planner = RangePlanner(AnalyticsExecutor(max_workers=4))
+            report = planner.fetch(pa)
+        for request in server.requests:
+            params = parse_qs(request[1].split('?', 1)[1])
+            self.assertEqual(['-1'], params['filter_limit'])
+            self.assertFalse('filter_offset' in params)
+        self.assertEqual(2, len(report))
+        for row in report:
+            self.assertEqual(16, row['nb_visits'])
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from piwikapi.recording import RequestRecorder
+from piwikapi.recording import iter_recorded_hits
+from piwikapi.recording import replay
+
+from server import FakePiwikServer
+from tracking import TrackerBaseTestCase
+
+
+class RecordingTestCase(TrackerBaseTestCase):
+    """
+    Recording and replaying tracking requests, against a local fake server
+    """
+    def setUp(self):
+        super(RecordingTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'requests.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_record_only(self):
+        recorder = RequestRecorder(self.path, buffer_size=2)
+        self.pt.set_api_url(None)
+        self.pt.set_recorder(recorder, send=False)
+        self.pt.do_track_page_view('one')
+        self.assertFalse(os.path.exists(self.path), "Buffer not used")
+        self.pt.do_track_page_view('two')
+        self.pt.do_track_page_view('three')
+        recorder.close()
+        hits = list(iter_recorded_hits(self.path))
+        self.assertEqual(3, len(hits), "Unexpected hit count %d" % len(hits))
+        self.assertTrue('action_name=two' in hits[1].query)
+        self.assertEqual(self.pt.user_agent, hits[0].headers['User-Agent'])
+        self.assertTrue(hits[0].timestamp)
+
+    def test_token_auth_not_recorded(self):
+        self.pt.set_token_auth('SECRET_ADMIN_TOKEN')
+        self.pt.set_ip('1.2.3.4')
+        with RequestRecorder(self.path) as recorder:
+            self.pt.set_recorder(recorder, send=False)
+            self.pt.do_track_page_view('secret')
+        with open(self.path) as f:
+            content = f.read()
+        self.assertFalse('SECRET_ADMIN_TOKEN' in content)
+        self.assertFalse('token_auth' in content)
+        self.assertTrue('cip=1.2.3.4' in content)
+
+    def test_record_and_send(self):
+        with FakePiwikServer() as server:
+            self.pt.set_api_url(server.url)
+            with RequestRecorder(self.path) as recorder:
+                self.pt.set_recorder(recorder)
+                self.pt.do_track_page_view('sent')
+        self.assertEqual(1, len(server.hits))
+        self.assertEqual(1, len(list(iter_recorded_hits(self.path))))
+
+    def test_replay(self):
+        with RequestRecorder(self.path) as recorder:
+            self.pt.set_recorder(recorder, send=False)
+            for i in range(25):
+                self.pt.do_track_page_view('replay %d' % i)
+        with FakePiwikServer() as server:
+            stats = replay(self.path, server.url, parallelism=3, batch_size=10)
+        self.assertEqual({'sent': 25, 'failed': 0}, stats)
+        self.assertEqual(3, len(server.requests), "Hits not sent in bulk")
+        self.assertEqual(25, len(server.hits))
+        self.assertTrue(all('&ua=' in hit for hit in server.hits),
+                        "User agent not moved into the bulk query")
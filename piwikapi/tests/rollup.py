@@ -0,0 +1,125 @@
+import datetime
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from piwikapi.analytics import PiwikAnalytics
+from piwikapi.analytics import decode_json
+from piwikapi.cache import ResponseCache
+from piwikapi.rollup import RollupEngine
+
+from base import PiwikAPITestCase
+from server import FakePiwikServer
+
+REPORT = [
+    {'label': 'a', 'nb_visits': 2, 'nb_uniq_visitors': 2, 'bounce_count': 1,
+     'bounce_rate': '50%'},
+    {'label': 'b', 'nb_visits': 1, 'nb_uniq_visitors': 1, 'bounce_count': 0,
+     'bounce_rate': '0%'},
+]
+
+
+class RollupEngineTestCase(PiwikAPITestCase):
+    """
+    Rollup tests, against a local fake server
+    """
+    def setUp(self):
+        super(RollupEngineTestCase, self).setUp()
+        self.cache = ResponseCache(ttl=None)
+        self.rollup = RollupEngine(self.cache)
+
+    def get_analytics(self, server, period, date):
+        pa = PiwikAnalytics()
+        pa.set_api_url(server.url)
+        pa.set_cache(self.cache)
+        pa.set_rollup(self.rollup)
+        pa.set_method('Referrers.getWebsites')
+        pa.set_id_site(1)
+        pa.set_format('json')
+        pa.set_period(period)
+        pa.set_date(date)
+        return pa
+
+    def test_get_days(self):
+        days = self.rollup.get_days('week', '2012-01-04')
+        self.assertEqual(7, len(days))
+        self.assertEqual('2012-01-02', days[0].isoformat())
+        self.assertEqual(366, len(self.rollup.get_days('year', '2012-05-01')))
+        self.assertEqual(None, self.rollup.get_days('day', '2012-01-04'))
+        self.assertEqual(None, self.rollup.get_days('week', 'foo'))
+        self.assertEqual(None, self.rollup.get_days('week', 'previous2'))
+        self.assertEqual(None, self.rollup.get_days('month', 'last3'))
+
+    def test_multiple_periods(self):
+        multi = {'2012-01-02': REPORT, '2012-01-09': REPORT}
+        self.cache.today = lambda: datetime.date(2012, 1, 18)
+        with FakePiwikServer(json.dumps(multi).encode('utf-8')) as server:
+            for day in range(2, 16):
+                self.cache.set(server.url, self.get_analytics(
+                    server, 'day', '2012-01-%02d' % day).p,
+                    json.dumps(REPORT).encode('utf-8'))
+            pa = self.get_analytics(server, 'week', 'previous2')
+            self.assertEqual(multi, decode_json(pa.send_request()))
+        self.assertEqual(1, len(server.requests))
+
+    def test_rollup(self):
+        with FakePiwikServer(json.dumps(REPORT).encode('utf-8')) as server:
+            for day in range(2, 9):
+                pa = self.get_analytics(server, 'day', '2012-01-%02d' % day)
+                pa.set_parameter('filter_limit', -1)
+                pa.send_request()
+            week = self.get_analytics(server, 'week', '2012-01-05')
+            report = decode_json(week.send_request())
+            self.assertEqual(7, len(server.requests))
+            self.get_analytics(server, 'week', '2012-01-09').send_request()
+            self.assertEqual(8, len(server.requests))
+        self.assertEqual({'label': 'a', 'nb_visits': 14,
+                          'nb_uniq_visitors': None, 'bounce_count': 7,
+                          'bounce_rate': '50%'}, report[0])
+        self.assertEqual({'rollups': 1, 'misses': 1},
+                         self.rollup.get_stats())
+
+    def test_truncated_days(self):
+        with FakePiwikServer(json.dumps(REPORT).encode('utf-8')) as server:
+            for day in range(2, 9):
+                self.get_analytics(server, 'day',
+                                   '2012-01-%02d' % day).send_request()
+            self.get_analytics(server, 'week', '2012-01-05').send_request()
+        self.assertEqual(8, len(server.requests))
+        self.assertEqual({'rollups': 0, 'misses': 1},
+                         self.rollup.get_stats())
+
+    def test_limit_and_offset(self):
+        rows = [{'label': 'r%d' % i, 'nb_visits': 10 - i} for i in range(5)]
+        with FakePiwikServer(json.dumps(rows).encode('utf-8')) as server:
+            for day in range(2, 9):
+                pa = self.get_analytics(server, 'day', '2012-01-%02d' % day)
+                pa.set_parameter('filter_limit', -1)
+                pa.send_request()
+            week = self.get_analytics(server, 'week', '2012-01-05')
+            week.set_parameter('filter_offset', 1)
+            week.set_parameter('filter_limit', 2)
+            report = decode_json(week.send_request())
+        self.assertEqual(['r1', 'r2'], [row['label'] for row in report])
+        self.assertEqual(63, report[0]['nb_visits'])
+
+    def test_dict_reports(self):
+        summary = {'nb_visits': 3, 'nb_actions': 5}
+        with FakePiwikServer(json.dumps(summary).encode('utf-8')) as server:
+            for day in range(2, 9):
+                pa = self.get_analytics(server, 'day', '2012-01-%02d' % day)
+                pa.set_method('VisitsSummary.get')
+                pa.send_request()
+            week = self.get_analytics(server, 'week', '2012-01-05')
+            week.set_method('VisitsSummary.get')
+            report = decode_json(week.send_request())
+        self.assertEqual(7, len(server.requests))
+        self.assertEqual(21, report['nb_visits'])
+
+    def test_other_formats(self):
+        pa = PiwikAnalytics()
+        pa.set_format('xml')
+        pa.set_period('week')
+        pa.set_date('2012-01-05')
+        self.assertEqual(None, self.rollup.get('http://a/', pa.p))
@@ -0,0 +1,63 @@
+from piwikapi.bulk import TrackingHit
+from piwikapi.senders import BackgroundSender
+from piwikapi.senders import BaseSender
+
+from base import PiwikAPITestCase
+from server import FakePiwikServer
+
+
+class ListSender(object):
+    """
+    Collects submitted hits, used instead of a real sender in unit tests
+    """
+    def __init__(self):
+        self.hits = []
+
+    def submit(self, hit):
+        self.hits.append(hit)
+        return True
+
+
+class BackgroundSenderTestCase(PiwikAPITestCase):
+    """
+    BackgroundSender tests, against a local fake server
+    """
+    def test_hits_are_batched(self):
+        with FakePiwikServer() as server:
+            sender = BackgroundSender(server.url, batch_size=10,
+                                      flush_interval=0.2)
+            for i in range(25):
+                sender.submit(TrackingHit('idsite=1&n=%d' % i,
+                                          {'User-Agent': 'UA'}))
+            sender.flush()
+        self.assertEqual(25, len(server.hits))
+        self.assertEqual(3, len(server.requests), "Hits not batched")
+        self.assertEqual(25, sender.get_stats()['sent'])
+
+    def test_full_queue_drops(self):
+        sender = BackgroundSender('http://127.0.0.1:9/piwik.php',
+                                  max_queue_size=1, flush_interval=5)
+        sender._ensure_thread()
+        results = [sender.submit(TrackingHit('n=%d' % i)) for i in range(5)]
+        self.assertFalse(all(results), "Nothing was dropped")
+        self.assertTrue(sender.get_stats()['dropped'] >= 1)
+
+    def test_base_sender(self):
+        with FakePiwikServer() as server:
+            sender = BaseSender(server.url)
+            self.assertTrue(sender.submit(TrackingHit('idsite=1')))
+            sender.flush()
+        self.assertEqual(1, len(server.hits))
+        self.assertEqual(1, sender.get_stats()['sent'])
+
+    def test_flush_after_error(self):
+        def broken(batch):
+            raise ValueError("Broken")
+
+        sender = BackgroundSender('http://127.0.0.1:9/piwik.php',
+                                  flush_interval=0.01)
+        sender._send_batch = broken
+        for i in range(3):
+            sender.submit(TrackingHit('n=%d' % i))
+        sender.flush()
+        self.assertEqual(3, sender.get_stats()['failed'])
@@ -0,0 +1,74 @@
+import threading
+try:
+    import json
+except ImportError:
+    import simplejson as json
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+class FakePiwikHandler(BaseHTTPRequestHandler):
+    """
+    Records all requests in the server object
+    """
+    def do_GET(self):
+        self.server.record(self, None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        self.server.record(self, body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePiwikServer(HTTPServer):
+    """
+    A local HTTP server standing in for piwik.php, only used for unit tests
+
+    Every request is stored in ``requests`` as a (method, path, headers, body)
+    tuple. Bulk tracking requests are decoded so that ``hits`` contains all
+    query strings that were tracked.
+    """
+    def __init__(self, response=b'OK', status=200):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakePiwikHandler)
+        self.response = response
+        self.status = status
+        self.requests = []
+        self.hits = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+        return False
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/piwik.php' % self.server_address[1]
+
+    def record(self, handler, body):
+        with self.lock:
+            self.requests.append((handler.command, handler.path,
+                                  dict(handler.headers.items()), body))
+            if body is None:
+                self.hits.append(handler.path.split('?', 1)[1])
+            elif body.startswith('{'):
+                for query in json.loads(body).get('requests', []):
+                    self.hits.append(query.lstrip('?'))
+            response = self.response
+            if callable(response):
+                response = response(handler, body)
+        handler.send_response(self.status)
+        handler.send_header('Content-Length', str(len(response)))
+        handler.end_headers()
+        handler.wfile.write(response)
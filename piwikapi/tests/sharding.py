@@ -0,0 +1,108 @@
+try:
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import HTTPError
+
+from piwikapi.bulk import TrackingHit
+from piwikapi.senders import BufferedSender
+from piwikapi.sharding import HashRing
+from piwikapi.tracking import PiwikTracker
+
+from server import FakePiwikServer
+from tracking import TrackerBaseTestCase
+
+DEAD_URL = 'http://127.0.0.1:9/piwik.php'
+
+
+class HashRingTestCase(TrackerBaseTestCase):
+    """
+    Sharding tests, against local fake servers
+    """
+    def get_keys(self):
+        return ['%016x' % (i * 7919) for i in range(2000)]
+
+    def test_consistent(self):
+        ring = HashRing(['a', 'b', 'c'])
+        keys = self.get_keys()
+        nodes = dict((key, ring.get_node(key)) for key in keys)
+        reordered = HashRing(['c', 'b', 'a'])
+        self.assertEqual(nodes, dict((key, reordered.get_node(key))
+                                     for key in keys))
+        bigger = HashRing(['a', 'b', 'c', 'd'])
+        moved = [key for key in keys if bigger.get_node(key) != nodes[key]]
+        self.assertTrue(all(bigger.get_node(key) == 'd' for key in moved))
+        self.assertTrue(len(moved) < len(keys) / 2)
+
+    def test_weights(self):
+        ring = HashRing({'a': 3, 'b': 1})
+        nodes = [ring.get_node(key) for key in self.get_keys()]
+        self.assertTrue(nodes.count('a') > 2 * nodes.count('b'))
+
+    def test_invalid_weights(self):
+        for weight in (1.5, 0, -1, '2'):
+            self.assertRaises(ValueError, HashRing, {'a': 1, 'b': weight})
+
+    def test_failover(self):
+        ring = HashRing(['a', 'b', 'c'])
+        keys = self.get_keys()
+        nodes = dict((key, ring.get_node(key)) for key in keys)
+        ring.mark_down('a')
+        for key in keys:
+            if nodes[key] == 'a':
+                self.assertNotEqual('a', ring.get_node(key))
+            else:
+                self.assertEqual(nodes[key], ring.get_node(key))
+        ring.mark_up('a')
+        self.assertEqual(nodes, dict((key, ring.get_node(key))
+                                     for key in keys))
+
+    def test_retry_after(self):
+        ring = HashRing(['a', 'b'], retry_after=-1)
+        ring.mark_down('a')
+        self.assertTrue(ring.is_healthy('a'))
+
+    def test_sender(self):
+        with FakePiwikServer() as one:
+            with FakePiwikServer() as two:
+                ring = HashRing([one.url, two.url, DEAD_URL])
+                sender = BufferedSender(ring, batch_size=100)
+                for key in self.get_keys()[:50]:
+                    sender.submit(TrackingHit('idsite=1&_id=%s' % key,
+                                              visitor_id=key))
+                sender.flush()
+        self.assertEqual(50, sender.get_stats()['sent'])
+        self.assertEqual(50, len(one.hits) + len(two.hits))
+        self.assertFalse(ring.is_healthy(DEAD_URL))
+        for server in (one, two):
+            for hit in server.hits:
+                key = hit.split('_id=')[1][:16]
+                self.assertTrue(ring.get_node(key) == server.url)
+
+    def test_tracker(self):
+        with FakePiwikServer() as server:
+            ring = HashRing([server.url, DEAD_URL])
+            for key in self.get_keys()[:10]:
+                pt = PiwikTracker(1, self.request)
+                pt.set_api_url(ring)
+                pt.set_visitor_id(key)
+                pt.do_track_page_view('Title')
+        self.assertEqual(10, len(server.hits))
+
+    def test_no_failover_on_http_errors(self):
+        with FakePiwikServer(status=500) as broken:
+            with FakePiwikServer() as other:
+                ring = HashRing([broken.url, other.url])
+                keys = [key for key in self.get_keys()[:50]
+                        if ring.get_node(key) == broken.url]
+                sender = BufferedSender(ring, batch_size=100)
+                for key in keys:
+                    sender.submit(TrackingHit('idsite=1&_id=%s' % key,
+                                              visitor_id=key))
+                sender.flush()
+                pt = PiwikTracker(1, self.request)
+                pt.set_api_url(ring)
+                pt.set_visitor_id(keys[0])
+                self.assertRaises(HTTPError, pt.do_track_page_view, 'Title')
+        self.assertTrue(ring.is_healthy(broken.url))
+        self.assertEqual(len(keys), sender.get_stats()['failed'])
+        self.assertEqual(0, len(other.hits))
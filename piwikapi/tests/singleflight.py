@@ -0,0 +1,148 @@
+import threading
+import time
+
+from piwikapi.analytics import PiwikAnalytics
+from piwikapi.cache import ResponseCache
+from piwikapi.cache import get_request_key
+from piwikapi.singleflight import SingleFlight
+
+from base import PiwikAPITestCase
+from server import FakePiwikServer
+
+
+class SingleFlightTestCase(PiwikAPITestCase):
+    """
+    Single flight tests, against a local fake server
+    """
+    def setUp(self):
+        super(SingleFlightTestCase, self).setUp()
+        self.flight = SingleFlight(timeout=10)
+        self.release = threading.Event()
+
+    def wait_for_shared(self, count):
+        for i in range(500):
+            if self.flight.get_stats()['shared'] >= count:
+                return
+            time.sleep(0.01)
+        self.fail("Only %d callers waiting" %
+                  self.flight.get_stats()['shared'])
+
+    def run_threads(self, target, count):
+        results = []
+
+        def run():
+            try:
+                results.append(target())
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=run) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        self.wait_for_shared(count - 1)
+        self.release.set()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def blocking_response(self, handler, body):
+        self.release.wait(10)
+        return b'{"nb_visits": 1}'
+
+    def get_analytics(self, server, cache=None):
+        a = PiwikAnalytics()
+        a.set_api_url(server.url)
+        a.set_cache(cache)
+        a.set_single_flight(self.flight)
+        a.set_method('VisitsSummary.get')
+        a.set_id_site(1)
+        a.set_period('day')
+        a.set_date('today')
+        return a
+
+    def test_calls_are_coalesced(self):
+        calls = []
+
+        def function():
+            calls.append(1)
+            self.release.wait(10)
+            return 'result'
+
+        results = self.run_threads(
+            lambda: self.flight.do('key', function), 10)
+        self.assertEqual(['result'] * 10, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual({'executed': 1, 'shared': 9},
+                         self.flight.get_stats())
+        self.assertFalse(self.flight.is_in_flight('key'))
+        self.assertEqual('again', self.flight.do('key', lambda: 'again'))
+
+    def test_error_is_shared(self):
+        def function():
+            self.release.wait(10)
+            raise ValueError("Piwik is down")
+
+        results = self.run_threads(
+            lambda: self.flight.do('key', function), 5)
+        self.assertEqual(5, len(results))
+        for result in results:
+            self.assertTrue(isinstance(result, ValueError))
+
+    def test_send_request_stampede(self):
+        with FakePiwikServer(self.blocking_response) as server:
+            results = self.run_threads(
+                lambda: self.get_analytics(server).send_request(), 20)
+        self.assertEqual([b'{"nb_visits": 1}'] * 20, results)
+        self.assertEqual(1, len(server.requests))
+
+    def test_parameter_order(self):
+        with FakePiwikServer(self.blocking_response) as server:
+            def call():
+                a = self.get_analytics(server)
+                a.p = dict(reversed(list(a.p.items())))
+                return a.send_request()
+
+            def other_call():
+                a = self.get_analytics(server)
+                return a.send_request()
+
+            callers = [other_call, call]
+            results = self.run_threads(lambda: callers.pop()(), 2)
+        self.assertEqual(2, len(results))
+        self.assertEqual(1, len(server.requests))
+
+    def test_stale_while_revalidate(self):
+        cache = ResponseCache(ttl=-1, stale_ttl=60)
+        self.release.set()
+        with FakePiwikServer(b'{"nb_visits": 1}') as server:
+            a = self.get_analytics(server, cache)
+            self.assertEqual(b'{"nb_visits": 1}', a.send_request())
+            server.response = b'{"nb_visits": 2}'
+            # Expired, the old response is served while it's refreshed
+            self.assertEqual(b'{"nb_visits": 1}', a.send_request())
+            key = get_request_key(server.url, a.p)
+            for i in range(500):
+                if len(server.requests) == 2 and \
+                        not self.flight.is_in_flight(key):
+                    break
+                time.sleep(0.01)
+        self.assertEqual(2, len(server.requests))
+        self.assertEqual(b'{"nb_visits": 2}',
+                         cache.get_entry(server.url, a.p)[0])
+        self.assertEqual(2, cache.get_stats()['stale'])
+        self.assertEqual(None, cache.get(server.url, a.p))
+
+    def test_one_refresh_per_request(self):
+        cache = ResponseCache(ttl=-1, stale_ttl=60)
+        with FakePiwikServer(self.blocking_response) as server:
+            a = self.get_analytics(server, cache)
+            cache.set(server.url, a.p, b'stale')
+            for i in range(10):
+                self.assertEqual(b'stale', a.send_request())
+            for i in range(500):
+                if server.requests:
+                    break
+                time.sleep(0.01)
+            self.release.set()
+        self.assertEqual(1, len(server.requests))
+        self.assertEqual(1, self.flight.get_stats()['executed'])
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import io
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from piwikapi.analytics import PiwikAnalytics
+from piwikapi.exceptions import APIError
+from piwikapi.streaming import JSONStream
+
+from base import PiwikAPITestCase
+from server import FakePiwikServer
+
+
+class RowSource(object):
+    """
+    A file like object that generates a large JSON array lazily
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.index = -1
+        self.pending = b'['
+
+    def read(self, size):
+        while len(self.pending) < size and self.index < self.rows:
+            self.index += 1
+            if self.index == self.rows:
+                self.pending += b']'
+            else:
+                row = json.dumps({'label': 'row %d' % self.index,
+                                  'nb_visits': self.index})
+                if self.index:
+                    self.pending += b','
+                self.pending += row.encode('utf-8')
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+class JSONStreamTestCase(PiwikAPITestCase):
+    """
+    Streaming JSON decoding tests, against a local fake server
+    """
+    def stream(self, document, chunk_size):
+        return list(JSONStream(io.BytesIO(document.encode('utf-8')),
+                               chunk_size))
+
+    def test_documents(self):
+        for document in (
+                '[]',
+                ' { } ',
+                '[1, 22, 333, -4.5e3, true, null, "a,]"]',
+                '[{"label": "Café ☃", "nb_visits": 12345}, []]',
+                '{"2013-01-01": [{"a": 1}], "2013-01-02": []}',
+                '\n[\n {"a": [1, {"b": "}"}]}\n ,\n 7\n]\n'):
+            expected = json.loads(document)
+            if isinstance(expected, dict):
+                expected = sorted(expected.items())
+            for chunk_size in (1, 2, 3, 7, 1024):
+                result = self.stream(document, chunk_size)
+                if isinstance(expected, list) and result and \
+                        isinstance(result[0], tuple):
+                    result = sorted(result)
+                self.assertEqual(expected, result,
+                                 (document, chunk_size))
+
+    def test_invalid(self):
+        for document in ('', '1', '[1 2]', '[1,', '{"a" 1}'):
+            self.assertRaises(ValueError, self.stream, document, 2)
+
+    def test_large(self):
+        count = 0
+        for row in JSONStream(RowSource(100000), 4096):
+            count += 1
+        self.assertEqual(100000, count)
+        self.assertEqual(99999, row['nb_visits'])
+
+    def test_large_member(self):
+        calls = []
+        document = json.dumps([
+            {'label': 'x' * 100000, 'rows': list(range(20000))},
+            'y\\"' * 10000,
+        ])
+        stream = JSONStream(io.BytesIO(document.encode('utf-8')), 1024)
+        raw_decode = stream.json.raw_decode
+
+        def count(*args):
+            calls.append(1)
+            return raw_decode(*args)
+
+        stream.json.raw_decode = count
+        self.assertEqual(json.loads(document), list(stream))
+        self.assertEqual(2, len(calls), "Members decoded once per chunk")
+
+    def test_iter_rows(self):
+        rows = [{'label': 'row %d' % i} for i in range(100)]
+        with FakePiwikServer(json.dumps(rows).encode('utf-8')) as server:
+            a = PiwikAnalytics()
+            a.set_api_url(server.url)
+            a.set_method('Live.getLastVisitsDetails')
+            a.set_format('xml')
+            self.assertEqual(rows, list(a.iter_rows(chunk_size=10)))
+        self.assertTrue('format=json' in server.requests[0][1])
+        self.assertFalse('format=xml' in server.requests[0][1])
+
+    def test_iter_rows_error(self):
+        error = b'{"result": "error", "message": "No access"}'
+        with FakePiwikServer(error) as server:
+            a = PiwikAnalytics()
+            a.set_api_url(server.url)
+            try:
+                list(a.iter_rows())
+                message = None
+            except APIError as e:
+                message = str(e)
+        self.assertEqual('No access', message)
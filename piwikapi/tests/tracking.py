@@ -3,6 +3,7 @@ import datetime
 import random
 import re
 import sys
+import threading
 try:
     import json
 except ImportError:
@@ -11,16 +12,23 @@ try:
     import unittest2 as unittest
 except ImportError:
     import unittest
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
 
 from piwikapi.analytics import PiwikAnalytics
 from piwikapi.exceptions import InvalidParameter
 from piwikapi.exceptions import ConfigurationError
+from piwikapi.profiling import PiwikProfiler
+from piwikapi.profiling import profiler
 from piwikapi.tracking import PiwikTracker
 from piwikapi.tracking import PiwikTrackerEcommerce
 
 from analytics import AnalyticsBaseTestCase
 from base import PiwikAPITestCase
 from request import FakeRequest
+from senders import ListSender
 
 
 class TrackerBaseTestCase(PiwikAPITestCase):
@@ -294,6 +302,57 @@ class TrackerClassTestCase(TrackerBaseTestCase):
             invalid_config = False
         self.assertFalse(invalid_config)
 
+    def test_get_url_track_page_view(self):
+        self.pt.set_api_url('http://example.com/piwik.php')
+        url = self.pt.get_url_track_page_view('Beacon title')
+        self.assertRegexpMatches(
+            url,
+            r'^http://example\.com/piwik\.php\?.*action_name=Beacon\+title',
+            "Unexpected beacon URL %s" % url,
+        )
+
+    def test_beacon_without_token(self):
+        self.pt.set_api_url('http://example.com/piwik.php')
+        self.pt.set_token_auth('ADMINTOKEN')
+        self.pt.set_ip('1.2.3.4')
+        urls = [self.pt.get_url_track_page_view('t'),
+                self.pt.get_url_track_action('http://example.com/', 'link')]
+        urls.extend(self.pt.get_urls_track_page_view(['one']))
+        for url in urls:
+            self.assertFalse('ADMINTOKEN' in url, url)
+            self.assertFalse('token_auth' in url, url)
+            self.assertFalse('cip=' in url, url)
+        self.assertTrue('action_name=t' in urls[0], urls[0])
+
+    def test_get_urls_track_page_view(self):
+        self.pt.set_api_url('http://example.com/piwik.php')
+        urls = self.pt.get_urls_track_page_view(['one', 'two', ''])
+        self.assertEqual(3, len(urls))
+        self.assertTrue('action_name=two' in urls[1], urls[1])
+        self.assertFalse('action_name' in urls[2], urls[2])
+        for url in urls:
+            self.assertEqual(1, url.count('rand='), "Bad rand in %s" % url)
+
+    def test_get_url_track_action(self):
+        self.pt.set_api_url('http://example.com/piwik.php')
+        url = self.pt.get_url_track_action('http://example.com/a.zip',
+                                           'download')
+        self.assertTrue('download=http' in url, url)
+        try:
+            self.pt.get_url_track_action('/', 'foo')
+            invalid_value = True
+        except InvalidParameter:
+            invalid_value = False
+        self.assertFalse(invalid_value)
+
+    def test_get_url_missing_api_url(self):
+        try:
+            self.pt.get_url_track_page_view('fake title')
+            invalid_config = True
+        except ConfigurationError:
+            invalid_config = False
+        self.assertFalse(invalid_config)
+
     def test_unknown_set_plugins(self):
         try:
             self.pt.set_plugins(
@@ -305,6 +364,155 @@ class TrackerClassTestCase(TrackerBaseTestCase):
         self.assertFalse(invalid_plugin)
 
 
+class TrackerProfilingTestCase(TrackerBaseTestCase):
+    """
+    Stage timers, without Piwik interaction
+    """
+    def setUp(self):
+        super(TrackerProfilingTestCase, self).setUp()
+        profiler.reset()
+
+    def tearDown(self):
+        profiler.disable()
+        profiler.reset()
+
+    def test_disabled_by_default(self):
+        self.pt._get_request(1)
+        self.assertEqual({}, profiler.get_stats(), "Profiled while disabled")
+
+    def test_stages_are_aggregated(self):
+        with profiler.enabled():
+            pt = PiwikTracker(1, self.request)
+            pt.set_custom_variable(1, 'foo', 'bar')
+            pt._get_request(1)
+            pt._get_request(1)
+        stats = profiler.get_stats()
+        self.assertEqual(1, stats['init']['count'], "Init not profiled")
+        self.assertEqual(2, stats['build']['count'], "Build not profiled")
+        self.assertEqual(2, stats['encode']['count'], "Encode not profiled")
+        self.assertFalse(profiler.active, "Profiler still active")
+
+    def test_hooks(self):
+        p = PiwikProfiler()
+        seen = []
+        hook = lambda stage, seconds: seen.append(stage)
+        p.add_hook(hook)
+        with p.enabled():
+            with p.stage('send'):
+                pass
+        p.remove_hook(hook)
+        p.enable()
+        with p.stage('read'):
+            pass
+        self.assertEqual(['send'], seen, "Unexpected hook calls %s" % seen)
+        self.assertEqual(1, p.get_stats()['read']['count'])
+
+
+class TrackerThreadingTestCase(TrackerBaseTestCase):
+    """
+    Sharing one configured tracker between threads, without Piwik interaction
+    """
+    def test_for_request_copies_state(self):
+        self.pt.set_token_auth('token')
+        tracker = self.pt.for_request(meta={'PATH_INFO': '/other/'})
+        tracker.set_custom_variable(2, 'bar', 'baz')
+        self.assertEqual('token', tracker.token_auth)
+        self.assertEqual('http:///other/', tracker.page_url)
+        self.assertTrue(1 in tracker.visitor_custom_var, "Defaults lost")
+        self.assertFalse(2 in self.pt.visitor_custom_var, "State shared")
+        self.assertNotEqual(self.pt.visitor_id, tracker.visitor_id)
+
+    def test_no_cross_talk(self):
+        """
+        Many threads track through copies of one tracker, every hit must
+        only contain its own data
+        """
+        sender = ListSender()
+        shared = PiwikTrackerEcommerce(1)
+        shared.set_api_url('http://example.com/piwik.php')
+        shared.set_sender(sender)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(100):
+                    key = 'k%d-%d' % (n, i)
+                    tracker = shared.for_request(meta={
+                        'SERVER_NAME': 'example.com',
+                        'PATH_INFO': '/%s/' % key,
+                    })
+                    tracker.set_custom_variable(1, 'key', key, 'page')
+                    tracker.add_ecommerce_item('sku-%s' % key, key)
+                    tracker.do_track_ecommerce_cart_update(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n, ))
+                   for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        self.assertEqual(800, len(sender.hits))
+        for hit in sender.hits:
+            keys = set(re.findall(r'k\d+-\d+', hit.query))
+            self.assertEqual(1, len(keys), "Cross-talk in %s" % hit.query)
+        self.assertEqual({}, shared.ecommerce_items)
+        self.assertEqual({}, shared.page_custom_var)
+
+
+class TrackerCookieTestCase(TrackerBaseTestCase):
+    """
+    Reading Piwik's first party cookies, without Piwik interaction
+    """
+    visitor_id = '0123456789abcdef'
+
+    def get_tracker(self, cookies):
+        self.request.COOKIES = cookies
+        return PiwikTracker(1, self.request)
+
+    def test_visitor_id_from_cookie(self):
+        pt = self.get_tracker({
+            'sessionid': 'foo',
+            '_pk_id.1.d3f9': '%s.1364210010.3.1364290010.1364215010' %
+                self.visitor_id,
+            '_pk_id.2.d3f9': 'fedcba9876543210.1364210010',
+        })
+        self.assertEqual(self.visitor_id, pt.get_visitor_id())
+        self.assertTrue('_id=%s' % self.visitor_id in pt._get_request(1),
+                        "Cookie visitor ID not tracked")
+
+    def test_php_style_cookie_names(self):
+        pt = self.get_tracker({'_pk_id_1_d3f9': '%s.1364210010' %
+                               self.visitor_id})
+        self.assertEqual(self.visitor_id, pt.get_visitor_id())
+
+    def test_invalid_visitor_id_cookie(self):
+        pt = self.get_tracker({'_pk_id.1.d3f9': 'short.1364210010'})
+        self.assertNotEqual('short', pt.get_visitor_id())
+        self.assertEqual(pt.LENGTH_VISITOR_ID, len(pt.get_visitor_id()))
+
+    def test_cookie_support_disabled(self):
+        self.request.COOKIES = {'_pk_id.1.d3f9': '%s.1' % self.visitor_id}
+        pt = PiwikTracker(1, self.request)
+        pt.disable_cookie_support()
+        tracker = pt.for_request(self.request)
+        self.assertNotEqual(self.visitor_id, tracker.visitor_id)
+
+    def test_attribution_info(self):
+        info = ['campaign', 'keyword', 1364210010, 'http://example.com/']
+        pt = self.get_tracker({'_pk_ref.1.d3f9': quote(json.dumps(info))})
+        self.assertEqual(info, json.loads(pt.get_attribution_info()))
+
+    def test_custom_variable_from_cookie(self):
+        cvar = {'1': ['cookie name', 'cookie value']}
+        pt = self.get_tracker({'_pk_cvar.1.d3f9': quote(json.dumps(cvar))})
+        self.assertEqual(['cookie name', 'cookie value'],
+                         pt.get_custom_variable(1))
+        self.assertFalse(pt.get_custom_variable(2))
+
+
 class TrackerVerifyDebugTestCase(TrackerBaseTestCase):
     """
     These tests make sure that the tracking info we send is recognized by
@@ -0,0 +1,88 @@
+import atexit
+from wsgiref.util import setup_testing_defaults
+
+from piwikapi.wsgi import PiwikMiddleware
+
+from base import PiwikAPITestCase
+from senders import ListSender
+from server import FakePiwikServer
+
+
+def app(environ, start_response):
+    start_response('200 OK', [
+        ('Content-Type', 'text/plain'),
+        ('X-Piwik-Title', 'Hello page'),
+    ])
+    return [b'Hello']
+
+
+class WSGIMiddlewareTestCase(PiwikAPITestCase):
+    """
+    PiwikMiddleware tests, without Piwik interaction
+    """
+    def setUp(self):
+        super(WSGIMiddlewareTestCase, self).setUp()
+        self.sender = ListSender()
+
+    def call(self, middleware, path='/', **environ):
+        environ['PATH_INFO'] = path
+        environ['HTTP_USER_AGENT'] = 'Test UA'
+        environ['REMOTE_ADDR'] = '192.0.2.1'
+        setup_testing_defaults(environ)
+        headers = []
+        body = middleware(environ,
+                          lambda status, h, exc_info=None: headers.extend(h))
+        data = b''.join(body)
+        tracked_before_close = len(self.sender.hits)
+        if hasattr(body, 'close'):
+            body.close()
+        return data, headers, tracked_before_close
+
+    def test_tracked_after_close(self):
+        mw = PiwikMiddleware(app, 1, 'http://example.com/piwik.php',
+                             token_auth='token', sender=self.sender)
+        data, headers, before = self.call(mw, '/page/', QUERY_STRING='a=1')
+        self.assertEqual(b'Hello', data)
+        self.assertEqual(0, before, "Tracked before the body was returned")
+        self.assertEqual(1, len(self.sender.hits))
+        hit = self.sender.hits[0]
+        self.assertTrue('action_name=Hello+page' in hit.query, hit.query)
+        self.assertTrue('cip=192.0.2.1' in hit.query, hit.query)
+        self.assertTrue('%2Fpage%2F%3Fa%3D1' in hit.query, hit.query)
+        self.assertEqual('Test UA', hit.headers['User-Agent'])
+        self.assertFalse('X-Piwik-Title' in dict(headers),
+                         "Title header not removed")
+
+    def test_include_exclude(self):
+        mw = PiwikMiddleware(app, 1, 'http://example.com/piwik.php',
+                             sender=self.sender, include=[r'^/app/'],
+                             exclude=[r'\.css$'])
+        self.call(mw, '/other/')
+        self.call(mw, '/app/style.css')
+        self.call(mw, '/app/page')
+        self.assertEqual(1, len(self.sender.hits))
+
+    def test_title_callback(self):
+        titles = {'/skip': None, '/page': 'Callback title'}
+        mw = PiwikMiddleware(app, 1, 'http://example.com/piwik.php',
+                             sender=self.sender,
+                             title_callback=lambda environ, status, headers:
+                                 titles[environ['PATH_INFO']])
+        self.call(mw, '/skip')
+        self.call(mw, '/page')
+        self.assertEqual(1, len(self.sender.hits))
+        self.assertTrue('Callback+title' in self.sender.hits[0].query)
+
+    def test_close_at_exit(self):
+        registered = []
+        register = atexit.register
+        atexit.register = registered.append
+        try:
+            with FakePiwikServer() as server:
+                mw = PiwikMiddleware(app, 1, server.url)
+                self.call(mw, '/page/')
+                self.assertEqual([mw.close], registered)
+                mw.close()
+        finally:
+            atexit.register = register
+        self.assertEqual(1, len(server.hits))
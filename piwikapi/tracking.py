@@ -7,26 +7,53 @@ License: BSD, see LICENSE for details
 Source and development at https://github.com/piwik/piwik-python-api
 """
 
+import copy
 import sys
 import datetime
 from hashlib import md5
 import logging
 import os
 import random
+import re
+import threading
+import time
+from collections import OrderedDict
 try:
     import json
 except ImportError:
     import simplejson as json
 try:
     from urllib.request import Request, urlopen
-    from urllib.parse import urlencode, urlparse, quote
+    from urllib.parse import urlencode, urlparse, quote, quote_plus, unquote
 except ImportError:
     from urllib2 import Request, urlopen
-    from urllib import urlencode, quote
+    from urllib import urlencode, quote, quote_plus, unquote
     from urlparse import urlparse
 
+from .bulk import TrackingHit
+from .dedup import get_digest
 from .exceptions import ConfigurationError
 from .exceptions import InvalidParameter
+from .profiling import profiler
+from .recording import strip_query
+from .sharding import get_ring
+from .sharding import is_connection_error
+
+_local = threading.local()
+
+
+def _get_random():
+    """
+    Return a random number generator for the current thread, so that
+    trackers in different threads don't share state
+
+    :rtype: random.Random
+    """
+    try:
+        return _local.random
+    except AttributeError:
+        _local.random = random.Random()
+        return _local.random
 
 
 class PiwikTracker(object):
@@ -52,42 +79,129 @@ class PiwikTracker(object):
         'silverlight': 'ag',
     }
 
+    #: Matches the names of Piwik's first party cookies
+    COOKIE_NAME_RE = re.compile(r'^_pk_(id|ref|cvar|ses)[._](\w+?)[._]')
+
+    #: Per-hit attributes that for_request() copies
+    HIT_STATE = (
+        'page_custom_var',
+        'visitor_custom_var',
+        'plugins',
+        'attribution_info',
+    )
+
+    #: Parameters that need the auth token, they are left out of the public
+    #: URLs of the get_url*() methods
+    TOKEN_PARAMETERS = ('token_auth', 'cip', 'cdt', 'country', 'region',
+                        'city', 'lat', 'long')
+
     UNSUPPORTED_WARNING = "%s: The code that's just running is untested and " \
         "probably doesn't work as expected anyway."
 
-    def __init__(self, id_site, request):
+    def __init__(self, id_site, request=None, meta=None, secure=False,
+                 cookies=None):
         """
+        The request data is either read from a Django-like request object or
+        passed directly through meta, secure and cookies.
+
         :param id_site: Site ID
         :type id_site: int
         :param request: Request
-        :type request: A Django-like request object
+        :type request: A Django-like request object or None
+        :param meta: Request headers and CGI variables, like Django's
+            request.META, used if no request is given
+        :type meta: dict or None
+        :param secure: If the request was made over HTTPS, used if no request
+            is given
+        :type secure: bool
+        :param cookies: Request cookies, used if no request is given
+        :type cookies: dict or None
+        :rtype: None
+        """
+        with profiler.stage('init'):
+            self.id_site = id_site
+            self.api_url = ''
+            self.ring = None
+            self.token_auth = False
+            self.cookie_support = True
+            self.debug_append_url = False
+            self.page_custom_var = {}
+            self.visitor_custom_var = {}
+            self.plugins = {}
+            self.attribution_info = {}
+            self.recorder = None
+            self.send_recorded = True
+            self.sender = None
+            self.page_view_deduplicator = None
+            self.bot_filter = None
+            self._init_request(request, meta, secure, cookies)
+
+    def _init_request(self, request, meta, secure, cookies):
+        """
+        Set the state that belongs to the tracked request
+
         :rtype: None
         """
-        random.seed()
         self.request = request
-        self.host = self.request.META.get('SERVER_NAME', '')
-        self.script = self.request.META.get('PATH_INFO', '')
-        self.query_string = self.request.META.get('QUERY_STRING', '')
-        self.id_site = id_site
-        self.api_url = ''
+        if request is not None:
+            meta = request.META
+            secure = request.is_secure()
+        self.meta = meta or {}
+        self.secure = secure
+        self.cookies = cookies
+        self.host = self.meta.get('SERVER_NAME', '')
+        self.script = self.meta.get('PATH_INFO', '')
+        self.query_string = self.meta.get('QUERY_STRING', '')
         self.request_cookie = ''
         self.ip = False
-        self.token_auth = False
         self.__set_request_parameters()
         self.forced_datetime = False
         self.set_local_time(self._get_timestamp())
         self.page_url = self.__get_current_url()
-        self.cookie_support = True
         self.has_cookies = False
         self.width = False
         self.height = False
-        self.visitor_id = self.get_random_visitor_id()
         self.forced_visitor_id = False
-        self.debug_append_url = False
-        self.page_custom_var = {}
-        self.visitor_custom_var = {}
-        self.plugins = {}
-        self.attribution_info = {}
+        self._cookie_index = None
+        self.visitor_id = False
+        if self.cookie_support:
+            self.visitor_id = self.__get_cookie_visitor_id()
+        if not self.visitor_id:
+            self.visitor_id = self.get_random_visitor_id()
+
+    def for_request(self, request=None, meta=None, secure=False,
+                    cookies=None):
+        """
+        Return a new tracker for a request that shares this tracker's
+        configuration
+
+        The API URL, auth token, site, sender and recorder are shared. The
+        custom variables, plugins, attribution info and ecommerce items of
+        this tracker are copied and act as defaults. Everything else is
+        reset, so a configured tracker can be shared between threads as long
+        as only the returned trackers are used for tracking::
+
+            tracker = PiwikTracker(1)
+            tracker.set_api_url('http://example.com/piwik.php')
+            # In every request
+            tracker.for_request(request).do_track_page_view('Title')
+
+        :param request: Request, see __init__()
+        :type request: A Django-like request object or None
+        :param meta: See __init__()
+        :type meta: dict or None
+        :param secure: See __init__()
+        :type secure: bool
+        :param cookies: See __init__()
+        :type cookies: dict or None
+        :rtype: PiwikTracker
+        """
+        with profiler.stage('init'):
+            tracker = copy.copy(self)
+            for name in self.HIT_STATE:
+                setattr(tracker, name, copy.copy(getattr(self, name)))
+            tracker._init_request(request, meta, secure, cookies)
+        return tracker
 
     def __set_request_parameters(self):
         """
@@ -95,11 +209,10 @@ class PiwikTracker(object):
 
         :rtype: None
         """
-        self.user_agent = self.request.META.get('HTTP_USER_AGENT', '')
-        self.referer = self.request.META.get('HTTP_REFERER', '')
-        #self.ip = self.request.META.get('REMOTE_ADDR')
-        self.accept_language = self.request.META.get('HTTP_ACCEPT_LANGUAGE',
-                                                     '')
+        self.user_agent = self.meta.get('HTTP_USER_AGENT', '')
+        self.referer = self.meta.get('HTTP_REFERER', '')
+        #self.ip = self.meta.get('REMOTE_ADDR')
+        self.accept_language = self.meta.get('HTTP_ACCEPT_LANGUAGE', '')
 
     def set_local_time(self, datetime):
         """
@@ -128,11 +241,44 @@ class PiwikTracker(object):
         """
         Set which Piwik API URL to use
 
-        :param api_url: API URL
-        :type api_url: str
+        Several tracking endpoints can be given as a list, as a dict of URLs
+        and weights or as a piwikapi.sharding.HashRing. Every visitor is
+        routed to one of them by its visitor ID. Pass the same HashRing to
+        all trackers to share the health state of the endpoints.
+
+        :param api_url: API URL(s)
+        :type api_url: str, list, dict or HashRing
         :rtype: None
         """
         self.api_url = api_url
+        self.ring = get_ring(api_url)
+
+    def set_recorder(self, recorder, send=True):
+        """
+        Record every tracking request, e.g. to a JSONL file
+
+        :param recorder: An object with a record(hit) method, e.g. a
+            piwikapi.recording.RequestRecorder, or None to stop recording
+        :type recorder: RequestRecorder or None
+        :param send: If False requests are only recorded and not sent
+        :type send: bool
+        :rtype: None
+        """
+        self.recorder = recorder
+        self.send_recorded = send
+
+    def set_sender(self, sender):
+        """
+        Hand tracking requests to a sender instead of making them inline,
+        e.g. a piwikapi.senders.BackgroundSender. The do_track_*() methods
+        then return an empty string.
+
+        :param sender: An object with a submit(hit) method, or None to send
+            requests inline again
+        :type sender: BackgroundSender or None
+        :rtype: None
+        """
+        self.sender = sender
 
     def set_ip(self, ip):
         """
@@ -201,6 +347,56 @@ class PiwikTracker(object):
                                    "length %s" % self.LENGTH_VISITOR_ID)
         self.forced_visitor_id = visitor_id
 
+    def set_session_key(self, session_key, cache):
+        """
+        Use a stable visitor ID for a client that doesn't send Piwik cookies
+
+        The visitor ID is looked up in the cache by the session key, e.g. an
+        API key or device ID. New sessions keep the current random visitor
+        ID. A visitor ID from the Piwik cookie takes precedence.
+
+        :param session_key: Identifies the client
+        :type session_key: str
+        :param cache: Visitor ID cache
+        :type cache: piwikapi.cache.VisitorIdCache
+        :rtype: None
+        """
+        if self.cookie_support and self.__get_cookie_visitor_id():
+            return
+        self.visitor_id = cache.get_visitor_id(session_key, self.visitor_id)
+
+    def set_page_view_deduplicator(self, deduplicator):
+        """
+        Skip page views that repeat one sent shortly before, e.g. reloads
+
+        :param deduplicator: Deduplicator, or None to send all page views
+        :type deduplicator: piwikapi.dedup.PageViewDeduplicator or None
+        :rtype: None
+        """
+        self.page_view_deduplicator = deduplicator
+
+    def set_bot_filter(self, bot_filter):
+        """
+        Don't track visitors whose user agent matches the filter
+
+        Hits of bots are dropped before the query is built, the do_track_*()
+        methods return an empty string for them.
+
+        :param bot_filter: Bot filter, or None to track all user agents
+        :type bot_filter: piwikapi.bots.BotFilter or None
+        :rtype: None
+        """
+        self.bot_filter = bot_filter
+
+    def _is_bot(self):
+        """
+        Return True if the hit should be dropped by the bot filter
+
+        :rtype: bool
+        """
+        return self.bot_filter is not None and \
+            self.bot_filter.is_bot(self.user_agent)
+
     def set_debug_string_append(self, string):
         """
         :param string: str to append
@@ -322,8 +518,7 @@ class PiwikTracker(object):
 
         :rtype: str
         """
-        # django-specific
-        if self.request.is_secure():
+        if self.secure:
             scheme = 'https'
         else:
             scheme = 'http'
@@ -376,50 +571,56 @@ class PiwikTracker(object):
             r = datetime.datetime.now()
         return r
 
-    def _get_request(self, id_site):
+    def _get_request(self, id_site, rand=True):
         """
         This oddly named method returns the query var string.
 
         :param id_site: Site ID
         :type id_site: int
+        :param rand: Include the random cache buster
+        :type rand: bool
         :rtype: str
         """
-        query_vars = {
-            'idsite': id_site,
-            'rec': 1,
-            'apiv': self.VERSION,
-            'rand': random.randint(0, 99999),
-            'url': self.page_url,
-            'urlref': self.referer,
-            'id': self.visitor_id,
-        }
-        if self.ip:
-            query_vars['cip'] = self.ip
-        if self.token_auth:
-            query_vars['token_auth'] = self.token_auth
-        if self.has_cookies:
-            query_vars['cookie'] = 1
-        if self.width and self.height:
-            query_vars['res'] = '%dx%d' % (self.width, self.height)
-        if self.forced_visitor_id:
-            query_vars['cid'] = self.forced_visitor_id
-        if self.page_custom_var:
-            query_vars['cvar'] = json.dumps(self.page_custom_var)
-        if self.visitor_custom_var:
-            query_vars['_cvar'] = json.dumps(self.visitor_custom_var)
-        if len(self.plugins):
-            for plugin, version in self.plugins.items():
-                query_vars[plugin] = version
-        if len(self.attribution_info):
-            for i, var in {
-                0: '_rcn',
-                1: '_rck',
-                2: '_refts',
-                3: '_ref',
-            }.items():
-                query_vars[var] = quote(self.attribution_info[i])
-
-        url = urlencode(query_vars)
+        with profiler.stage('build'):
+            query_vars = {
+                'idsite': id_site,
+                'rec': 1,
+                'apiv': self.VERSION,
+                'url': self.page_url,
+                'urlref': self.referer,
+                'id': self.visitor_id,
+                '_id': self.visitor_id,
+            }
+            if rand:
+                query_vars['rand'] = _get_random().randint(0, 99999)
+            if self.ip:
+                query_vars['cip'] = self.ip
+            if self.token_auth:
+                query_vars['token_auth'] = self.token_auth
+            if self.has_cookies:
+                query_vars['cookie'] = 1
+            if self.width and self.height:
+                query_vars['res'] = '%dx%d' % (self.width, self.height)
+            if self.forced_visitor_id:
+                query_vars['cid'] = self.forced_visitor_id
+            if len(self.plugins):
+                for plugin, version in self.plugins.items():
+                    query_vars[plugin] = version
+            if len(self.attribution_info):
+                for i, var in {
+                    0: '_rcn',
+                    1: '_rck',
+                    2: '_refts',
+                    3: '_ref',
+                }.items():
+                    query_vars[var] = quote(self.attribution_info[i])
+
+        with profiler.stage('encode'):
+            if self.page_custom_var:
+                query_vars['cvar'] = json.dumps(self.page_custom_var)
+            if self.visitor_custom_var:
+                query_vars['_cvar'] = json.dumps(self.visitor_custom_var)
+            url = urlencode(query_vars)
         if self.debug_append_url:
             url += self.debug_append_url
         return url
@@ -449,30 +650,116 @@ class PiwikTracker(object):
         url += "&%s" % urlencode({action_type: action_url})
         return url
 
-    def __get_cookie_matching_name(self, name):
+    def get_url_track_page_view(self, document_title=''):
         """
-        **NOT SUPPORTED**
+        Return the full piwik.php URL that tracks a page view, without making
+        a request. The URL can be used as an image beacon.
 
-        Get a cookie's value by name
+        :param document_title: The title of the page the user is on
+        :type document_title: str
+        :raises: ConfigurationError if the API URL was not set
+        :rtype: str
+        """
+        return self._get_public_url(
+            self.__get_url_track_page_view(document_title))
 
-        :param name: Cookie name
-        :type name: str
+    def get_urls_track_page_view(self, document_titles):
+        """
+        Return a piwik.php page view URL for each title
+
+        The query is only built once, each URL gets its own random cache
+        buster.
+
+        :param document_titles: Page titles
+        :type document_titles: iterable of str
+        :raises: ConfigurationError if the API URL was not set
+        :rtype: list of str
+        """
+        base = self._get_public_url(self._get_request(self.id_site,
+                                                      rand=False))
+        randint = _get_random().randint
+        urls = []
+        for document_title in document_titles:
+            args = {'rand': randint(0, 99999)}
+            if document_title:
+                args['action_name'] = document_title
+            urls.append('%s&%s' % (base, urlencode(args)))
+        return urls
+
+    def get_url_track_action(self, action_url, action_type):
+        """
+        Return the full piwik.php URL that tracks a download or outlink,
+        without making a request
+
+        :param action_url: URL of the download or outlink
+        :type action_url: str
+        :param action_type: Type of the action, either 'download' or 'link'
+        :type action_type: str
+        :raises: InvalidParameter if action type is unknown
+        :raises: ConfigurationError if the API URL was not set
         :rtype: str
         """
-        logging.warn(self.UNSUPPORTED_WARNING % '__get_cookie_matching_name()')
-        cookie_value = False
-        if self.request.COOKIES:
-            for name in self.request.COOKIES:
-                #print 'cookie name', name
-                #print 'cookie is', cookie_value
-                cookie_value = self.request.COOKIES[name]
-        #print self.request.COOKIES
-        return cookie_value
+        if action_type not in ('download', 'link'):
+            raise InvalidParameter("Illegal action parameter %s" % action_type)
+        return self._get_public_url(self.__get_url_track_action(action_url,
+                                                                action_type))
 
-    def get_visitor_id(self):
+    def __get_cookie_index(self):
         """
-        **PARTIAL, no cookie support**
+        Return the Piwik first party cookies of the request, indexed by their
+        name without the ``_pk_`` prefix and the hash, e.g. ``id.1.``
+
+        The index is only built once per request. PHP replaces dots in cookie
+        names with underscores, both forms are accepted.
 
+        :rtype: dict
+        """
+        if self._cookie_index is None:
+            index = {}
+            cookies = self._get_cookies()
+            if cookies:
+                for name, value in cookies.items():
+                    match = self.COOKIE_NAME_RE.match(name)
+                    if match:
+                        index['%s.%s.' % match.groups()] = value
+            self._cookie_index = index
+        return self._cookie_index
+
+    def __get_cookie_matching_name(self, name):
+        """
+        Get a Piwik cookie's value by name
+
+        :param name: Cookie name without prefix and hash, e.g. ``id.1.``
+        :type name: str
+        :rtype: str or False
+        """
+        return self.__get_cookie_index().get(name, False)
+
+    def _get_cookies(self):
+        """
+        Return the request cookies
+
+        :rtype: dict or None
+        """
+        if self.request is not None:
+            return getattr(self.request, 'COOKIES', None)
+        return self.cookies
+
+    def __get_cookie_visitor_id(self):
+        """
+        Return the visitor ID from the first party cookie
+
+        :rtype: str or False
+        """
+        id_cookie = self.__get_cookie_matching_name('id.%s.' % self.id_site)
+        if id_cookie:
+            visitor_id = id_cookie.split('.', 1)[0]
+            if len(visitor_id) == self.LENGTH_VISITOR_ID:
+                return visitor_id
+        return False
+
+    def get_visitor_id(self):
+        """
         If the user initiating the request has the Piwik first party cookie,
         this function will try and return the ID parsed from this first party
         cookie.
@@ -490,26 +777,11 @@ class PiwikTracker(object):
         if self.forced_visitor_id:
             visitor_id = self.forced_visitor_id
         else:
-            logging.warn(self.UNSUPPORTED_WARNING % 'get_visitor_id()')
-            id_cookie_name = 'id.%s.' % self.id_site
-            id_cookie = self.__get_cookie_matching_name(id_cookie_name)
-            visitor_id = self.visitor_id
-            if id_cookie:
-                #print 'id_cookie is', id_cookie
-                visitor_id = id_cookie
-                #$visitorId = substr($idCookie, 0, strpos($idCookie, '.'));
-                #if(strlen($visitorId) == self::LENGTH_VISITOR_ID)
-                #{
-                #    return $visitorId;
+            visitor_id = self.__get_cookie_visitor_id() or self.visitor_id
         return visitor_id
 
     def get_attribution_info(self):
         """
-        **NOT SUPPORTED**
-
-        To support this we'd need to parse the cookies in the request obejct.
-        Not sure if this makes sense...
-
         Return the currently assigned attribution info stored in a first party
         cookie.
 
@@ -517,11 +789,13 @@ class PiwikTracker(object):
         and his cookies can be read by this API.
 
         :rtype: string, JSON encoded string containing the referer info for
-            goal conversion attribution
+            goal conversion attribution, or False
         """
-        logging.warn(self.UNSUPPORTED_WARNING % 'get_attribution_info()')
-        attribution_cookie_name = 'ref.%d.' % self.id_site
-        return self.__get_cookie_matching_name(attribution_cookie_name)
+        attribution_cookie_name = 'ref.%s.' % self.id_site
+        cookie = self.__get_cookie_matching_name(attribution_cookie_name)
+        if cookie:
+            cookie = unquote(cookie)
+        return cookie
 
     def __get_random_string(self, length=500):
         """
@@ -558,12 +832,27 @@ class PiwikTracker(object):
         """
         Track a page view, return the request body
 
+        If a page view deduplicator was set and the same page view was sent
+        within its window nothing is sent and an empty string is returned.
+
         :param document_title: The title of the page the user is on
         :type document_title: str
         :rtype: str
         """
+        if self._is_bot():
+            return ''
+        if self.page_view_deduplicator is not None:
+            digest = get_digest(self.id_site, self.get_visitor_id(),
+                                self.page_url, document_title)
+            if self.page_view_deduplicator.is_duplicate(digest):
+                return ''
         url = self.__get_url_track_page_view(document_title)
-        return self._send_request(url)
+        try:
+            return self._send_request(url)
+        except Exception:
+            if self.page_view_deduplicator is not None:
+                self.page_view_deduplicator.forget(digest)
+            raise
 
     def do_track_action(self, action_url, action_type):
         """
@@ -578,34 +867,122 @@ class PiwikTracker(object):
         """
         if action_type not in ('download', 'link'):
             raise InvalidParameter("Illegal action parameter %s" % action_type)
+        if self._is_bot():
+            return ''
         url = self.__get_url_track_action(action_url, action_type)
         return self._send_request(url)
 
-    def _send_request(self, url):
+    def _get_request_headers(self):
         """
-        Make the tracking API request, return the request body
+        Return the HTTP headers for the tracking API request
 
-        :param url: TODO
+        :rtype: dict
+        """
+        headers = {
+            'User-Agent': self.user_agent,
+            'Accept-Language': self.accept_language,
+        }
+        if not self.cookie_support:
+            self.request_cookie = ''
+        elif self.request_cookie != '':
+            headers['Cookie'] = self.request_cookie
+        return headers
+
+    def _get_hit(self, url):
+        """
+        Return the tracking request as a TrackingHit
+
+        :param url: Query string
+        :type url: str
+        :rtype: TrackingHit
+        """
+        return TrackingHit(url, self._get_request_headers(), time.time(),
+                           self.forced_visitor_id or self.visitor_id)
+
+    def _get_api_url(self):
+        """
+        Return the API URL, or the endpoint of the visitor if several were
+        set
+
+        :rtype: str
+        """
+        if self.ring is None:
+            return self.api_url
+        return self.ring.get_node(self.forced_visitor_id or self.visitor_id)
+
+    def _get_url(self, url):
+        """
+        Return the full tracking API URL for a query string
+
+        :param url: Query string
         :type url: str
         :raises: ConfigurationError if the API URL was not set
         :rtype: str
         """
         if not self.api_url:
             raise ConfigurationError('API URL not set')
-        parsed = urlparse(self.api_url)
-        url = "%s://%s%s?%s" % (parsed.scheme, parsed.netloc, parsed.path, url)
-        request = Request(url)
-        request.add_header('User-Agent', self.user_agent)
-        request.add_header('Accept-Language', self.accept_language)
-        if not self.cookie_support:
-            self.request_cookie = ''
-        elif self.request_cookie != '':
-            #print 'Adding cookie', self.request_cookie
-            request.add_header('Cookie', self.request_cookie)
+        parsed = urlparse(self._get_api_url())
+        return "%s://%s%s?%s" % (parsed.scheme, parsed.netloc, parsed.path,
+                                 url)
+
+    def _get_public_url(self, url):
+        """
+        Return the full tracking API URL for a query string without the auth
+        token and the parameters that need it, so that it can be embedded in
+        a page
 
-        response = urlopen(request)
+        :param url: Query string
+        :type url: str
+        :raises: ConfigurationError if the API URL was not set
+        :rtype: str
+        """
+        return self._get_url(strip_query(url, self.TOKEN_PARAMETERS))
+
+    def _urlopen(self, url):
+        """
+        Make the tracking API request
+
+        :param url: Query string
+        :type url: str
+        :rtype: response
+        """
+        request = Request(self._get_url(url))
+        for header, value in self._get_request_headers().items():
+            request.add_header(header, value)
+        return urlopen(request)
+
+    def _send_request(self, url):
+        """
+        Make the tracking API request, return the request body
+
+        If a recorder was set the request is recorded as well. If a sender
+        was set the request is handed to it. An empty string is returned
+        when the request was not made inline.
+
+        :param url: Query string
+        :type url: str
+        :raises: ConfigurationError if the API URL was not set
+        :rtype: str
+        """
+        if self.recorder is not None:
+            self.recorder.record(self._get_hit(url))
+            if not self.send_recorded:
+                return ''
+        if self.sender is not None:
+            self.sender.submit(self._get_hit(url))
+            return ''
+        with profiler.stage('send'):
+            try:
+                response = self._urlopen(url)
+            except Exception as e:
+                if self.ring is None or not is_connection_error(e):
+                    raise
+                # Retry once on the endpoint that takes over
+                self.ring.mark_down(self._get_api_url())
+                response = self._urlopen(url)
         #print response.info()
-        body = response.read()
+        with profiler.stage('read'):
+            body = response.read()
         # The cookie in the response will be set in the next request
         #for header, value in response.getheaders():
         #    # TODO handle cookies
@@ -669,15 +1046,14 @@ class PiwikTracker(object):
 
     def get_custom_variable(self, id, scope='visit'):
         """
-        **PARTIAL, no cookie support**
-
-        Returns the current custom variable stored in a first party cookie.
+        Returns the custom variable set for this request or, for the visit
+        scope, the one stored in the first party cookie.
 
         :param id: Custom variable slot ID, 1-5
         :type id: int
         :param scope: Variable scope, either visit or page
         :type scope: str
-        :rtype: mixed stuff TODO
+        :rtype: tuple or list of (name, value), or False
         """
         if type(id) != type(int()):
             raise InvalidParameter("Parameter id must be int, not %s" %
@@ -685,29 +1061,26 @@ class PiwikTracker(object):
         if scope == 'page':
             r = self.page_custom_var[id]
         elif scope == 'visit':
-            if self.visitor_custom_var[id]:
+            if self.visitor_custom_var.get(id):
                 r = self.visitor_custom_var[id]
             else:
-                logging.warn(self.UNSUPPORTED_WARNING %
-                             'get_custom_variable()')
-                # TODO test this code...
-                custom_vars_cookie = 'cvar.%d.' % self.id_site
+                custom_vars_cookie = 'cvar.%s.' % self.id_site
                 cookie = self.__get_cookie_matching_name(custom_vars_cookie)
                 if not cookie:
                     r = False
                 else:
-                    cookie_decoded = json.loads(cookie)
-                    #$cookieDecoded = json_decode($cookie, $assoc = true);
-                    #print 'decoded cookie json', cookie_decode
-                    #print 'decoded cookie json', repr(cookie_decode)
-                    if type(cookie_decoded) == type(list()):
+                    try:
+                        cookie_decoded = json.loads(unquote(cookie))
+                    except ValueError:
+                        cookie_decoded = None
+                    if type(cookie_decoded) != type(dict()):
                         r = False
-                    elif id not in cookie_decoded:
+                    elif str(id) not in cookie_decoded:
                         r = False
-                    elif len(cookie_decoded[id]) != 2:
+                    elif len(cookie_decoded[str(id)]) != 2:
                         r = False
                     else:
-                        r = cookie_decoded[id]
+                        r = cookie_decoded[str(id)]
         else:
             raise InvalidParameter("Invalid scope parameter value %s" % scope)
         return r
@@ -717,9 +1090,30 @@ class PiwikTrackerEcommerce(PiwikTracker):
     """
     The Piwik tracker class for ecommerce
     """
-    def __init__(self, id_site, request):
-        self.ecommerce_items = {}
-        super(PiwikTrackerEcommerce, self).__init__(id_site, request)
+    HIT_STATE = PiwikTracker.HIT_STATE + ('ecommerce_items', )
+
+    #: Compact JSON encoder for the ecommerce items
+    ITEM_ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+    #: Fields of an ecommerce item, in the order Piwik expects them
+    ITEM_FIELDS = ('sku', 'name', 'category', 'price', 'quantity')
+
+    def __init__(self, id_site, request=None, **kwargs):
+        # Keyed by SKU, items are sent in the order they were added
+        self.ecommerce_items = OrderedDict()
+        self.cart_deduplicator = None
+        super(PiwikTrackerEcommerce, self).__init__(id_site, request,
+                                                    **kwargs)
+
+    def set_cart_deduplicator(self, deduplicator):
+        """
+        Skip cart updates that don't change the visitor's cart
+
+        :param deduplicator: Deduplicator, or None to send all cart updates
+        :type deduplicator: piwikapi.dedup.CartDeduplicator or None
+        :rtype: None
+        """
+        self.cart_deduplicator = deduplicator
 
     def __get_url_track_ecommerce_order(self, order_id, grand_total,
                                       sub_total=False, tax=False,
@@ -772,7 +1166,8 @@ class PiwikTrackerEcommerce(PiwikTracker):
         return url
 
     def __get_url_track_ecommerce(self, grand_total, sub_total=False,
-                                  tax=False, shipping=False, discount=False):
+                                  tax=False, shipping=False, discount=False,
+                                  encoded_items=None):
         """
         Returns the URL used to track ecommerce orders
 
@@ -791,6 +1186,8 @@ class PiwikTrackerEcommerce(PiwikTracker):
         :type shipping: float or None
         :param discount: Discount for this order
         :type discount: float or None
+        :param encoded_items: The already encoded ecommerce items
+        :type encoded_items: str or None
         :rtype: str
         """
         # FIXME fix what?
@@ -807,15 +1204,36 @@ class PiwikTrackerEcommerce(PiwikTracker):
             args['ec_sh'] = shipping
         if discount:
             args['ec_dt'] = discount
-        if len(self.ecommerce_items):
-            # Remove the SKU index in the list before JSON encoding
-            items = list(self.ecommerce_items.values())
-            args['ec_items'] = json.dumps(items)
-        self.ecommerce_items.clear()
-        url += '&%s' % urlencode(args)
+        with profiler.stage('encode'):
+            url += '&%s' % urlencode(args)
+            if encoded_items is None and len(self.ecommerce_items):
+                encoded_items = ''.join(self.__iter_ecommerce_items_encoded())
+            if encoded_items:
+                url += '&ec_items=%s' % encoded_items
+            self.ecommerce_items.clear()
         return url
 
-    def __get_url_track_ecommerce_cart_update(self, grand_total):
+    def __iter_ecommerce_items_encoded(self):
+        """
+        Yield the URL encoded JSON list of the ecommerce items in chunks,
+        one per item, so that no copy of the items or of the complete JSON
+        string is needed
+
+        :rtype: generator of str
+        """
+        dumps = self.ITEM_ENCODER.encode
+        yield '%5B'
+        first = True
+        for item in self.ecommerce_items.values():
+            if first:
+                first = False
+            else:
+                yield '%2C'
+            yield quote_plus(dumps(item))
+        yield '%5D'
+
+    def __get_url_track_ecommerce_cart_update(self, grand_total,
+                                              encoded_items=None):
         """
         Returns the URL to track a cart update
 
@@ -823,11 +1241,57 @@ class PiwikTrackerEcommerce(PiwikTracker):
         :param grand_total: Grand total revenue of the transaction,
             including taxes, shipping, etc.
         :type grand_total: float
+        :param encoded_items: The already encoded ecommerce items
+        :type encoded_items: str or None
         :rtype: str
         """
-        url = self.__get_url_track_ecommerce(grand_total)
+        url = self.__get_url_track_ecommerce(grand_total,
+                                             encoded_items=encoded_items)
         return url
 
+    def get_url_track_goal(self, id_goal, revenue=False):
+        """
+        Return the full piwik.php URL that records a goal conversion, without
+        making a request
+
+        :param id_goal: Goal ID
+        :type id_goal: int
+        :param revenue: Revenue for this conversion
+        :type revenue: int
+        :raises: ConfigurationError if the API URL was not set
+        :rtype: str
+        """
+        return self._get_public_url(self.__get_url_track_goal(id_goal,
+                                                              revenue))
+
+    def get_url_track_ecommerce_order(self, order_id, grand_total,
+                                      sub_total=False, tax=False,
+                                      shipping=False, discount=False):
+        """
+        Return the full piwik.php URL that tracks an ecommerce order, without
+        making a request
+
+        Like do_track_ecommerce_order() this clears the ecommerce items.
+
+        :param order_id: Unique order ID
+        :type order_id: str
+        :param grand_total: Grand total revenue of the transaction,
+            including taxes, shipping, etc.
+        :type grand_total: float
+        :param sub_total: Sub total amount
+        :type sub_total: float or None
+        :param tax: Tax amount for this order
+        :type tax: float or None
+        :param shipping: Shipping amount for this order
+        :type shipping: float or None
+        :param discount: Discount for this order
+        :type discount: float or None
+        :raises: ConfigurationError if the API URL was not set
+        :rtype: str
+        """
+        return self._get_public_url(self.__get_url_track_ecommerce_order(
+            order_id, grand_total, sub_total, tax, shipping, discount))
+
     def add_ecommerce_item(self, sku, name=False, category=False, price=False,
                            quantity=1):
         """
@@ -860,6 +1324,34 @@ class PiwikTrackerEcommerce(PiwikTracker):
             quantity,
         )
 
+    def add_ecommerce_items(self, items):
+        """
+        Add many items to the ecommerce order at once, see
+        add_ecommerce_item()
+
+        Each item is either a (sku, name, category, price, quantity) tuple
+        or list, trailing fields may be left out, or a dict with these keys.
+        Items with the same SKU replace each other.
+
+        :param items: Items
+        :type items: iterable of tuple, list or dict
+        :rtype: None
+        """
+        defaults = (False, False, False, False, 1)
+        fields = self.ITEM_FIELDS
+
+        def normalize(item):
+            if isinstance(item, dict):
+                item = tuple(item.get(field, default)
+                             for field, default in zip(fields, defaults))
+            elif len(item) < 5:
+                item = tuple(item) + defaults[len(item):]
+            else:
+                item = tuple(item)
+            return item[0], item
+
+        self.ecommerce_items.update(normalize(item) for item in items)
+
     def do_track_ecommerce_cart_update(self, grand_total):
         """
         Track a cart update (add/remove/update item)
@@ -868,15 +1360,37 @@ class PiwikTrackerEcommerce(PiwikTracker):
         in the cart, including items which were in the previous cart. Items
         get deleted until they are re-submitted.
 
+        If a cart deduplicator was set and the cart didn't change since the
+        last update of this visitor nothing is sent and an empty string is
+        returned.
+
         :type grand_total: float
         :param grand_total: Grand total revenue of the transaction,
             including taxes, shipping, etc.
         :type grand_total: float
         :rtype: str
         """
-        # FIXME
-        url = self.__get_url_track_ecommerce_cart_update(grand_total)
-        return self._send_request(url)
+        if self._is_bot():
+            self.ecommerce_items.clear()
+            return ''
+        encoded_items = None
+        if self.cart_deduplicator is not None:
+            if self.ecommerce_items:
+                encoded_items = ''.join(
+                    self.__iter_ecommerce_items_encoded())
+            key = '%s:%s' % (self.id_site, self.get_visitor_id())
+            digest = get_digest(grand_total, encoded_items or '')
+            if self.cart_deduplicator.is_duplicate(key, digest):
+                self.ecommerce_items.clear()
+                return ''
+        url = self.__get_url_track_ecommerce_cart_update(grand_total,
+                                                         encoded_items)
+        try:
+            return self._send_request(url)
+        except Exception:
+            if self.cart_deduplicator is not None:
+                self.cart_deduplicator.forget(key, digest)
+            raise
 
     def do_track_ecommerce_order(self, order_id, grand_total, sub_total=False,
                                   tax=False, shipping=False, discount=False):
@@ -905,6 +1419,9 @@ class PiwikTrackerEcommerce(PiwikTracker):
         :type discount: float or None
         :rtype: str
         """
+        if self._is_bot():
+            self.ecommerce_items.clear()
+            return ''
         url = self.__get_url_track_ecommerce_order(order_id, grand_total,
                                                    sub_total, tax, shipping,
                                                    discount)
@@ -920,6 +1437,8 @@ class PiwikTrackerEcommerce(PiwikTracker):
         :type revenue: int (TODO why int here and not float!?)
         :rtype: str
         """
+        if self._is_bot():
+            return ''
         url = self.__get_url_track_goal(id_goal, revenue)
         return self._send_request(url)
 
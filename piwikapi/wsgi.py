@@ -0,0 +1,250 @@
+"""
+Copyright (c) 2012-2013, Nicolas Kuttler.
+All rights reserved.
+
+License: BSD, see LICENSE for details
+
+Source and development at https://github.com/piwik/piwik-python-api
+"""
+
+import atexit
+import logging
+import re
+try:
+    from http.cookies import SimpleCookie
+except ImportError:
+    from Cookie import SimpleCookie
+
+from .senders import BackgroundSender
+from .tracking import PiwikTracker
+
+
+class WSGIRequest(object):
+    """
+    Exposes a WSGI environ the way PiwikTracker expects a Django request
+    """
+    def __init__(self, environ):
+        """
+        :param environ: WSGI environ
+        :type environ: dict
+        :rtype: None
+        """
+        self.META = environ
+        self.environ = environ
+        self._cookies = None
+
+    @property
+    def COOKIES(self):
+        if self._cookies is None:
+            cookie = SimpleCookie()
+            try:
+                cookie.load(self.environ.get('HTTP_COOKIE', ''))
+            except Exception:
+                pass
+            self._cookies = dict((k, v.value) for k, v in cookie.items())
+        return self._cookies
+
+    def is_secure(self):
+        """
+        :rtype: bool
+        """
+        return self.environ.get('wsgi.url_scheme') == 'https'
+
+
+class _ClosingIterator(object):
+    """
+    Wraps the application's response and calls a callback once the server
+    has closed it, i.e. after the whole body was sent
+    """
+    def __init__(self, app_iter, callback):
+        self.app_iter = app_iter
+        self.callback = callback
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            self.callback()
+
+
+class PiwikMiddleware(object):
+    """
+    WSGI middleware that tracks a page view for every request
+
+    The hit is built and handed to a background sender once the response
+    body was returned, so tracking doesn't add latency to the request::
+
+        from piwikapi.wsgi import PiwikMiddleware
+
+        application = PiwikMiddleware(application, 1,
+                                      'http://example.com/piwik.php',
+                                      token_auth='YOUR_AUTH_TOKEN',
+                                      exclude=[r'^/static/'])
+
+    The document title is read from the ``X-Piwik-Title`` response header,
+    which is removed from the response, or returned by ``title_callback``.
+
+    The hits queued by the default sender are sent at interpreter exit. Call
+    close() yourself if you passed a sender, or the process ends without
+    running exit handlers.
+    """
+    #: Response header that contains the document title
+    TITLE_HEADER = 'X-Piwik-Title'
+
+    #: Sender used if none is passed
+    sender_class = BackgroundSender
+
+    #: Send the remaining hits of a sender_class instance at exit
+    close_at_exit = True
+
+    def __init__(self, app, id_site, api_url, token_auth=False, sender=None,
+                 include=None, exclude=None, title_header=TITLE_HEADER,
+                 title_callback=None):
+        """
+        :param app: The WSGI application
+        :type app: callable
+        :param id_site: Site ID
+        :type id_site: int
+        :param api_url: Piwik tracking API URL
+        :type api_url: str
+        :param token_auth: Auth token, required to track the visitor's IP
+        :type token_auth: str or False
+        :param sender: Sender for the hits, defaults to a sender_class
+            instance
+        :type sender: BackgroundSender or None
+        :param include: Only track paths matching one of these regexes
+        :type include: list of str or None
+        :param exclude: Don't track paths matching one of these regexes
+        :type exclude: list of str or None
+        :param title_header: Response header with the document title
+        :type title_header: str
+        :param title_callback: Called as ``title_callback(environ, status,
+            headers)``, returns the document title or None to skip tracking
+        :type title_callback: callable or None
+        :rtype: None
+        """
+        self.app = app
+        self.id_site = id_site
+        self.api_url = api_url
+        self.token_auth = token_auth
+        if sender is None:
+            sender = self.sender_class(api_url, token_auth)
+            if self.close_at_exit:
+                atexit.register(self.close)
+        self.sender = sender
+        self.include = self._compile(include)
+        self.exclude = self._compile(exclude)
+        self.title_header = title_header.lower()
+        self.title_callback = title_callback
+
+    def close(self):
+        """
+        Send the queued hits
+
+        :rtype: None
+        """
+        self.sender.close()
+
+    def _compile(self, patterns):
+        if not patterns:
+            return None
+        return re.compile('|'.join('(?:%s)' % p for p in patterns))
+
+    def should_track(self, path):
+        """
+        Check the path against the include and exclude rules
+
+        :param path: Request path
+        :type path: str
+        :rtype: bool
+        """
+        if self.include is not None and not self.include.search(path):
+            return False
+        if self.exclude is not None and self.exclude.search(path):
+            return False
+        return True
+
+    def __call__(self, environ, start_response):
+        if not self.should_track(environ.get('PATH_INFO', '')):
+            return self.app(environ, start_response)
+        response = {}
+
+        def _start_response(status, headers, exc_info=None):
+            title = None
+            filtered = []
+            for header, value in headers:
+                if header.lower() == self.title_header:
+                    title = value
+                else:
+                    filtered.append((header, value))
+            response['status'] = status
+            response['headers'] = filtered
+            response['title'] = title
+            if exc_info is None:
+                return start_response(status, filtered)
+            return start_response(status, filtered, exc_info)
+
+        def _track():
+            if 'status' not in response:
+                return
+            try:
+                self.track(environ, response['status'], response['headers'],
+                           response['title'])
+            except Exception:
+                logging.exception("Piwik tracking failed")
+
+        app_iter = self.app(environ, _start_response)
+        return _ClosingIterator(app_iter, _track)
+
+    def get_tracker(self, environ):
+        """
+        Return a PiwikTracker for the request
+
+        :param environ: WSGI environ
+        :type environ: dict
+        :rtype: PiwikTracker
+        """
+        tracker = PiwikTracker(self.id_site, WSGIRequest(environ))
+        self.configure_tracker(tracker, environ.get('REMOTE_ADDR'))
+        return tracker
+
+    def configure_tracker(self, tracker, remote_addr):
+        """
+        Set the sender, auth token and visitor IP of a tracker
+
+        :param tracker: Tracker
+        :type tracker: PiwikTracker
+        :param remote_addr: The visitor's IP
+        :type remote_addr: str or None
+        :rtype: None
+        """
+        tracker.set_sender(self.sender)
+        if self.token_auth:
+            tracker.set_token_auth(self.token_auth)
+            if remote_addr:
+                tracker.set_ip(remote_addr)
+
+    def track(self, environ, status, headers, title=None):
+        """
+        Hand the page view to the sender
+
+        :param environ: WSGI environ
+        :type environ: dict
+        :param status: Response status line
+        :type status: str
+        :param headers: Response headers
+        :type headers: list of tuples
+        :param title: Title from the response header
+        :type title: str or None
+        :rtype: None
+        """
+        if self.title_callback is not None:
+            title = self.title_callback(environ, status, headers)
+            if title is None:
+                return
+        tracker = self.get_tracker(environ)
+        tracker.do_track_page_view(title or '')
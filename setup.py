@@ -6,6 +6,7 @@ setup(
     version = "0.3",
     packages = (
         'piwikapi',
+        'piwikapi.django',
         'piwikapi.plugins',
         'piwikapi.tests',
     ),
@@ -35,5 +36,6 @@ setup(
     ],
     extras_require = {
         'Python 2.5':  ["simplejson", ],
+        'numpy':  ["numpy", ],
     }
 )